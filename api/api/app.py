@@ -1,19 +1,25 @@
 from flask_cors import CORS
 from flask import Flask
-from config import DevelopmentDatabaseConfig as Dev
+from config import get_config
 from routes import (
     project_routes, 
     transcript_route, 
     thumbnail_route, 
     merge_route, 
-    audio_master_route)
+    audio_master_route,
+    job_routes,
+    metrics_route)
 from db import db
+from models.migrations import migrate
+from utils import metrics
 
 app = Flask(__name__)
 CORS(app)
-app.config.from_object(Dev)
+app.config.from_object(get_config())
 
 db.init_app(app)
+with app.app_context():
+    migrate()
 
 # Register all route blueprints
 app.register_blueprint(project_routes.bp)
@@ -21,6 +27,10 @@ app.register_blueprint(thumbnail_route.bp)
 app.register_blueprint(transcript_route.bp)
 app.register_blueprint(merge_route.bp)
 app.register_blueprint(audio_master_route.bp)
+app.register_blueprint(job_routes.bp)
+app.register_blueprint(metrics_route.bp)
 
 if __name__ == "__main__":
+    # The development server, in production the app is served by gunicorn (see gunicorn.conf.py)
+    metrics.clear_metrics_dir()
     app.run()
@@ -0,0 +1,11 @@
+"""
+Benchmarks for the media pipeline, run on synthetic podcasts made with ffmpeg.
+
+    python -m benchmarks --durations 10,10m --participants 2 --resolutions 640x360 \
+        --output results.json --baseline baseline.json
+
+Every stage is run in a fresh process, and its wall time, CPU time (including
+ffmpeg) and peak memory are written to the results as JSON. With --baseline the
+results are compared to an earlier run and the exit code is 1 if a stage got slower
+or bigger by more than --tolerance. See python -m benchmarks --help for the rest.
+"""
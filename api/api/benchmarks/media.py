@@ -0,0 +1,85 @@
+import os
+import sys
+import subprocess
+
+SAMPLE_RATE = 44_100
+FRAMERATE = 30
+# Each participant talks for this long before the next one takes over
+TURN_SECONDS = 7
+COLOURS = ["red", "green", "blue", "yellow", "gray"]
+
+
+def case_name(case: dict) -> str:
+    """
+    Returns a short name for a benchmark case, e.g. "600s-2p-1280x720".
+    """
+    return f"{case['seconds']:g}s-{case['participants']}p-{case['width']}x{case['height']}"
+
+
+def _run_ffmpeg(arguments: list) -> None:
+    subprocess.run(['ffmpeg', '-y', '-loglevel', 'error'] + arguments, check=True)
+
+
+def generate_audio(path: str, seconds: float, participant: int = None, participants: int = 1) -> None:
+    """
+    Generates a noise recording standing in for a microphone.
+    Participants take turns to talk, and are nearly silent while the others talk.
+
+    :param path: where the wav file is written.
+    :param seconds: how long the recording is.
+    :param participant: which participant this microphone belongs to, from 0.
+                        None for the wide shot, which hears everyone quietly.
+    :param participants: how many participants take turns.
+    """
+    if participant is None:
+        volume = "0.2"
+    else:
+        talking = f"eq(mod(floor(t/{TURN_SECONDS}),{participants}),{participant})"
+        volume = f"'if({talking},1,0.005)':eval=frame"
+    _run_ffmpeg(['-f', 'lavfi', '-i', f'anoisesrc=d={seconds}:r={SAMPLE_RATE}:a=0.5',
+                 '-af', f'volume={volume}', '-c:a', 'pcm_s16le', path])
+
+
+def generate_video(path: str, seconds: float, width: int, height: int,
+                   colour: str = "gray", audio_path: str = None) -> None:
+    """
+    Generates a single colour H.264 video standing in for a camera.
+    :param audio_path: a recording to mux in, for inputs that need sound.
+    """
+    arguments = ['-f', 'lavfi', '-i', f'color=c={colour}:s={width}x{height}:r={FRAMERATE}:d={seconds}']
+    if audio_path:
+        arguments += ['-i', audio_path, '-c:a', 'aac']
+    _run_ffmpeg(arguments + ['-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p',
+                             '-g', str(FRAMERATE * 2), '-t', str(seconds), path])
+
+
+def generate_case(case: dict, media_dir: str) -> dict:
+    """
+    Generates the inputs of a benchmark case, reusing any generated by an earlier run.
+
+    :param case: dict with seconds, participants, width and height.
+    :param media_dir: folder the inputs are kept in.
+    :returns media: dict with "audio" and "video" dicts of shot to file, as the
+                    merge uses them, and "podcast", a merged video with sound.
+    """
+    folder = os.path.join(media_dir, case_name(case))
+    os.makedirs(folder, exist_ok=True)
+    seconds, participants = case["seconds"], case["participants"]
+
+    audio, video = {}, {}
+    shots = [(f"speaker{i + 1}", i) for i in range(participants)] + [("wide", None)]
+    for shot, participant in shots:
+        audio[shot] = os.path.join(folder, f"{shot}.wav")
+        video[shot] = os.path.join(folder, f"{shot}.mp4")
+        if not os.path.exists(audio[shot]):
+            generate_audio(audio[shot], seconds, participant, participants)
+        if not os.path.exists(video[shot]):
+            colour = COLOURS[participant if participant is not None else -1]
+            generate_video(video[shot], seconds, case["width"], case["height"], colour)
+
+    podcast = os.path.join(folder, "podcast.mp4")
+    if not os.path.exists(podcast):
+        generate_video(podcast, seconds, case["width"], case["height"],
+                       audio_path=audio["speaker1"])
+    print(f"Generated inputs for {case_name(case)} in {folder}", file=sys.stderr)
+    return {"audio": audio, "video": video, "podcast": podcast}
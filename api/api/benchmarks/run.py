@@ -0,0 +1,181 @@
+import os
+import sys
+import json
+import time
+import platform
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.media import case_name, generate_case
+from benchmarks.stages import STAGES, run_stage
+
+# Metrics compared against the baseline, with the smallest change that counts
+# as a regression, so tiny inputs don't fail on noise
+COMPARED_METRICS = {
+    "wall_seconds": 0.1,
+    "cpu_seconds": 0.1,
+    "peak_rss_mb": 10.0,
+    "peak_child_rss_mb": 10.0,
+}
+
+
+def parse_duration(text: str) -> float:
+    """
+    Reads a duration like "10", "10s", "5m" or "2h" as seconds.
+    """
+    units = {"s": 1, "m": 60, "h": 3600}
+    text = text.strip().lower()
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+
+def parse_resolution(text: str) -> tuple:
+    """
+    Reads a resolution like "1280x720" as (width, height).
+    """
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def build_cases(durations, participants, resolutions) -> list:
+    """
+    Returns every combination of the given durations, participant counts and resolutions.
+    """
+    return [{"seconds": seconds, "participants": count, "width": width, "height": height}
+            for seconds, count, (width, height)
+            in itertools.product(durations, participants, resolutions)]
+
+
+def run_benchmarks(cases, stages, media_dir: str, work_dir: str) -> dict:
+    """
+    Runs every stage on every case, each in a fresh process.
+
+    :param cases: list of cases made by build_cases.
+    :param stages: names of the stages to run, see stages.STAGES.
+    :param media_dir: folder the generated inputs are kept in, between runs too.
+    :param work_dir: folder the stages write their outputs in.
+    :returns results: the environment the benchmarks ran in and a result per stage and case.
+                      A stage that fails has {"error": ...} instead of its metrics,
+                      and the other stages still run.
+    """
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for case in cases:
+        media = generate_case(case, media_dir)
+        for stage in stages:
+            try:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    metrics = executor.submit(run_stage, stage, media, work_dir).result()
+            except Exception as e:
+                metrics = {"error": f"{type(e).__name__}: {e}"}
+            if "wall_seconds" in metrics:
+                metrics["realtime_factor"] = round(case["seconds"] / max(metrics["wall_seconds"], 1e-9), 2)
+            results.append({"stage": stage, "case": case_name(case), **case, **metrics})
+            print(f"{stage} on {case_name(case)}: {metrics}", file=sys.stderr)
+
+    return {
+        "created_at": time.time(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.2) -> list:
+    """
+    Finds the stages that got worse since the baseline.
+
+    :param results: returned by run_benchmarks.
+    :param baseline: an earlier result of run_benchmarks.
+    :param tolerance: how much worse a metric may get, 0.2 allows 20%.
+    :returns regressions: list of dicts naming the stage, case and metric that got worse.
+    """
+    baseline_results = {(result["stage"], result["case"]): result for result in baseline["results"]}
+    regressions = []
+    for result in results["results"]:
+        previous = baseline_results.get((result["stage"], result["case"]))
+        if previous is None:
+            continue
+        for metric, min_change in COMPARED_METRICS.items():
+            if metric not in result or metric not in previous:
+                continue
+            change = result[metric] - previous[metric]
+            if change > min_change and result[metric] > previous[metric] * (1 + tolerance):
+                regressions.append({
+                    "stage": result["stage"],
+                    "case": result["case"],
+                    "metric": metric,
+                    "baseline": previous[metric],
+                    "current": result[metric],
+                })
+    return regressions
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks", description="Benchmarks the media pipeline.")
+    parser.add_argument("--durations", default="10,60",
+                        help="comma separated podcast lengths, e.g. 10,10m,2h")
+    parser.add_argument("--participants", default="2",
+                        help="comma separated participant counts, from 1 to 4")
+    parser.add_argument("--resolutions", default="640x360",
+                        help="comma separated camera resolutions, e.g. 640x360,1920x1080")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help="comma separated stages to run")
+    parser.add_argument("--media-dir", default=os.path.join("benchmark_media"),
+                        help="folder generated inputs are kept in between runs")
+    parser.add_argument("--output", default="benchmark_results.json",
+                        help="where the results are written")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="how much worse a metric may get before it is a regression")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="write the results to --baseline instead of comparing")
+    args = parser.parse_args(argv)
+
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    participants = [int(count) for count in args.participants.split(",")]
+    if any(count < 1 or count > 4 for count in participants):
+        parser.error("participants must be from 1 to 4")
+    cases = build_cases([parse_duration(duration) for duration in args.durations.split(",")],
+                        participants,
+                        [parse_resolution(resolution) for resolution in args.resolutions.split(",")])
+
+    # The pipeline modules create their MinIO clients on import, the benchmarks never use them
+    for name, value in (("MINIO_ENDPOINT", "http://127.0.0.1:9000"),
+                        ("ACCESS_KEY", "benchmark"), ("SECRET_KEY", "benchmark")):
+        os.environ.setdefault(name, value)
+
+    work_dir = os.path.abspath(os.path.join(args.media_dir, "work"))
+    results = run_benchmarks(cases, stages, os.path.abspath(args.media_dir), work_dir)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Wrote results to {args.output}", file=sys.stderr)
+    failed = [result for result in results["results"] if "error" in result]
+    for result in failed:
+        print(f"{result['stage']} failed on {result['case']}: {result['error']}", file=sys.stderr)
+
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Updated baseline {args.baseline}", file=sys.stderr)
+    elif args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"Regression in {regression['stage']} on {regression['case']}: "
+                  f"{regression['metric']} {regression['baseline']} -> {regression['current']}",
+                  file=sys.stderr)
+        if regressions:
+            return 1
+    return 1 if failed else 0
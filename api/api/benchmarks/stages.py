@@ -0,0 +1,156 @@
+import os
+import re
+import time
+import resource
+
+from utils.workspace import Workspace
+
+# Every how often a section is cut out of the podcast in the export benchmark
+EXPORT_CUT_EVERY_SECONDS = 30
+EXPORT_CUT_SECONDS = 3
+
+
+def _transitions(media):
+    """
+    The shots the merge renders, the same way mediaSelector.main chooses them.
+    """
+    from utils.mediaSelector import choose_highest_sounds
+    from utils.edl import EditDecisionList
+    transitions = choose_highest_sounds(media["audio"])
+    return EditDecisionList.from_transitions(transitions).merge_runs()
+
+
+def choose_highest_sounds_stage(media, workspace):
+    from utils.mediaSelector import choose_highest_sounds
+    return lambda: choose_highest_sounds(media["audio"]), None
+
+
+def process_video_segments_stage(media, workspace):
+    from utils.mediaSelector import process_video_segments
+    from utils.edl import get_min_shot_seconds
+    edl = _transitions(media).absorb_short(get_min_shot_seconds())
+    output = workspace.path("video.mp4")
+    return lambda: process_video_segments(media["video"], edl, output, {}), output
+
+
+def align_and_merge_audio_stage(media, workspace):
+    from utils.mediaSelector import align_and_merge_audio
+    edl = _transitions(media)
+    output = workspace.path("audio.wav")
+    return lambda: align_and_merge_audio(media["audio"], edl, output, {}), output
+
+
+def auto_master_stage(media, workspace):
+    from utils.audio_master import auto_master
+    output = workspace.path("mastered.wav")
+    return lambda: auto_master(media["audio"]["speaker1"], output), output
+
+
+def export_stage(media, workspace):
+    """
+    The rendering part of createFinalPodcast, which is the part that scales with
+    the podcast. The rest only moves files to and from MinIO.
+    """
+    from utils.probe import probe_media
+    from utils.exportPodcast import render_export, trim_to_keep
+    duration = probe_media(media["podcast"])["duration"]
+    trim_sections = [(start, start + EXPORT_CUT_SECONDS, 0) for start in
+                     range(EXPORT_CUT_EVERY_SECONDS, int(duration), EXPORT_CUT_EVERY_SECONDS)]
+    kept_sections = trim_to_keep(trim_sections)
+    output = workspace.path("export.mp4")
+    return lambda: render_export(media["podcast"], kept_sections, output, workspace), output
+
+
+def transcribe_stage(media, workspace):
+    from utils.pcm_stream import decode_pcm
+    from utils.transcribe import transcribe_audio
+    from utils.model_registry import registry, WHISPER_SAMPLE_RATE
+    # Load the model first, so the benchmark times transcribing rather than loading
+    registry.get()
+    audio = decode_pcm(media["podcast"], WHISPER_SAMPLE_RATE)
+    return lambda: transcribe_audio(audio), None
+
+
+# Each stage is set up by a function returning the function to measure and the file
+# it writes (None if it doesn't), so a run that produced nothing isn't timed as a success
+STAGES = {
+    "choose_highest_sounds": choose_highest_sounds_stage,
+    "process_video_segments": process_video_segments_stage,
+    "align_and_merge_audio": align_and_merge_audio_stage,
+    "auto_master": auto_master_stage,
+    "export": export_stage,
+    "transcribe": transcribe_stage,
+}
+
+
+def _reset_peak_rss() -> None:
+    # Linux only, writing 5 to clear_refs resets the peak memory of this process
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_kb() -> int:
+    try:
+        with open("/proc/self/status") as file:
+            return int(re.search(r"VmHWM:\s+(\d+)", file.read()).group(1))
+    except (OSError, AttributeError):
+        # ru_maxrss is in KB on Linux, but can't be reset
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(func, output: str = None) -> dict:
+    """
+    Runs a function and measures it.
+    :param output: a file func must write, checked once it has run.
+    :returns metrics: wall and CPU seconds, counting the CPU time of ffmpeg and
+                      any other child processes, the peak memory in MB of this
+                      process while func ran, and of its largest child process.
+                      Linux carries a process's peak memory over to the processes
+                      it starts, so the child peak is never below this process's size.
+    :raises RuntimeError: if output is missing or empty after func ran.
+    """
+    _reset_peak_rss()
+    self_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start_time = time.perf_counter()
+    func()
+    wall_seconds = time.perf_counter() - start_time
+    self_after = resource.getrusage(resource.RUSAGE_SELF)
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    if output is not None and (not os.path.exists(output) or os.path.getsize(output) == 0):
+        raise RuntimeError(f"{os.path.basename(output)} wasn't written, the stage failed")
+
+    cpu_seconds = sum(getattr(after, field) - getattr(before, field)
+                      for before, after in ((self_before, self_after),
+                                            (children_before, children_after))
+                      for field in ("ru_utime", "ru_stime"))
+    return {
+        "wall_seconds": round(wall_seconds, 4),
+        "cpu_seconds": round(cpu_seconds, 4),
+        "peak_rss_mb": round(_peak_rss_kb() / 1024, 1),
+        "peak_child_rss_mb": round(children_after.ru_maxrss / 1024, 1),
+    }
+
+
+def run_stage(name: str, media: dict, work_dir: str) -> dict:
+    """
+    Sets up and measures one stage. Meant to be run in a fresh process, so the
+    peak memory belongs to this stage alone.
+
+    :param name: one of STAGES.
+    :param media: the inputs made by media.generate_case.
+    :param work_dir: folder the stage's workspace is created in.
+    :returns metrics: see measure, or {"skipped": reason} if the stage can't run here.
+    """
+    workspace = Workspace(f"benchmark-{name}", work_dir)
+    try:
+        try:
+            func, output = STAGES[name](media, workspace)
+        except ImportError as e:
+            return {"skipped": f"missing dependency: {e.name}"}
+        return measure(func, output)
+    finally:
+        workspace.clean()
@@ -0,0 +1,82 @@
+import pytest
+
+from benchmarks.media import generate_case
+from benchmarks.run import build_cases, compare, parse_duration, parse_resolution, run_benchmarks
+from benchmarks.stages import run_stage, measure
+
+
+def result(stage, wall_seconds, peak_rss_mb):
+    return {"stage": stage, "case": "10s-2p-640x360",
+            "wall_seconds": wall_seconds, "peak_rss_mb": peak_rss_mb}
+
+
+def test_cases_from_the_command_line():
+    """
+    GIVEN durations, participant counts and resolutions as typed on the command line
+    WHEN they are turned into cases
+    THEN check every combination is benchmarked
+    """
+    cases = build_cases([parse_duration("10"), parse_duration("2h")], [1, 4],
+                        [parse_resolution("1920x1080")])
+
+    assert len(cases) == 4
+    assert cases[-1] == {"seconds": 7200.0, "participants": 4, "width": 1920, "height": 1080}
+
+
+def test_only_real_regressions_are_reported():
+    """
+    GIVEN a baseline and new results, one slower, one with a tiny absolute change
+    WHEN they are compared
+    THEN check only the stage that got meaningfully slower is reported
+    """
+    baseline = {"results": [result("auto_master", 10.0, 100.0), result("export", 0.01, 100.0)]}
+    results = {"results": [result("auto_master", 15.0, 105.0), result("export", 0.05, 100.0)]}
+
+    regressions = compare(results, baseline, tolerance=0.2)
+
+    assert [(r["stage"], r["metric"]) for r in regressions] == [("auto_master", "wall_seconds")]
+
+
+def test_stage_is_measured(tmp_path, monkeypatch):
+    """
+    GIVEN a short synthetic podcast
+    WHEN a stage is benchmarked on it
+    THEN check its time and memory are recorded
+    """
+    for name in ("MINIO_ENDPOINT", "ACCESS_KEY", "SECRET_KEY"):
+        monkeypatch.setenv(name, "http://127.0.0.1:9000")
+    case = {"seconds": 3, "participants": 2, "width": 160, "height": 90}
+    media = generate_case(case, str(tmp_path))
+
+    metrics = run_stage("choose_highest_sounds", media, str(tmp_path))
+
+    assert metrics["wall_seconds"] > 0
+    assert metrics["peak_rss_mb"] > 0
+    assert set(media["audio"]) == {"speaker1", "speaker2", "wide"}
+
+
+def test_stage_without_output_fails(tmp_path):
+    """
+    GIVEN a stage that returns without writing its output, as a swallowed ffmpeg error would
+    WHEN it is measured
+    THEN check it fails rather than being timed as a success
+    """
+    with pytest.raises(RuntimeError):
+        measure(lambda: None, str(tmp_path / "video.mp4"))
+
+
+def test_failed_stage_is_recorded(tmp_path, monkeypatch):
+    """
+    GIVEN a one participant case, and a stage that fails
+    WHEN both are benchmarked
+    THEN check the render of the single speaker is measured and the failure is recorded
+    """
+    for name in ("MINIO_ENDPOINT", "ACCESS_KEY", "SECRET_KEY"):
+        monkeypatch.setenv(name, "http://127.0.0.1:9000")
+    case = {"seconds": 3, "participants": 1, "width": 160, "height": 90}
+
+    results = run_benchmarks([case], ["process_video_segments", "missing"],
+                             str(tmp_path), str(tmp_path / "work"))["results"]
+
+    assert results[0]["wall_seconds"] > 0
+    assert results[1]["error"].startswith("KeyError")
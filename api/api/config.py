@@ -1,3 +1,6 @@
+import os
+
+
 class DatabaseConfig:
     """
     Database configuration
@@ -17,3 +20,53 @@ class DevelopmentDatabaseConfig(DatabaseConfig):
     PORT = '5432'
     DATABASE = 'mydatabase'
     SQLALCHEMY_DATABASE_URI = f'postgresql://{USERNAME}:{PASSWORD}@{HOST}:{PORT}/{DATABASE}'
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    return os.environ.get(name, str(default)).lower() in ("1", "true", "yes")
+
+
+def get_engine_options() -> dict:
+    """
+    Returns the SQLAlchemy connection pool settings, each can be set with an environment variable:
+        - DB_POOL_SIZE: connections each worker process keeps open
+        - DB_MAX_OVERFLOW: extra connections a worker may open when the pool is busy
+        - DB_POOL_TIMEOUT: seconds to wait for a free connection before giving up
+        - DB_POOL_RECYCLE: seconds after which a connection is replaced, so idle ones aren't dropped by the server
+        - DB_POOL_PRE_PING: check a connection still works before handing it out
+    Each gunicorn worker has its own pool, so the database sees up to
+    workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+    """
+    return {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": _env_flag("DB_POOL_PRE_PING", True),
+    }
+
+
+class ProductionConfig(DatabaseConfig):
+    """
+    Configuration for production use, served by gunicorn (see gunicorn.conf.py).
+    The database and its connection pool are set with environment variables.
+    """
+
+    USERNAME = os.environ.get('DB_USER', DevelopmentDatabaseConfig.USERNAME)
+    PASSWORD = os.environ.get('DB_PASSWORD', DevelopmentDatabaseConfig.PASSWORD)
+    HOST = os.environ.get('DB_HOST', DevelopmentDatabaseConfig.HOST)
+    PORT = os.environ.get('DB_PORT', DevelopmentDatabaseConfig.PORT)
+    DATABASE = os.environ.get('DB_NAME', DevelopmentDatabaseConfig.DATABASE)
+    SQLALCHEMY_DATABASE_URI = f'postgresql://{USERNAME}:{PASSWORD}@{HOST}:{PORT}/{DATABASE}'
+    SQLALCHEMY_ENGINE_OPTIONS = get_engine_options()
+
+
+def get_config():
+    """
+    Returns the configuration to run with, set with API_CONFIG to "development" (default) or "production".
+    """
+    configs = {"development": DevelopmentDatabaseConfig, "production": ProductionConfig}
+    name = os.environ.get("API_CONFIG", "development")
+    if name not in configs:
+        raise ValueError(f"Unknown API_CONFIG {name}, use one of {', '.join(configs)}")
+    return configs[name]
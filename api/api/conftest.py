@@ -0,0 +1,12 @@
+import os
+
+
+def pytest_configure():
+    """
+    Sets up environmental variables for pytest running.
+    Kept at the root of the API, so they are set before any test module is
+    imported, including the routes whose modules create MinIO clients.
+    """
+    os.environ.setdefault('ACCESS_KEY', 'minio_user')
+    os.environ.setdefault('SECRET_KEY', 'minio_password')
+    os.environ.setdefault('MINIO_ENDPOINT', 'http://127.0.0.1:9000')
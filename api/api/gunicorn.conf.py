@@ -0,0 +1,51 @@
+"""
+gunicorn settings for serving the API in production:
+
+    gunicorn --config gunicorn.conf.py app:app
+
+Each setting can be changed with an environment variable:
+    - API_BIND: address to listen on
+    - API_WORKERS: worker processes, each with its own database pool and job pool.
+                   MAX_CONCURRENT_JOBS is the limit for all of them together, each
+                   worker's pool runs MAX_CONCURRENT_JOBS // API_WORKERS jobs (at least 1)
+    - API_THREADS: threads per worker, so metadata requests and transcript streams
+                   are served while other requests wait on the database or MinIO
+    - API_TIMEOUT: seconds a request may run before its worker is restarted
+    - PROMETHEUS_MULTIPROC_DIR: folder the metrics of every process are shared
+                                through, WORKSPACE_ROOT/metrics by default
+"""
+import os
+
+from utils.workspace import get_workspace_root
+
+# Set here, in the master, so every worker has it before anything imports prometheus_client
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(get_workspace_root(), "metrics"))
+
+bind = os.environ.get("API_BIND", "127.0.0.1:5000")
+workers = int(os.environ.get("API_WORKERS", 2))
+# The workers read this to share out MAX_CONCURRENT_JOBS, see jobs.get_jobs_per_worker
+os.environ["API_WORKERS"] = str(workers)
+threads = int(os.environ.get("API_THREADS", 8))
+worker_class = "gthread"
+timeout = int(os.environ.get("API_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+
+# Media jobs run in a process pool owned by each worker, so the app must not
+# be loaded before forking: a pool created in the master can't be shared.
+preload_app = False
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    # Drop the metrics left by the last run, before any worker records new ones
+    from utils import metrics
+    metrics.clear_metrics_dir()
+
+
+def child_exit(server, worker):
+    # Gauges of a worker that has exited must no longer be reported
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,62 @@
+import sys
+
+from sqlalchemy import text
+
+from db import db
+from utils.pagination import parse_size
+
+# Changes made to the projects table since db/init.sql first shipped. Postgres
+# only runs init.sql on an empty volume, so existing deployments are brought up
+# to date with these at startup. Each one does nothing if it has already been made.
+MIGRATIONS = [
+    "ALTER TABLE projects ADD COLUMN IF NOT EXISTS project_size_bytes BIGINT NOT NULL DEFAULT 0",
+    "ALTER TABLE projects ADD COLUMN IF NOT EXISTS version_id INTEGER NOT NULL DEFAULT 1",
+    "CREATE INDEX IF NOT EXISTS projects_last_edited_idx "
+    "ON projects (last_edited DESC, project_id DESC)",
+    "CREATE INDEX IF NOT EXISTS projects_created_at_idx "
+    "ON projects (created_at DESC, project_id DESC)",
+]
+
+# Every worker migrates at startup, this advisory lock makes them take turns
+MIGRATION_LOCK_KEY = 4_120_018
+
+
+def backfill_size_bytes(connection) -> int:
+    """
+    Fills in project_size_bytes for projects made before it existed, from their
+    display size. Projects whose size can't be read are left at 0.
+    :param connection: an open database connection, in a transaction.
+    :returns updated: how many projects were filled in.
+    """
+    rows = connection.execute(text(
+        "SELECT project_id, project_size FROM projects "
+        "WHERE project_size_bytes = 0 AND project_size IS NOT NULL")).all()
+    updated = 0
+    for project_id, size in rows:
+        size_bytes = parse_size(size)
+        if size_bytes > 0:
+            connection.execute(
+                text("UPDATE projects SET project_size_bytes = :size_bytes "
+                     "WHERE project_id = :project_id"),
+                {"size_bytes": size_bytes, "project_id": project_id})
+            updated += 1
+    return updated
+
+
+def migrate() -> None:
+    """
+    Brings the database up to date with the Project model, see MIGRATIONS.
+    Only Postgres databases are migrated, others (like the in memory ones the
+    tests use) are made from the model with db.create_all().
+    Must be called inside an app context.
+    """
+    if db.engine.dialect.name != "postgresql":
+        return
+    with db.engine.begin() as connection:
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"),
+                           {"key": MIGRATION_LOCK_KEY})
+        for statement in MIGRATIONS:
+            connection.execute(text(statement))
+        updated = backfill_size_bytes(connection)
+    if updated:
+        print(f"Filled in the size in bytes of {updated} projects", file=sys.stderr)
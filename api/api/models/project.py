@@ -1,3 +1,8 @@
+from datetime import datetime
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import load_only
+
 from db import db
 
 
@@ -7,16 +12,39 @@ class Project(db.Model):
     """
 
     __tablename__ = 'projects'
+    # Keep in step with the indexes in db/init.sql and models/migrations.py,
+    # they back the keyset pagination in page()
+    __table_args__ = (
+        db.Index('projects_last_edited_idx', db.desc('last_edited'), db.desc('project_id')),
+        db.Index('projects_created_at_idx', db.desc('created_at'), db.desc('project_id')),
+    )
 
     project_id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.String(1000), nullable=True)
     created_at = db.Column(db.DateTime, nullable=False,
                            server_default=db.func.now())
-    last_edited = db.Column(db.DateTime, nullable=True,
+    last_edited = db.Column(db.DateTime, nullable=False,
                             server_default=db.func.now())
     project_size = db.Column(
         db.String(10), nullable=False, server_default="0B")
+    project_size_bytes = db.Column(
+        db.BigInteger, nullable=False, server_default="0")
+    # Bumped on every update (see _bump_version), used in the ETag of the project
+    version_id = db.Column(db.Integer, nullable=False, server_default="1")
+
+    # Columns projects can be listed in order of
+    SORT_COLUMNS = ("last_edited", "created_at")
+    # Column behind each field of to_json, used to only load the requested fields
+    JSON_FIELDS = {
+        "project_id": "project_id",
+        "name": "name",
+        "description": "description",
+        "created_at": "created_at",
+        "last_edited": "last_edited",
+        "size": "project_size",
+        "size_bytes": "project_size_bytes",
+    }
 
     def __repr__(self):
         project_id = f"project_id={self.project_id}"
@@ -33,5 +61,76 @@ class Project(db.Model):
             "description": self.description,
             "created_at": self.created_at,
             "last_edited": self.last_edited,
-            "size": self.project_size
+            "size": self.project_size,
+            "size_bytes": self.project_size_bytes
         }
+
+    def etag(self) -> str:
+        """
+        Returns an ETag that changes whenever the project is edited.
+        """
+        last_edited = self.last_edited.timestamp() if self.last_edited else 0
+        return f"{self.project_id}-{self.version_id}-{last_edited:.6f}"
+
+    @classmethod
+    def listing_etag(cls) -> str:
+        """
+        Returns an ETag that changes whenever a project is created, edited or deleted.
+        Row versions only go up, so their sum changes on every edit.
+        """
+        count, last_id, versions = db.session.query(
+            db.func.count(cls.project_id), db.func.max(cls.project_id),
+            db.func.sum(cls.version_id)).one()
+        return f"{count}-{last_id or 0}-{versions or 0}"
+
+    @classmethod
+    def page(cls, order: str = "last_edited", cursor: list = None, limit: int = 50, fields=None):
+        """
+        Fetches one page of projects, newest first, by keyset pagination: the page
+        starts after the (order, project_id) of the last row of the previous one,
+        so every page is a single index range scan however deep it is.
+
+        :param order: the column to order by, one of SORT_COLUMNS.
+        :param cursor: the (order, project_id) values of the last row of the previous page.
+        :param limit: how many projects to fetch.
+        :param fields: the to_json fields to return, all of them if not given.
+        :returns projects, next_cursor: the projects as JSON, and the cursor of
+                                        the next page or None on the last page.
+        :raises ValueError: if order, cursor or fields are not valid.
+        """
+        if order not in cls.SORT_COLUMNS:
+            raise ValueError(f"Can't order projects by {order}")
+        fields = list(cls.JSON_FIELDS) if not fields else list(fields)
+        unknown = set(fields) - set(cls.JSON_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+
+        sort_column = getattr(cls, order)
+        columns = {cls.JSON_FIELDS[field] for field in fields} | {order, "project_id"}
+        query = cls.query.options(load_only(*(getattr(cls, column) for column in columns)))
+        if cursor is not None:
+            if len(cursor) != 2:
+                raise ValueError("Invalid cursor")
+            last_value, last_id = datetime.fromisoformat(cursor[0]), int(cursor[1])
+            query = query.filter(tuple_(sort_column, cls.project_id) < tuple_(last_value, last_id))
+
+        # Fetch one extra row to know if there is another page
+        rows = query.order_by(sort_column.desc(), cls.project_id.desc()).limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = [getattr(rows[-1], order), rows[-1].project_id]
+
+        projects = [{field: getattr(row, cls.JSON_FIELDS[field]) for field in fields}
+                    for row in rows]
+        return projects, next_cursor
+
+
+@db.event.listens_for(Project, "before_update")
+def _bump_version(mapper, connection, project):
+    """
+    Increments version_id in the UPDATE itself rather than with SQLAlchemy's
+    optimistic locking, so overlapping edits of a project both go through
+    instead of one failing with StaleDataError.
+    """
+    project.version_id = Project.version_id + 1
@@ -1,4 +1,30 @@
+from datetime import datetime
+
+import pytest
+from flask import Flask
+
+from db import db
 from models.project import Project
+from models.migrations import backfill_size_bytes
+from utils.pagination import encode_cursor, decode_cursor
+
+
+@pytest.fixture
+def app():
+    """
+    Gives an app backed by an in memory database, with 5 projects edited a day apart.
+    """
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        for day in range(1, 6):
+            db.session.add(Project(name=f"Project {day}", project_size="1.00KB",
+                                   project_size_bytes=1000,
+                                   last_edited=datetime(2024, 1, day)))
+        db.session.commit()
+        yield app
 
 
 def test_new_project():
@@ -32,7 +58,73 @@ def test_project_json_conversion():
         "description": "This is a test project",
         "created_at": project.created_at,
         "last_edited": project.last_edited,
-        "size": "10MB"
+        "size": "10MB",
+        "size_bytes": None
     }
 
     assert project.to_json() == expected_json
+
+
+def test_keyset_pages_cover_every_project_once(app):
+    """
+    GIVEN projects in the database
+    WHEN they are listed two at a time, following the cursor of each page
+    THEN check every project is listed once, most recently edited first
+    """
+    names, token = [], None
+    while True:
+        projects, cursor = Project.page(cursor=token and decode_cursor(token),
+                                        limit=2, fields=["name"])
+        names += [project["name"] for project in projects]
+        if cursor is None:
+            break
+        token = encode_cursor(cursor)
+
+    assert names == [f"Project {day}" for day in range(5, 0, -1)]
+    assert list(projects[0]) == ["name"]
+
+
+def test_unknown_fields_are_rejected(app):
+    """
+    GIVEN a project listing
+    WHEN a field that doesn't exist is asked for
+    THEN check a ValueError is raised
+    """
+    with pytest.raises(ValueError):
+        Project.page(fields=["password"])
+
+
+def test_overlapping_edits_both_go_through(app):
+    """
+    GIVEN a project loaded in a session
+    WHEN it is edited elsewhere before the session's own edit is committed
+    THEN check both edits go through and each bumps the version
+    """
+    project = Project.query.filter_by(name="Project 1").one()
+    version = project.version_id
+    Project.query.filter_by(project_id=project.project_id).update(
+        {"version_id": Project.version_id + 1}, synchronize_session=False)
+
+    project.last_edited = datetime(2024, 2, 1)
+    db.session.commit()
+
+    assert Project.query.get(project.project_id).version_id == version + 2
+
+
+def test_sizes_are_backfilled_from_display_sizes(app):
+    """
+    GIVEN projects made before the size was stored in bytes
+    WHEN the sizes are backfilled
+    THEN check readable sizes are converted and the rest are left at 0
+    """
+    db.session.add(Project(name="Unreadable", project_size="big", project_size_bytes=0))
+    Project.query.update({"project_size_bytes": 0})
+    db.session.commit()
+
+    with db.engine.begin() as connection:
+        updated = backfill_size_bytes(connection)
+
+    sizes = {project.name: project.project_size_bytes for project in Project.query.all()}
+    assert updated == 5
+    assert sizes["Project 1"] == 1000
+    assert sizes["Unreadable"] == 0
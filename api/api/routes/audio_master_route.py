@@ -1,6 +1,7 @@
 import json
-from flask import Blueprint, request, jsonify
-from utils import audio_master
+from flask import Blueprint, request
+from utils import audio_master, jobs
+from routes.job_routes import job_accepted
 
 bp = Blueprint('audio_master_route', __name__)
 
@@ -8,9 +9,11 @@ bp = Blueprint('audio_master_route', __name__)
 @bp.route("/audio-master", methods=["POST"])
 def merge_files():
     """
-    Applies audio mastering to the provided podcast file.
+    Queues a job that applies audio mastering to the provided podcast file.
+    Poll the returned status_url for the result.
     """
     data_str = request.data.decode('utf-8')
     data = json.loads(data_str)
-    response = audio_master.main(data["bucket"])
-    return jsonify(response)
+    job = jobs.submit_cached_job(
+        "audio-master", audio_master.cached_result, audio_master.main, data["bucket"])
+    return job_accepted(job)
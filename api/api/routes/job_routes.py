@@ -0,0 +1,70 @@
+import json
+import time
+from flask import Blueprint, Response, jsonify, stream_with_context, url_for
+
+from utils import jobs
+
+bp = Blueprint('job_routes', __name__)
+
+EVENTS_POLL_SECONDS = 0.5
+# Comment lines sent while nothing changes, so proxies don't close an idle stream
+EVENTS_KEEPALIVE_SECONDS = 15
+
+
+def job_accepted(job, **links):
+    """
+    Builds the response returned when a job has been queued.
+    Jobs answered from the result cache are already finished, and return 200.
+    :param job: the job record returned by jobs.submit_job.
+    :param links: any other urls to include, e.g. stream_url.
+    """
+    response = dict(job, **links)
+    response["status_url"] = url_for(
+        'job_routes.get_job_status', job_id=job["job_id"], _external=True)
+    response["events_url"] = url_for(
+        'job_routes.job_events', job_id=job["job_id"], _external=True)
+    return jsonify(response), 200 if job["status"] == "finished" else 202
+
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """
+    Reports the status, progress and result of a job.
+    While ffmpeg is running, its percent, speed and eta_seconds are under "ffmpeg".
+    :param job_id: the id returned when the job was submitted.
+    """
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job), 200
+
+
+@bp.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    Streams the job record as server-sent events, sending it again every time
+    it changes, so a client can follow ffmpeg's progress with an EventSource
+    instead of polling. The stream ends once the job has finished or failed.
+    :param job_id: the id returned when the job was submitted.
+    """
+    if jobs.get_job(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def generate():
+        updated_at, sent_at = None, time.monotonic()
+        while True:
+            job = jobs.get_job(job_id)
+            if job is None:
+                return
+            if job["updated_at"] != updated_at:
+                updated_at, sent_at = job["updated_at"], time.monotonic()
+                yield f"data: {json.dumps(job)}\n\n"
+            elif time.monotonic() - sent_at >= EVENTS_KEEPALIVE_SECONDS:
+                sent_at = time.monotonic()
+                yield ": keepalive\n\n"
+            if job["status"] in ("finished", "failed"):
+                return
+            time.sleep(EVENTS_POLL_SECONDS)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
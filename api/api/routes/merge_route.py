@@ -1,6 +1,7 @@
 import json
-from flask import Blueprint, request, jsonify
-from utils import mediaSelector
+from flask import Blueprint, request
+from utils import mediaSelector, jobs
+from routes.job_routes import job_accepted
 
 bp = Blueprint('merge_route', __name__)
 
@@ -8,9 +9,11 @@ bp = Blueprint('merge_route', __name__)
 @bp.route("/merge-files", methods=["POST"])
 def merge_files():
     """
-    Merges files in project folder into one file.
+    Queues a job that merges files in project folder into one file.
+    Poll the returned status_url for the result.
     """
     data_str = request.data.decode('utf-8')
     data = json.loads(data_str)
-    response = mediaSelector.main(data["bucket"])
-    return jsonify(response)
+    job = jobs.submit_cached_job(
+        "merge", mediaSelector.cached_result, mediaSelector.main, data["bucket"])
+    return job_accepted(job)
@@ -0,0 +1,16 @@
+from flask import Blueprint, Response
+
+# prometheus_client is only imported through utils.metrics, which sets up
+# PROMETHEUS_MULTIPROC_DIR before importing it
+from utils.metrics import CONTENT_TYPE_LATEST, generate_metrics
+
+bp = Blueprint('metrics_route', __name__)
+
+
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Exposes pipeline stage timings, transfer sizes, ffmpeg exits and job
+    durations from every API and job process, for Prometheus to scrape.
+    """
+    return Response(generate_metrics(), mimetype=CONTENT_TYPE_LATEST)
@@ -1,27 +1,74 @@
+import os
 import json
 from datetime import datetime
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 
-from utils.exportPodcast import createFinalPodcast
+from utils.exportPodcast import createFinalPodcast, cached_result
+from utils import jobs, result_cache, pagination
+from utils.minioUtils import create_s3_client
+from utils.ttl_cache import TTLCache, get_project_cache_ttl
+from routes.job_routes import job_accepted
 from models.project import Project
 from db import db
 
 bp = Blueprint('project_routes', __name__)
 
+s3_client = create_s3_client(
+    os.environ["MINIO_ENDPOINT"],
+    os.environ["ACCESS_KEY"],
+    os.environ["SECRET_KEY"])
+
+
+project_cache = TTLCache(get_project_cache_ttl())
+
+
+def _conditional_response(cache_key, build):
+    """
+    Builds a JSON response that clients can revalidate with If-None-Match or
+    If-Modified-Since, getting a 304 with no body if nothing has changed.
+    The serialized body is kept in project_cache, so repeat requests skip the database.
+
+    :param cache_key: what the response is cached under.
+    :param build: function returning (payload, etag, last_modified) on a miss,
+                  last_modified may be None to revalidate on the ETag only.
+    """
+    entry = project_cache.get(cache_key)
+    if entry is None:
+        payload, etag, last_modified = build()
+        body = jsonify(payload).get_data()
+        entry = (body, etag, last_modified)
+        project_cache.set(cache_key, entry)
+
+    body, etag, last_modified = entry
+    response = current_app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    if last_modified is not None:
+        # Setting None would date the response now instead of leaving the header out
+        response.last_modified = last_modified
+    # Let clients keep the response, but check it is still current before using it
+    response.cache_control.no_cache = True
+    response.headers.add('Access-Control-Allow-Origin', '*')
+    return response.make_conditional(request)
+
 
 @bp.route('/project/<project_id>', methods=['GET'])
 def get_single_project(project_id):
     """
     Fetches metadata on one project.
+    The ETag follows the project's last_edited and row version.
     :param project_id: the id of the project to be fetched.
     """
-    try:
+    def build():
         project = Project.query.get(project_id)
         if not project:
-            return jsonify({'error': 'Project not found'}), 404
-        response = jsonify(project.to_json())
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response, 200
+            raise LookupError(project_id)
+        return project.to_json(), project.etag(), project.last_edited
+
+    try:
+        return _conditional_response(("project", project_id), build)
+
+    except LookupError:
+        return jsonify({'error': 'Project not found'}), 404
 
     except Exception as error:
         error_message = f'Error retrieving projects: {str(error)}'
@@ -30,12 +77,44 @@ def get_single_project(project_id):
 
 @bp.route('/projects', methods=['GET'])
 def get_projects():
-    try:
+    """
+    Lists projects. With no query parameters every project is returned as a list.
+    Any of these parameters returns one page, newest first, as
+    {"projects": [...], "next_cursor": ..., "total": ...}:
+        - limit: how many projects per page
+        - cursor: the next_cursor of the previous page
+        - order: last_edited (default) or created_at
+        - fields: comma separated fields to return, e.g. project_id,name
+    Responses carry an ETag, so an unchanged listing can be revalidated for a 304.
+    There is no Last-Modified, as deleting a project doesn't change any date
+    the listing could give, and a date only has one second resolution.
+    """
+    def build_list():
         projects = Project.query.all()
-        projects = [project.to_json() for project in projects]
-        response = jsonify(projects)
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response, 200
+        return [project.to_json() for project in projects], Project.listing_etag(), None
+
+    def build_page():
+        cursor = request.args.get("cursor")
+        fields = request.args.get("fields")
+        projects, next_cursor = Project.page(
+            order=request.args.get("order", "last_edited"),
+            cursor=pagination.decode_cursor(cursor) if cursor else None,
+            limit=pagination.get_page_size(request.args.get("limit")),
+            fields=fields.split(",") if fields else None)
+        return {
+            "projects": projects,
+            "next_cursor": pagination.encode_cursor(next_cursor) if next_cursor else None,
+            "total": Project.query.count(),
+        }, Project.listing_etag(), None
+
+    try:
+        if not any(arg in request.args for arg in ("limit", "cursor", "order", "fields")):
+            return _conditional_response(("projects",), build_list)
+        return _conditional_response(
+            ("projects", tuple(sorted(request.args.items()))), build_page)
+
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
 
     except Exception as error:
         error_message = f'Error retrieving projects: {str(error)}'
@@ -51,10 +130,14 @@ def create_project(project_name):
     """
     try:
         data_str = request.data.decode('utf-8')
-        size = json.loads(data_str)['size']
-        new_project = Project(name=project_name, project_size=size)
+        data = json.loads(data_str)
+        size = data['size']
+        size_bytes = data.get('size_bytes', pagination.parse_size(size))
+        new_project = Project(name=project_name, project_size=size,
+                              project_size_bytes=size_bytes)
         db.session.add(new_project)
         db.session.commit()
+        project_cache.clear()
         project = Project.query.filter_by(
             project_id=new_project.project_id).first()
 
@@ -82,6 +165,7 @@ def delete_project(project_id):
             return jsonify({'error': 'Project not found'}), 404
         db.session.delete(project)
         db.session.commit()
+        project_cache.clear()
 
     except Exception as error:
         error_message = f'Error connecting to the database: {str(error)}'
@@ -104,6 +188,7 @@ def update_last_edited(project_id):
             return jsonify({'error': 'Project not found'}), 404
         project.last_edited = datetime.utcnow()
         db.session.commit()
+        project_cache.clear()
 
     except Exception as error:
         error_message = f'Error connecting to the database: {str(error)}'
@@ -115,11 +200,33 @@ def update_last_edited(project_id):
 
 @bp.route('/export-podcast/<project_id>', methods=['GET'])
 def export_podcast(project_id):
+    """
+    Queues a job that removes the deleted sections from the podcast.
+    Poll the returned status_url for the result.
+    :param project_id: the id of the project to be exported.
+    """
     bucket = f"project-{project_id}"
     try:
-        createFinalPodcast(bucket)
-    except Exception as e:
-        return jsonify({'error': e}), 500
+        job = jobs.submit_cached_job("export", cached_result, createFinalPodcast, bucket)
+    except Exception as error:
+        return jsonify({'error': f'Error queueing export: {str(error)}'}), 500
     else:
-        result = {'message': 'Removed sections were removed'}
-        return jsonify(result), 200
+        return job_accepted(job)
+
+
+@bp.route('/invalidate-cache/<project_id>', methods=['POST'])
+def invalidate_cache(project_id):
+    """
+    Drops cached merge, master and export results after source media changes.
+    The body can list the changed object keys as {"keys": [...]}, otherwise
+    every result whose inputs no longer match the bucket is dropped.
+    :param project_id: the id of the project whose media changed.
+    """
+    bucket = f"project-{project_id}"
+    try:
+        data = json.loads(request.data.decode('utf-8') or "{}")
+        removed = result_cache.invalidate(s3_client, bucket, data.get("keys"))
+    except Exception as error:
+        return jsonify({'error': f'Error invalidating cache: {str(error)}'}), 500
+    else:
+        return jsonify({'message': 'Cache invalidated', 'removed': removed}), 200
@@ -0,0 +1,76 @@
+import pytest
+from flask import Flask
+
+from db import db
+from routes import project_routes
+
+
+@pytest.fixture
+def client():
+    """
+    Gives a test client for the project routes, backed by an in memory database.
+    """
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    app.register_blueprint(project_routes.bp)
+    project_routes.project_cache.clear()
+    with app.app_context():
+        db.create_all()
+        yield app.test_client()
+
+
+def test_unchanged_project_is_not_sent_again(client):
+    """
+    GIVEN a project that has been fetched once
+    WHEN it is fetched again with the ETag it was sent with
+    THEN check a 304 with no body is returned
+    """
+    project_id = client.post("/create/Podcast", data='{"size": "1.00KB"}').json["project_id"]
+
+    first = client.get(f"/project/{project_id}")
+    again = client.get(f"/project/{project_id}", headers={"If-None-Match": first.headers["ETag"]})
+
+    assert first.status_code == 200
+    assert again.status_code == 304
+    assert again.data == b""
+
+
+def test_edits_change_the_etag(client):
+    """
+    GIVEN a project and the project listing, both fetched once
+    WHEN the project is edited
+    THEN check both are sent again with a new ETag
+    """
+    project_id = client.post("/create/Podcast", data='{"size": "1.00KB"}').json["project_id"]
+    project_etag = client.get(f"/project/{project_id}").headers["ETag"]
+    listing_etag = client.get("/projects").headers["ETag"]
+
+    client.get(f"/update/{project_id}")
+    project = client.get(f"/project/{project_id}", headers={"If-None-Match": project_etag})
+    listing = client.get("/projects", headers={"If-None-Match": listing_etag})
+
+    assert project.status_code == 200
+    assert project.headers["ETag"] != project_etag
+    assert listing.status_code == 200
+
+
+def test_deletes_are_not_hidden_by_the_listing_date(client):
+    """
+    GIVEN a listing of two projects, fetched once
+    WHEN one of them is deleted and the listing is revalidated with its ETag and date
+    THEN check the listing is sent again without the deleted project
+    """
+    client.post("/create/First", data='{"size": "1.00KB"}')
+    project_id = client.post("/create/Second", data='{"size": "1.00KB"}').json["project_id"]
+    first = client.get("/projects")
+
+    client.post(f"/delete/{project_id}")
+    listing = client.get("/projects", headers={
+        "If-None-Match": first.headers["ETag"],
+        "If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"})
+
+    assert "Last-Modified" not in first.headers
+    assert listing.status_code == 200
+    assert [project["project_id"] for project in listing.json] != [project_id]
+    assert len(listing.json) == 1
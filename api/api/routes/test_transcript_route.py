@@ -0,0 +1,37 @@
+import json
+
+import pytest
+from flask import Flask
+
+from routes import transcript_route
+
+
+@pytest.fixture
+def client():
+    """
+    Gives a test client for the transcript routes.
+    """
+    app = Flask(__name__)
+    app.register_blueprint(transcript_route.bp)
+    return app.test_client()
+
+
+def test_stream_ends_when_the_job_disappears(client, monkeypatch):
+    """
+    GIVEN a running transcript job whose record is removed while it is streamed
+    WHEN the stream is read
+    THEN check it ends with an error event instead of failing
+    """
+    records = iter([{"status": "running", "progress": 0.1},
+                    {"status": "running", "progress": 0.1}])
+    monkeypatch.setattr(transcript_route.jobs, "get_job", lambda job_id: next(records, None))
+    monkeypatch.setattr(transcript_route.jobs, "read_partial",
+                        lambda job_id, position: ([], position))
+    monkeypatch.setattr(transcript_route, "STREAM_POLL_SECONDS", 0)
+
+    response = client.get("/get-transcript/0123/stream")
+    events = [json.loads(line) for line in response.data.decode().splitlines()]
+
+    assert response.status_code == 200
+    assert events == [{"type": "progress", "progress": 0.1},
+                      {"type": "error", "error": "Job not found"}]
@@ -1,25 +1,94 @@
 import json
-from flask import Blueprint, jsonify, request
-from utils import transcribe
+import time
+from flask import Blueprint, Response, request, jsonify, stream_with_context, url_for
+from utils import transcribe, transcript_cache, jobs
+from routes.job_routes import job_accepted
 
 bp = Blueprint('transcript_route', __name__)
 
+STREAM_POLL_SECONDS = 0.5
+
 
 @bp.route("/get-transcript", methods=["POST"])
 def get_transcript():
     """
-    This method gets :
-        the relative video file path
-        temporary folder
-        name of the output audio file that will be produced
-        boolean to determine if the produced audio file should be sampled at 16kHz
-    from the front-end and passes them to the transcription logic
-    The response is a json that is returned to the front end
+    This method gets the video file path (or url) from the front-end and
+    queues a job that passes it to the transcription logic.
+    The audio is decoded straight into memory, so the temp_folder,
+    output_file_name and isCompressed fields are no longer needed.
+    Transcripts are cached in the project bucket, so a video that has already
+    been transcribed is answered straight away.
+    The response is the job, once it has finished its result is the json transcript.
+    Its stream_url streams the segments as they are transcribed, see stream_transcript.
     """
 
     data_str = request.data.decode('utf-8')
     data = json.loads(data_str)
-    response = transcribe.process_video_to_JSON(
-        data['video_file_path'], data["temp_folder"],
-        data["output_file_name"], data["isCompressed"])
-    return jsonify(response)
+    job = jobs.submit_cached_job(
+        "transcript", transcribe.cached_transcript, transcribe.transcribe_project_video,
+        data['video_file_path'], data.get('bucket'))
+    return job_accepted(job, stream_url=url_for(
+        'transcript_route.stream_transcript', job_id=job["job_id"], _external=True))
+
+
+def _event(event_type: str, **fields) -> str:
+    return json.dumps({"type": event_type, **fields}) + "\n"
+
+
+@bp.route("/get-transcript/<job_id>/stream", methods=["GET"])
+def stream_transcript(job_id):
+    """
+    Streams a transcript job as newline delimited JSON, one event per line:
+        - {"type": "segment", "segment": {...}} for each segment, in order, with its word timestamps
+        - {"type": "progress", "progress": 0.4} whenever the job moves on
+        - {"type": "done"} once every segment has been sent
+        - {"type": "error", "error": "..."} if the job failed or has gone
+    Segments are sent as soon as the chunk they are in has been transcribed.
+    :param job_id: the id of the job returned by /get-transcript.
+    """
+    if jobs.get_job(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def generate():
+        position, sent, progress = 0, 0, None
+        while True:
+            # Read the job before its segments, so a finished job has published all of them
+            job = jobs.get_job(job_id)
+            if job is None:
+                # The job record expired or was removed while it was being streamed
+                yield _event("error", error="Job not found")
+                return
+            segments, position = jobs.read_partial(job_id, position)
+            for segment in segments:
+                yield _event("segment", segment=segment)
+            sent += len(segments)
+
+            if job["status"] == "failed":
+                yield _event("error", error=job["error"])
+                return
+            if job["status"] == "finished":
+                # Cached and single pass transcripts only have the final result
+                for segment in json.loads(job["result"])["segments"][sent:]:
+                    yield _event("segment", segment=segment)
+                yield _event("done")
+                return
+            if job["progress"] != progress:
+                progress = job["progress"]
+                yield _event("progress", progress=progress)
+            time.sleep(STREAM_POLL_SECONDS)
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@bp.route("/transcripts/<project_id>", methods=["GET"])
+def list_transcripts(project_id):
+    """
+    Lists the transcripts cached for a project and how much space they take.
+    :param project_id: the id of the project.
+    """
+    try:
+        listing = transcript_cache.list_transcripts(transcribe.s3_client, f"project-{project_id}")
+    except Exception as error:
+        return jsonify({'error': f'Error listing transcripts: {str(error)}'}), 500
+    else:
+        return jsonify(listing), 200
@@ -0,0 +1,36 @@
+import pytest
+
+from config import get_config, get_engine_options, DevelopmentDatabaseConfig, ProductionConfig
+
+
+def test_engine_options_come_from_the_environment(monkeypatch):
+    """
+    GIVEN connection pool settings in the environment
+    WHEN the engine options are read
+    THEN check they are used, and the rest keep their defaults
+    """
+    monkeypatch.setenv("DB_POOL_SIZE", "20")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "false")
+
+    options = get_engine_options()
+
+    assert options["pool_size"] == 20
+    assert options["pool_pre_ping"] is False
+    assert options["max_overflow"] == 10
+
+
+def test_config_is_chosen_by_name(monkeypatch):
+    """
+    GIVEN an API_CONFIG setting
+    WHEN the configuration is chosen
+    THEN check the matching one is returned and unknown names are rejected
+    """
+    monkeypatch.delenv("API_CONFIG", raising=False)
+    assert get_config() is DevelopmentDatabaseConfig
+
+    monkeypatch.setenv("API_CONFIG", "production")
+    assert get_config() is ProductionConfig
+
+    monkeypatch.setenv("API_CONFIG", "staging")
+    with pytest.raises(ValueError):
+        get_config()
@@ -1,15 +1,17 @@
 import os
 import sys
 import subprocess
-import tempfile
 import ffmpeg
 
 from utils.minioUtils import create_s3_client, upload_to_s3
-from utils.editingUtils import separate_audio_video, add_audio_to_video
-from utils.mediaSelector import (
-    wait_for_file,  
-    generate_response,
-    clear_up_api_folder)
+from utils.mediaSelector import generate_response
+from utils.workspace import job_workspace
+from utils.jobs import report_progress
+from utils.transfer import download_file
+from utils.metrics import span
+from utils.ffmpeg_runner import run_ffmpeg
+from utils.loudness import analyse_file
+from utils import result_cache
 
 s3_client = create_s3_client(
     os.environ["MINIO_ENDPOINT"],
@@ -17,6 +19,54 @@ s3_client = create_s3_client(
     os.environ["SECRET_KEY"])
 
 
+# Default parameters of the mastering chain, any of them can be overridden per call
+DEFAULT_MASTERING_SETTINGS = {
+    "frame_size": 200,
+    "compression_factor": 3,
+    "attack": 200,
+    "cut_off_freq": 20,
+    # None picks the gain that brings the input to target_lufs, see choose_gain
+    "gain": None,
+    "target_lufs": -16.0,
+    "max_gain": 10,
+}
+
+
+def limiter_filter(frame_size: float, compression_factor: float) -> str:
+    """
+    Builds the ffmpeg filter for the limiter stage.
+    :param frame_size: number of samples processed at once
+    :param compression_factor: factor at which limiter is applied
+    """
+    return f'dynaudnorm=f={frame_size}:g={compression_factor}'
+
+
+def compressor_filter(attack: float, peak: float, adjustment: float) -> str:
+    """
+    Builds the ffmpeg filter for the compressor stage.
+    :param attack: specifies the attack time
+    :param peak: highest peak in audio
+    :param adjustment: how much the peaks should be reduced by
+    """
+    return f'compand=attacks={attack}:points={peak}/{peak + adjustment}:0/10'
+
+
+def gain_filter(gain_db: float) -> str:
+    """
+    Builds the ffmpeg filter for the gain stage.
+    :param gain_db: gain in db that will be applied to audio
+    """
+    return f'volume={gain_db}dB'
+
+
+def highpass_filter(cutoff_frequency: float) -> str:
+    """
+    Builds the ffmpeg filter for the highpass stage.
+    :param cutoff_frequency: frequency at which filter will be applied
+    """
+    return f'highpass=f={cutoff_frequency}'
+
+
 def audio_limiter(aud_in: str, aud_out: str, frame_size: float, compression_factor: float):
     """
     Applies a Limiter to the input audio file and creates a new updated audio file.
@@ -26,9 +76,9 @@ def audio_limiter(aud_in: str, aud_out: str, frame_size: float, compression_fact
     :param compression_factor: factor at which limiter is applied
     """
     audio_input = ffmpeg.input(aud_in)
-    filter_graph = f'dynaudnorm=f={frame_size}:g={compression_factor}'
+    filter_graph = limiter_filter(frame_size, compression_factor)
     audio_output = audio_input.output(aud_out, af=filter_graph)
-    audio_output.run(quiet=True)
+    run_ffmpeg(audio_output.compile(), label="limiter")
 
 
 def audio_compressor(aud_in: str, aud_out: str, attack: float, peak: float, adjustment: float):
@@ -41,9 +91,9 @@ def audio_compressor(aud_in: str, aud_out: str, attack: float, peak: float, adju
     :param adjustment: how much the peaks should be reduced by
     """
     audio_input = ffmpeg.input(aud_in)
-    filter_graph = f'compand=attacks={attack}:points={peak}/{peak + adjustment}:0/10'
+    filter_graph = compressor_filter(attack, peak, adjustment)
     audio_output = audio_input.output(aud_out, af=filter_graph)
-    audio_output.run(quiet=True)
+    run_ffmpeg(audio_output.compile(), label="compressor")
 
 
 def audio_highpass_filter(aud_in: str, aud_out: str, cutoff_frequency: float):
@@ -54,9 +104,9 @@ def audio_highpass_filter(aud_in: str, aud_out: str, cutoff_frequency: float):
     :param cutoff_freq: frequency at which filter will be applied  
     """
     audio_input = ffmpeg.input(aud_in)
-    filter_graph = f'highpass=f={cutoff_frequency}'
+    filter_graph = highpass_filter(cutoff_frequency)
     audio_output = audio_input.output(aud_out, af=filter_graph)
-    audio_output.run(quiet=True)
+    run_ffmpeg(audio_output.compile(), label="highpass")
 
 
 def apply_gain(aud_in: str, aud_out: str, gain_db: float):
@@ -66,34 +116,19 @@ def apply_gain(aud_in: str, aud_out: str, gain_db: float):
     :param aud_out: output audio file after processing
     :param gain_db: gain in db that will be applied to audio  
     """
-    filter_graph = f'[0:a]volume={gain_db}dB[audio]'
-    ffmpeg.input(aud_in).output(aud_out, af=filter_graph).run(quiet=True)
+    filter_graph = gain_filter(gain_db)
+    run_ffmpeg(ffmpeg.input(aud_in).output(aud_out, af=filter_graph).compile(), label="gain")
 
 
 def get_amplitude_info(aud_in: str):
     """
     Gets amplitude information from an input audio file
+    Only the audio stream is decoded, so this works on video files too.
     :param aud_in: audio file to get information from
+    :returns peak, rms: the peak and RMS levels in dB of all channels, None for silence.
     """
-    temp_file = tempfile.NamedTemporaryFile(delete=False)
-    command = [
-        'ffmpeg',
-        '-y',
-        '-i', aud_in,
-        '-af', 'astats=metadata=1:reset=1',
-        '-f', 'null', temp_file.name
-    ]
-    peak_amplitude = None
-    rms_amplitude = None
-    result = subprocess.run(command, capture_output=True, text=True)
-
-    for line in result.stderr.split('\n'):
-        if 'Peak level' in line:
-            peak_amplitude = float(line.split(' ')[-1])
-        if 'RMS level' in line:
-            rms_amplitude = float(line.split(' ')[-1])
-    temp_file.close()
-    return peak_amplitude, rms_amplitude
+    report = analyse_file(aud_in)
+    return report["peak_db"], report["rms_db"]
 
 
 def get_dynamic_range(aud_in: str):
@@ -105,79 +140,156 @@ def get_dynamic_range(aud_in: str):
     return abs(p) - abs(r)
 
 
-def auto_master(aud_in: str, aud_out: str):
+def choose_gain(report: dict, settings: dict = None) -> float:
+    """
+    Picks the gain that brings the integrated loudness of the input to
+    target_lufs, boosting by at most max_gain. The loudness is measured before
+    the limiter and compressor, so this is where the chain starts from rather
+    than an exact match.
+    :param report: loudness report of the input, see loudness.analyse_file
+    :param settings: overrides for DEFAULT_MASTERING_SETTINGS
+    """
+    settings = {**DEFAULT_MASTERING_SETTINGS, **(settings or {})}
+    if report["integrated_lufs"] is None:
+        # Too quiet to measure, boosting it would only bring up the noise
+        return 0.0
+    return round(min(settings["target_lufs"] - report["integrated_lufs"], settings["max_gain"]), 2)
+
+
+def build_master_filter(peak: float, dyn_range: float, settings: dict = None) -> str:
+    """
+    Chains every mastering stage (limiter -> compressor -> gain -> highpass)
+    into one filter graph, so the whole chain is rendered by a single ffmpeg run.
+    :param peak: peak level of the audio in dB
+    :param dyn_range: dynamic range of the audio in dB
+    :param settings: overrides for DEFAULT_MASTERING_SETTINGS, without a gain max_gain is used
+    """
+    settings = {**DEFAULT_MASTERING_SETTINGS, **(settings or {})}
+    gain = settings["max_gain"] if settings["gain"] is None else settings["gain"]
+    return ','.join([
+        limiter_filter(settings["frame_size"], settings["compression_factor"]),
+        compressor_filter(settings["attack"], peak, dyn_range),
+        gain_filter(gain),
+        highpass_filter(settings["cut_off_freq"]),
+    ])
+
+
+def measure_master_filter(aud_in: str, settings: dict = None) -> str:
+    """
+    Measures the input once and builds the mastering filter graph for it.
+    :param aud_in: audio (or video) file to be mastered
+    :param settings: overrides for DEFAULT_MASTERING_SETTINGS
+    """
+    report = analyse_file(aud_in)
+    peak, rms = report["peak_db"], report["rms_db"]
+    if peak is None or rms is None:
+        raise ValueError(f"Could not measure the amplitude of {aud_in}")
+    settings = {**DEFAULT_MASTERING_SETTINGS, **(settings or {})}
+    if settings["gain"] is None:
+        settings["gain"] = choose_gain(report, settings)
+    print(f"Mastering {aud_in}: {report['integrated_lufs']} LUFS, "
+          f"{report['loudness_range']} LU range, {settings['gain']}dB gain", file=sys.stderr)
+    return build_master_filter(peak, abs(peak) - abs(rms), settings)
+
+
+def auto_master(aud_in: str, aud_out: str, settings: dict = None):
     """
     Applies all of the audio mastering function to an input audio file and creates a new output file
+    The input is measured once and the chain is rendered in one pass, with no intermediate files.
     :param aud_in: input audio file to be mastered
     :param aud_out: mastered output file name
+    :param settings: overrides for DEFAULT_MASTERING_SETTINGS
     """
     absolute_path = os.path.abspath(aud_in)
-    p, _ = get_amplitude_info(absolute_path)
-    dyn_range = get_dynamic_range(absolute_path)
-    frame_size = 200
-    compression_factor = 3
-    attack = 200
-    cut_off_freq = 20
-    gain = 10
-
-    temp_file_a = "temp_a.wav"
-    temp_file_b = "temp_b.wav"
-    temp_file_c = "temp_c.wav"
+    filter_graph = measure_master_filter(absolute_path, settings)
 
     try:
-        audio_limiter(absolute_path, temp_file_a,
-                      frame_size, compression_factor)
-        audio_compressor(temp_file_a, temp_file_b, attack, p, dyn_range)
-        apply_gain(temp_file_b, temp_file_c, gain)
-        audio_highpass_filter(temp_file_a, aud_out, cut_off_freq)
-    except ffmpeg.Error as e:
+        run_ffmpeg(ffmpeg.input(absolute_path).output(aud_out, af=filter_graph).compile(
+            overwrite_output=True), label="master audio")
+    except subprocess.CalledProcessError as e:
         print(f"Error during ffmpeg operation: {e}")
         raise e
 
-    os.remove(temp_file_a)
-    os.remove(temp_file_b)
-    os.remove(temp_file_c)
+
+def master_video(vid_in: str, vid_out: str, settings: dict = None):
+    """
+    Masters the audio track of a video file.
+    The video stream is copied as it is, so only the audio is decoded and encoded.
+    :param vid_in: input video file to be mastered
+    :param vid_out: mastered output video file name
+    :param settings: overrides for DEFAULT_MASTERING_SETTINGS
+    """
+    absolute_path = os.path.abspath(vid_in)
+    filter_graph = measure_master_filter(absolute_path, settings)
+
+    input_video = ffmpeg.input(absolute_path)
+    try:
+        run_ffmpeg(ffmpeg.output(
+            input_video.video,
+            input_video.audio,
+            vid_out,
+            vcodec='copy',
+            acodec='aac',
+            af=filter_graph).compile(
+                overwrite_output=True), label="master video")
+    except subprocess.CalledProcessError as e:
+        print(f"Error during ffmpeg operation: {e}")
+        raise e
 
 
-def main(bucket_name):
+def master_cache_key(bucket_name):
     """
-    Retrieves the finilised podcast from minio, extracts the audio, 
-    applies audio mastering, combines new audio to video, uploads mastered podcast.
+    Builds the result cache digest of mastering a project's podcast.
     :param bucket_name: the minio bucket containing the required project files.
+    :returns digest, inputs: the digest, and the ETag of the podcast being mastered.
     """
-    clear_up_api_folder()
-
     object_key = "final-product/final_podcast.mp4"
-    download_file_path = "master_temp.mp4"
-    temp_output_vid = "tempv.mp4"
-    temp_output_aud = "tempa.wav"
-    final_aud = "finala.wav"
-    final_podcast = "final_podcast_mastered.mp4"
+    inputs = {object_key: result_cache.object_etag(s3_client, bucket_name, object_key)}
+    return result_cache.cache_key("master", inputs, DEFAULT_MASTERING_SETTINGS), inputs
 
-    s3_client.download_file(
-        bucket_name, object_key, download_file_path)
 
-    wait_for_file(download_file_path)
+def cached_result(bucket_name):
+    """
+    Returns the response of an earlier mastering of the same podcast, or None if there wasn't one.
+    :param bucket_name: the minio bucket containing the required project files.
+    """
+    digest, _ = master_cache_key(bucket_name)
+    if result_cache.lookup(s3_client, bucket_name, digest):
+        return generate_response("final_podcast_mastered.mp4", bucket_name)
+    return None
 
-    separate_audio_video(download_file_path, temp_output_vid, temp_output_aud)
 
-    auto_master(temp_output_aud, final_aud)
+def main(bucket_name):
+    """
+    Retrieves the finilised podcast from minio, applies audio mastering
+    to its audio track, uploads mastered podcast.
+    All files are created in a workspace owned by this job.
+    :param bucket_name: the minio bucket containing the required project files.
+    """
+    object_key = "final-product/final_podcast.mp4"
+    final_podcast = "final_podcast_mastered.mp4"
 
-    add_audio_to_video(download_file_path, final_aud, final_podcast)
+    digest, inputs = master_cache_key(bucket_name)
+    if result_cache.lookup(s3_client, bucket_name, digest):
+        return generate_response(final_podcast, bucket_name)
 
-    upload_to_s3(s3_client, final_podcast, bucket_name)
+    with job_workspace(bucket_name) as workspace:
+        download_file_path = workspace.path("master_temp.mp4")
+        final_podcast_path = workspace.path(final_podcast)
 
-    response = generate_response(final_podcast, bucket_name)
+        report_progress(0.0, stage="download")
+        with span("master", "download") as details:
+            details.update(download_file(s3_client, bucket_name, object_key, download_file_path))
 
-    try:
-        os.remove(temp_output_vid)
-        os.remove(temp_output_aud)
-        os.remove(final_aud)
-        os.remove(download_file_path)
-        os.remove(final_podcast)
-        print("Files deleted successfully.")
-    except Exception:
-        print("Error, files not deleted", file=sys.stderr)
-        response = {"Error": "Files not cleaned up"}
-
-    return response
+        report_progress(0.2, stage="master")
+        with span("master", "master", uses_ffmpeg=True):
+            master_video(download_file_path, final_podcast_path)
+
+        report_progress(0.9, stage="upload")
+        with span("master", "upload"):
+            uploaded = upload_to_s3(s3_client, final_podcast_path, bucket_name)
+        if uploaded:
+            result_cache.store(s3_client, bucket_name, digest, "master", inputs,
+                               f"final-product/{final_podcast}")
+
+    return generate_response(final_podcast, bucket_name)
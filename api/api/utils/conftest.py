@@ -3,16 +3,6 @@ import subprocess
 import pytest
 
 
-def pytest_configure():
-    """
-    Sets up environmental variables for pytest running.
-    :param config: Requried for pytest configuration.
-    """
-    os.environ['ACCESS_KEY'] = 'minio_user'
-    os.environ['SECRET_KEY'] = 'minio_password'
-    os.environ['MINIO_ENDPOINT'] = 'http://127.0.0.1:9000'
-
-
 @pytest.fixture
 def mock_audio_file(tmpdir):
     """
@@ -1,6 +1,10 @@
+import subprocess
+
 import ffmpeg
 import audiosegment
 
+from utils.ffmpeg_runner import run_ffmpeg
+
 
 def separate_audio_video(input_file: str, output_video_file: str, output_audio_file: str):
     """
@@ -11,14 +15,12 @@ def separate_audio_video(input_file: str, output_video_file: str, output_audio_f
     :param output_audio_file: str - Path to the output audio file.
     """
 
-    ffmpeg.input(input_file).output(
+    run_ffmpeg(ffmpeg.input(input_file).output(
         output_video_file,
-        an=None).run(
-            overwrite_output=True, quiet=True)
-    ffmpeg.input(input_file).output(
+        an=None).compile(overwrite_output=True), label="separate video")
+    run_ffmpeg(ffmpeg.input(input_file).output(
         output_audio_file,
-        vn=None).run(
-            overwrite_output=True, quiet=True)
+        vn=None).compile(overwrite_output=True), label="separate audio")
 
 
 def add_audio_to_video(video_file: str, audio_file: str, output_file: str):
@@ -33,13 +35,12 @@ def add_audio_to_video(video_file: str, audio_file: str, output_file: str):
     input_video = ffmpeg.input(video_file)
     input_audio = ffmpeg.input(audio_file)
     try:
-        ffmpeg.output(
+        run_ffmpeg(ffmpeg.output(
             input_video.video,
             input_audio.audio,
             output_file,
-            acodec='aac').run(
-                overwrite_output=True, quiet=True)
-    except ffmpeg.Error as e:
+            acodec='aac').compile(overwrite_output=True), label="add audio")
+    except subprocess.CalledProcessError as e:
         print(f"Error during ffmpeg operation: {e}")
         raise e
 
@@ -0,0 +1,333 @@
+import os
+import sys
+import shlex
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils.ffmpeg_runner import run_ffmpeg, CombinedProgress
+
+
+def get_min_shot_seconds() -> float:
+    """
+    Returns the shortest a shot may be before it is merged into the one
+    before it, set with MIN_SHOT_SECONDS.
+    """
+    return float(os.environ.get("MIN_SHOT_SECONDS", 2.0))
+
+
+def get_render_workers() -> int:
+    """
+    Returns how many chunks of a video are encoded at once, set with RENDER_WORKERS.
+    Defaults to the number of CPU cores, 1 renders in a single ffmpeg process.
+    """
+    return int(os.environ.get("RENDER_WORKERS", os.cpu_count() or 1))
+
+
+def get_render_chunks() -> int:
+    """
+    Returns how many chunks a video is split into, set with RENDER_CHUNKS.
+    Defaults to one chunk per worker.
+    """
+    return int(os.environ.get("RENDER_CHUNKS", get_render_workers()))
+
+
+def get_threads_per_chunk() -> int:
+    """
+    Returns how many threads each ffmpeg process may use, set with RENDER_THREADS_PER_CHUNK.
+    Defaults to sharing the CPU cores between the workers.
+    """
+    default = max(1, (os.cpu_count() or 1) // get_render_workers())
+    return int(os.environ.get("RENDER_THREADS_PER_CHUNK", default))
+
+
+def get_encoder_arguments() -> list:
+    """
+    Returns the ffmpeg arguments video is encoded with, set with RENDER_ENCODER_ARGS.
+    Every chunk of a video is encoded the same way, so they can be joined without re-encoding.
+    """
+    return shlex.split(os.environ.get(
+        "RENDER_ENCODER_ARGS", "-c:v libx264 -preset medium -crf 23 -pix_fmt yuv420p"))
+
+
+class EditDecisionList:
+    """
+    A list of (start, end, source) edits kept as numpy arrays.
+    Sources are stored once in self.sources and referred to by index,
+    and an end of None (until the end of the source) is stored as nan.
+    """
+
+    def __init__(self, starts, ends, source_ids, sources: list):
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        self.source_ids = np.asarray(source_ids, dtype=np.int64)
+        self.sources = list(sources)
+
+    @classmethod
+    def from_transitions(cls, transitions):
+        """
+        Builds an edit decision list from (start, end, source) tuples.
+        :param transitions: list of tuples, end may be None for the end of the source.
+        """
+        if isinstance(transitions, cls):
+            return transitions
+        sources = []
+        source_ids = []
+        for _, _, source in transitions:
+            if source not in sources:
+                sources.append(source)
+            source_ids.append(sources.index(source))
+        starts = [start for start, _, _ in transitions]
+        ends = [np.nan if end is None else end for _, end, _ in transitions]
+        return cls(starts, ends, source_ids, sources)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        for start, end, source_id in zip(self.starts, self.ends, self.source_ids):
+            yield (float(start), None if np.isnan(end) else float(end), self.sources[source_id])
+
+    def to_transitions(self) -> list:
+        """
+        Returns the edits as (start, end, source) tuples.
+        """
+        return list(self)
+
+    def used_sources(self) -> list:
+        """
+        Returns the sources that are used by at least one edit, in order of first use.
+        """
+        _, first_use = np.unique(self.source_ids, return_index=True)
+        return [self.sources[self.source_ids[i]] for i in sorted(first_use)]
+
+    def merge_runs(self):
+        """
+        Joins consecutive edits that show the same source and follow on from
+        each other without a gap.
+        :returns edl: a new, shorter, edit decision list.
+        """
+        if len(self) < 2:
+            return EditDecisionList(self.starts, self.ends, self.source_ids, self.sources)
+        continues = ((self.source_ids[1:] == self.source_ids[:-1])
+                     & np.isclose(self.ends[:-1], self.starts[1:]))
+        run_starts = np.flatnonzero(np.concatenate(([True], ~continues)))
+        run_ends = np.concatenate((run_starts[1:], [len(self)])) - 1
+        return EditDecisionList(self.starts[run_starts], self.ends[run_ends],
+                                self.source_ids[run_starts], self.sources)
+
+    def absorb_short(self, min_duration: float):
+        """
+        Removes shots shorter than min_duration by extending the shot before
+        them (or after them, for the first shot), so the video doesn't flick
+        between cameras. Only joins edits that follow on from each other.
+        :param min_duration: the shortest a shot may be, in seconds.
+        :returns edl: a new edit decision list with the runs merged.
+        """
+        edl = self.merge_runs()
+        starts = list(edl.starts)
+        ends = list(edl.ends)
+        source_ids = list(edl.source_ids)
+
+        i = 0
+        while i < len(starts) and len(starts) > 1:
+            duration = ends[i] - starts[i]
+            if np.isnan(duration) or duration >= min_duration:
+                i += 1
+                continue
+            if i > 0 and np.isclose(ends[i - 1], starts[i]):
+                ends[i - 1] = ends[i]
+            elif i + 1 < len(starts) and np.isclose(ends[i], starts[i + 1]):
+                starts[i + 1] = starts[i]
+            else:
+                i += 1
+                continue
+            del starts[i], ends[i], source_ids[i]
+            # The neighbours may now show the same source, join them and look again
+            if 0 < i < len(starts) and source_ids[i - 1] == source_ids[i] \
+                    and np.isclose(ends[i - 1], starts[i]):
+                ends[i - 1] = ends[i]
+                del starts[i], ends[i], source_ids[i]
+            i = max(i - 1, 0)
+
+        return EditDecisionList(starts, ends, source_ids, edl.sources)
+
+    def durations(self):
+        """
+        Returns the length of each edit, an edit without an end counts as 0.
+        """
+        return np.nan_to_num(self.ends - self.starts)
+
+    def split(self, chunk_count: int) -> list:
+        """
+        Splits the edits into up to chunk_count lists of roughly equal length.
+        Chunks only ever start at an edit, so they can be rendered independently.
+        :param chunk_count: how many chunks to aim for.
+        :returns chunks: list of edit decision lists, in order.
+        """
+        if chunk_count <= 1 or len(self) <= 1:
+            return [self]
+        finished_by = np.cumsum(self.durations())
+        targets = finished_by[-1] * np.arange(1, chunk_count) / chunk_count
+        # Each chunk ends with the edit that takes it past its share of the total length
+        cuts = np.unique(np.searchsorted(finished_by, targets) + 1)
+        cuts = cuts[(cuts > 0) & (cuts < len(self))]
+        bounds = np.concatenate(([0], cuts, [len(self)]))
+        return [EditDecisionList(self.starts[a:b], self.ends[a:b], self.source_ids[a:b],
+                                 self.sources)
+                for a, b in zip(bounds[:-1], bounds[1:])]
+
+    def shifted(self, offsets: dict):
+        """
+        Moves every edit by the offset of its source, so sources that started
+        recording at different times line up. Times are never moved before 0.
+        :param offsets: dict of source to seconds, sources without an offset aren't moved.
+        :returns starts, ends: arrays of the times to take from each source.
+        """
+        shift = np.array([offsets.get(source, 0) for source in self.sources],
+                         dtype=np.float64)[self.source_ids] if len(self) else np.zeros(0)
+        return (np.maximum(self.starts + shift, 0.0),
+                np.maximum(self.ends + shift, 0.0))
+
+
+def input_seeks(edl: EditDecisionList, offsets: dict) -> dict:
+    """
+    Finds where each source is first used, so its input can be seeked there
+    instead of being decoded from the start and thrown away by trim. Without
+    this, every chunk of a chunked render decodes each source from 0.
+
+    :param edl: the edits to render.
+    :param offsets: dict of source to seconds it is shifted by.
+    :returns seeks: dict of source to the seconds its input is seeked to.
+    """
+    starts, _ = edl.shifted(offsets)
+    seeks = {}
+    for i, (_, _, source) in enumerate(edl):
+        seeks[source] = min(seeks.get(source, np.inf), float(starts[i]))
+    return seeks
+
+
+def build_filter_graph(edl: EditDecisionList, stream: str, offsets: dict,
+                       seeks: dict = None) -> tuple:
+    """
+    Builds a filter graph that opens every source once, splits it into one
+    branch per edit, trims each branch and joins them in order.
+    The graph grows with the number of edits, not the length of the podcast.
+
+    :param edl: the edits to render.
+    :param stream: "v" for video or "a" for audio.
+    :param offsets: dict of source to seconds it is shifted by.
+    :param seeks: dict of source to seconds its input is seeked to, see input_seeks.
+                  Trims are made relative to it, as a seeked input starts at 0.
+    :returns graph, sources: the filter graph, and the sources in input order.
+    """
+    prefix = "" if stream == "v" else "a"
+    sources = edl.used_sources()
+    input_index = {source: i for i, source in enumerate(sources)}
+    starts, ends = edl.shifted(offsets)
+    if seeks:
+        shift = np.array([seeks.get(source, 0.0) for source in edl.sources],
+                         dtype=np.float64)[edl.source_ids]
+        starts, ends = starts - shift, ends - shift
+
+    branches = {source: [] for source in sources}
+    for i, (_, _, source) in enumerate(edl):
+        branches[source].append(i)
+
+    filters = []
+    for source, edits in branches.items():
+        labels = ''.join(f"[{stream}{source}_{i}]" for i in edits)
+        filters.append(f"[{input_index[source]}:{stream}]{prefix}split={len(edits)}{labels};")
+    for i, (_, _, source) in enumerate(edl):
+        end_option = "" if np.isnan(ends[i]) else f":end={ends[i]:.6f}"
+        filters.append(
+            f"[{stream}{source}_{i}]{prefix}trim=start={starts[i]:.6f}{end_option},"
+            f"{prefix}setpts=PTS-STARTPTS[{stream}{i}];")
+
+    video, audio = (1, 0) if stream == "v" else (0, 1)
+    filters.append(''.join(f"[{stream}{i}]" for i in range(len(edl)))
+                   + f"concat=n={len(edl)}:v={video}:a={audio}[out{stream}]")
+    return '\n'.join(filters), sources
+
+
+def render(edl: EditDecisionList, files: dict, stream: str, output: str, offsets: dict,
+           output_arguments: list = None, on_progress=None) -> None:
+    """
+    Renders the video or audio of an edit decision list in one ffmpeg run.
+    The graph is passed in a script file next to the output, so long
+    podcasts can't run into command line length limits.
+
+    :param edl: the edits to render.
+    :param files: dict of source to the file it is read from.
+    :param stream: "v" for video or "a" for audio.
+    :param output: path of the rendered file.
+    :param offsets: dict of source to seconds it is shifted by.
+    :param output_arguments: extra ffmpeg arguments for the output, e.g. the encoder.
+    :param on_progress: passed on to run_ffmpeg, by default progress goes to the job record.
+    """
+    seeks = input_seeks(edl, offsets)
+    graph, sources = build_filter_graph(edl, stream, offsets, seeks)
+    script_file = f"{output}.filtergraph"
+    with open(script_file, "w") as file:
+        file.write(graph)
+
+    command = ['ffmpeg', '-y']
+    for source in sources:
+        # Seeking before -i skips to the keyframe before the first edit, and drops the frames up to it
+        if seeks[source] > 0:
+            command += ['-ss', f"{seeks[source]:.6f}"]
+        command += ['-i', files[source]]
+    command += ['-filter_complex_script', script_file, '-map', f'[out{stream}]']
+    command += (output_arguments or []) + [output]
+    label = "render video" if stream == "v" else "render audio"
+    try:
+        run_ffmpeg(command, float(edl.durations().sum()), label, on_progress)
+    finally:
+        os.remove(script_file)
+    print(f"Rendered {len(edl)} edits from {len(sources)} sources into {output}", file=sys.stderr)
+
+
+def render_video(edl: EditDecisionList, files: dict, output: str, offsets: dict) -> None:
+    """
+    Renders the video of an edit decision list, split into RENDER_CHUNKS chunks
+    at edit boundaries. Up to RENDER_WORKERS chunks are encoded at once, each
+    ffmpeg limited to RENDER_THREADS_PER_CHUNK threads, and the chunks are
+    then joined with the concat demuxer without being re-encoded.
+
+    :param edl: the edits to render.
+    :param files: dict of source to the video file it is read from.
+    :param output: path of the rendered video.
+    :param offsets: dict of source to seconds it is shifted by.
+    """
+    chunks = edl.split(get_render_chunks())
+    threads = str(get_threads_per_chunk())
+    output_arguments = get_encoder_arguments() + [
+        '-threads', threads, '-filter_complex_threads', threads]
+    if len(chunks) == 1:
+        render(edl, files, "v", output, offsets, output_arguments)
+        return
+
+    chunk_files = [f"{output}.chunk{i:04d}.mp4" for i in range(len(chunks))]
+    list_file = f"{output}.chunks.txt"
+    duration = float(edl.durations().sum())
+    progress = CombinedProgress("render video", duration)
+    try:
+        with ThreadPoolExecutor(max_workers=get_render_workers()) as pool:
+            futures = [pool.submit(render, chunk, files, "v", chunk_file, offsets, output_arguments,
+                                   progress.part(i))
+                       for i, (chunk, chunk_file) in enumerate(zip(chunks, chunk_files))]
+            for future in futures:
+                future.result()
+
+        with open(list_file, 'w') as file:
+            for chunk_file in chunk_files:
+                file.write(f"file '{os.path.abspath(chunk_file)}'\n")
+        run_ffmpeg(
+            ['ffmpeg', '-y', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', list_file,
+             '-c', 'copy', output],
+            duration, "join chunks")
+    finally:
+        for file_path in chunk_files + [list_file]:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+    print(f"Joined {len(chunks)} chunks into {output}", file=sys.stderr)
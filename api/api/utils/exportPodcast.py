@@ -1,11 +1,23 @@
 import os
 import sys
 import json
+import subprocess
+
+from botocore.exceptions import ClientError
 
 
 from utils.minioUtils import create_s3_client, download_from_s3, upload_to_s3
-from utils.mediaSelector import process_video_segments, align_and_merge_audio, attach_audio_to_video
+from utils.mediaSelector import (
+    process_video_segments,
+    align_and_merge_audio,
+    attach_audio_to_video,
+    generate_response)
 from utils.editingUtils import separate_audio_video
+from utils.smart_cut import smart_cut
+from utils.workspace import job_workspace
+from utils.jobs import report_progress
+from utils.metrics import span
+from utils import result_cache
 
 s3_client = create_s3_client(
     os.environ["MINIO_ENDPOINT"],
@@ -20,6 +32,14 @@ def timestamps_to_trim_sections(timestamp_file_path):
     """
     with open(timestamp_file_path, 'rb') as f:
         timestamps = json.load(f)
+    return trim_sections_from_timestamps(timestamps)
+
+def trim_sections_from_timestamps(timestamps):
+    """
+    Finds the trim sections in the contents of a timestamp file
+    :param timestamps: the list of timestamps in the file
+    :return trim_sections a list of tuples containing trim sections
+    """
     trim_sections = []
     for timestamp in timestamps:
         if not timestamp["enabled"]:
@@ -29,6 +49,21 @@ def timestamps_to_trim_sections(timestamp_file_path):
     
     return trim_sections
 
+def merge_trim_sections(*trim_section_lists):
+    """
+    Combines lists of trim sections into one sorted list, joining any that overlap
+    :param trim_section_lists: lists of (start, end, _) tuples
+    :returns trim_sections: sorted list of (start, end, 0) tuples that don't overlap
+    """
+    trim_sections = []
+    for start, end, _ in sorted(section for sections in trim_section_lists for section in sections):
+        if trim_sections and start <= trim_sections[-1][1]:
+            last_start, last_end, _ = trim_sections[-1]
+            trim_sections[-1] = (last_start, max(last_end, end), 0)
+        else:
+            trim_sections.append((start, end, 0))
+    return trim_sections
+
 def trim_to_keep(trim_sections):
     """
     Takes trim sections and turns this into segments to keep
@@ -40,19 +75,21 @@ def trim_to_keep(trim_sections):
     last_end = 0.0
 
     for start, end, _ in trim_sections:
-        segments.append((last_end, start, 0))
-        last_end = end
+        if start > last_end: # nothing to keep between trims that touch
+            segments.append((last_end, start, 0))
+        last_end = max(last_end, end)
     segments.append((last_end, None, 0))
 
     return segments
-def getTimestamps(bucket: str) -> str:
+def getTimestamps(bucket: str, workspace) -> str:
     """
     Gets timestamp from bucket using s3 client
     :param bucket: string of bucket name
+    :param workspace: the job workspace the file is downloaded into
     :returns download_path | "": where the file is downloaded, or nothing if it could not be found
     """
 
-    download_path = "timestamps.json"
+    download_path = workspace.path("timestamps.json")
 
     if not download_from_s3(s3_client, 
                             bucket,
@@ -61,14 +98,15 @@ def getTimestamps(bucket: str) -> str:
         return ""
     return download_path
 
-def getPodcast(bucket):
+def getPodcast(bucket, workspace):
     """
     Gets podcast from bucket using s3 client
     :param bucket: string of bucket name
+    :param workspace: the job workspace the file is downloaded into
     :returns download_path | "": where the file is downloaded, or nothing if it could not be found
     """
     
-    download_path = "podcast.mp4"
+    download_path = workspace.path("podcast.mp4")
 
     if not download_from_s3(s3_client,
                             bucket,
@@ -77,60 +115,155 @@ def getPodcast(bucket):
         return ""
     return download_path
 
-def clean_files():
+def getDeadSections(bucket: str) -> tuple:
+    """
+    Gets the dead sections found when the podcast was merged, if there are any
+    and REMOVE_DEAD_SECTIONS isn't turned off
+    :param bucket: string of bucket name
+    :returns dead_sections, etag: the dead sections in the timestamps.json format, and the file's ETag
+    """
+    if os.environ.get("REMOVE_DEAD_SECTIONS", "1").lower() in ("0", "false", "no"):
+        return [], None
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key="final-product/dead_sections.json")
+    except ClientError:
+        return [], None
+    return json.loads(response['Body'].read()), response['ETag']
+
+def get_export_mode() -> str:
+    """
+    Returns how exports are cut, set with EXPORT_MODE:
+        - "smart" stream copies whole GOPs and re-encodes only the cut edges (default)
+        - "reencode" re-encodes the whole podcast
+    """
+    return os.environ.get("EXPORT_MODE", "smart")
+
+def reencode_sections(podcast_file_path, kept_sections, output_file_path, workspace):
+    """
+    Keeps only the given sections of the podcast by re-encoding all of it
+    :param podcast_file_path: the podcast to be cut
+    :param kept_sections: list of tuples containing timestamps to keep
+    :param output_file_path: where the cut podcast is written
+    :param workspace: the job workspace intermediate files are written to
+    """
+    output_video_path = workspace.path("final_podcast_trim.mp4")
+    output_audio_path = workspace.path("final_podcast_trim.mp3")
+    video_only_path = workspace.path("i.mp4")
+    audio_only_path = workspace.path("i.mp3")
+    separate_audio_video(podcast_file_path, video_only_path, audio_only_path)
+
+    process_video_segments({0: video_only_path}, kept_sections, output_video_path, {})
+    align_and_merge_audio({0: audio_only_path}, kept_sections, output_audio_path, {})
+    attach_audio_to_video(output_video_path, output_audio_path, output_file_path)
+
+def render_export(podcast_file_path, kept_sections, output_file_path, workspace):
+    """
+    Keeps only the given sections of the podcast, see get_export_mode.
+    Smart cuts fall back to re-encoding if the podcast can't be stream copied.
+    :param podcast_file_path: the podcast to be cut
+    :param kept_sections: list of tuples containing timestamps to keep
+    :param output_file_path: where the cut podcast is written
+    :param workspace: the job workspace intermediate files are written to
+    """
+    if get_export_mode() == "smart":
+        try:
+            smart_cut(podcast_file_path, kept_sections, output_file_path, workspace)
+            return
+        except (subprocess.CalledProcessError, ValueError) as e:
+            print(f"Smart cut failed, re-encoding instead: {e}", file=sys.stderr)
+    reencode_sections(podcast_file_path, kept_sections, output_file_path, workspace)
+
+def export_cache_key(bucket):
     """
-    Cleans files if they exist
+    Builds the result cache digest of exporting a project, covering the
+    mastered podcast, the sections disabled in timestamps.json and the export mode.
+    :param bucket: string of bucket name
+    :returns digest, inputs: the digest, and the ETag of each input file.
     """
+    podcast_key = "final-product/final_podcast_mastered.mp4"
+    timestamps_key = "final-product/timestamps.json"
 
-    files_to_clean = ["timestamps.json", "podcast.mp4", "i.mp4", "i.mp3", \
-                      "final_podcast_trim.mp4", "final_podcast_trim.mp3", \
-                      "final_podcast_export.mp3"]
+    response = s3_client.get_object(Bucket=bucket, Key=timestamps_key)
+    dead_sections, dead_sections_etag = getDeadSections(bucket)
+    trim_sections = merge_trim_sections(
+        trim_sections_from_timestamps(json.loads(response['Body'].read())),
+        trim_sections_from_timestamps(dead_sections))
+    inputs = {
+        podcast_key: result_cache.object_etag(s3_client, bucket, podcast_key),
+        timestamps_key: response['ETag'],
+        "final-product/dead_sections.json": dead_sections_etag,
+    }
+    params = {"trim_sections": trim_sections, "mode": get_export_mode()}
+    return result_cache.cache_key("export", inputs, params), inputs
 
-    for file_to_clean in files_to_clean:
-        if os.path.exists(file_to_clean):
-            os.remove(file_to_clean)
+def cached_result(bucket):
+    """
+    Returns the response of an earlier identical export, or None if there wasn't one.
+    :param bucket: string of bucket name
+    """
+    digest, _ = export_cache_key(bucket)
+    if result_cache.lookup(s3_client, bucket, digest):
+        return generate_response("final_podcast_export.mp4", bucket)
+    return None
 
 def createFinalPodcast(bucket):
     """
     Runs the whole exporting process
     Including
         - Geting mastered podcast and timestamps
-        - Finding sections to remove/keep
+        - Finding sections to remove/keep, including the dead sections found when merging
         - Running a ffmpeg pipeline to make the final exported podcast
         - Upload this to s3 bucket
         - Cleaning up
+    Every file is created inside a workspace owned by this export.
+    :returns response: the url of the exported podcast.
     """
-    output_video_path = "final_podcast_trim.mp4"
-    output_audio_path = "final_podcast_trim.mp3"
-    output_file_path = "final_podcast_export.mp4"
-
-    podcast_file_path = getPodcast(bucket)
-    if not podcast_file_path:
-        clean_files()
-        raise FileNotFoundError("Could not find podcast in s3 bucket")
-    timestamp_file_path = getTimestamps(bucket)
-
-    if not timestamp_file_path: # since empty strings are falsey
-        clean_files()
-        raise Exception("Could not find timestamp from s3 bucket")
-
-    trim_sections = timestamps_to_trim_sections(timestamp_file_path)
-    if not trim_sections:
-        print("No sections to trim", file=sys.stderr)
-        os.rename(podcast_file_path, output_file_path)
-        upload_to_s3(s3_client, output_file_path, bucket)
-        clean_files()
-        return
-    kept_sections = trim_to_keep(trim_sections)
+    final_output = "final_podcast_export.mp4"
+    output_key = f"final-product/{final_output}"
 
-    
-    
-    separate_audio_video(podcast_file_path, "i.mp4", "i.mp3")
-    
-    process_video_segments({0: 'i.mp4'}, kept_sections, output_video_path, {})
-    align_and_merge_audio({0: 'i.mp3'}, kept_sections, output_audio_path, {})
-    attach_audio_to_video(output_video_path, output_audio_path, output_file_path)
+    try:
+        digest, inputs = export_cache_key(bucket)
+    except ClientError as e:
+        # Missing files are reported below, just don't cache this export
+        print(f"Not caching export: {e}", file=sys.stderr)
+        digest = None
+    if digest and result_cache.lookup(s3_client, bucket, digest):
+        return generate_response(final_output, bucket)
 
-    
-    upload_to_s3(s3_client, output_file_path, bucket)
-    clean_files()
+    with job_workspace(bucket) as workspace:
+        output_file_path = workspace.path(final_output)
+
+        report_progress(0.0, stage="download")
+        with span("export", "download"):
+            podcast_file_path = getPodcast(bucket, workspace)
+            if not podcast_file_path:
+                raise FileNotFoundError("Could not find podcast in s3 bucket")
+            timestamp_file_path = getTimestamps(bucket, workspace)
+
+        if not timestamp_file_path: # since empty strings are falsey
+            raise Exception("Could not find timestamp from s3 bucket")
+
+        dead_sections, _ = getDeadSections(bucket)
+        trim_sections = merge_trim_sections(
+            timestamps_to_trim_sections(timestamp_file_path),
+            trim_sections_from_timestamps(dead_sections))
+        if not trim_sections:
+            print("No sections to trim", file=sys.stderr)
+            os.rename(podcast_file_path, output_file_path)
+            if upload_to_s3(s3_client, output_file_path, bucket) and digest:
+                result_cache.store(s3_client, bucket, digest, "export", inputs, output_key)
+            return generate_response(final_output, bucket)
+        kept_sections = trim_to_keep(trim_sections)
+
+        report_progress(0.1, stage="render")
+        with span("export", "render", uses_ffmpeg=True) as details:
+            details.update(mode=get_export_mode(), kept_sections=len(kept_sections))
+            render_export(podcast_file_path, kept_sections, output_file_path, workspace)
+
+        report_progress(0.9, stage="upload")
+        with span("export", "upload"):
+            uploaded = upload_to_s3(s3_client, output_file_path, bucket)
+        if uploaded and digest:
+            result_cache.store(s3_client, bucket, digest, "export", inputs, output_key)
+
+    return generate_response(final_output, bucket)
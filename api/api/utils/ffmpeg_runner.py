@@ -0,0 +1,194 @@
+import os
+import re
+import sys
+import time
+import threading
+import subprocess
+
+from utils.jobs import report_details
+
+DURATION_PATTERN = re.compile(rb"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+
+
+def get_progress_interval() -> float:
+    """
+    Returns how many seconds apart the progress of an ffmpeg run is published,
+    set with FFMPEG_PROGRESS_INTERVAL. Every update rewrites the job record,
+    so this keeps fast ffmpeg runs from spending their time on it.
+    """
+    return float(os.environ.get("FFMPEG_PROGRESS_INTERVAL", 1.0))
+
+
+def parse_speed(value: str):
+    """
+    Reads ffmpeg's speed, e.g. "1.52x", as a float. Returns None for "N/A".
+    """
+    try:
+        return float(value.strip().rstrip("x"))
+    except ValueError:
+        return None
+
+
+def parse_out_seconds(fields: dict):
+    """
+    Reads how far into the output ffmpeg is from a block of -progress fields.
+    Despite its name, out_time_ms is in microseconds too.
+    """
+    for key in ("out_time_us", "out_time_ms"):
+        try:
+            return max(int(fields[key]) / 1_000_000, 0.0)
+        except (KeyError, ValueError):
+            continue
+    return None
+
+
+def estimate(out_seconds, duration, speed, elapsed: float, finished: bool = False) -> dict:
+    """
+    Works out how far through an ffmpeg run is and how long it has left.
+
+    :param out_seconds: seconds of output written so far, or None if not known yet.
+    :param duration: expected length of the output in seconds, or None if not known.
+    :param speed: seconds of output written per second, as reported by ffmpeg.
+    :param elapsed: seconds since the run started.
+    :param finished: True once ffmpeg has written its last progress block.
+    :returns progress: percent, out_seconds, duration, speed and eta_seconds,
+                       percent and eta_seconds are None when they can't be worked out.
+    """
+    percent = eta_seconds = None
+    if finished:
+        percent, eta_seconds = 100.0, 0.0
+    elif duration and out_seconds is not None:
+        done = min(out_seconds / duration, 1.0)
+        percent = round(done * 100, 1)
+        remaining = max(duration - out_seconds, 0.0)
+        if speed:
+            eta_seconds = round(remaining / speed, 1)
+        elif done > 0:
+            eta_seconds = round(elapsed * (1 - done) / done, 1)
+    return {
+        "percent": percent,
+        "out_seconds": None if out_seconds is None else round(out_seconds, 3),
+        "duration": None if duration is None else round(duration, 3),
+        "speed": speed,
+        "eta_seconds": eta_seconds,
+    }
+
+
+def publish_progress(label: str, progress: dict) -> None:
+    """
+    Shows the progress of an ffmpeg run in the record of the job running in
+    this process, under "ffmpeg". Does nothing outside of a job.
+    """
+    report_details(ffmpeg={"label": label, **progress})
+
+
+class CombinedProgress:
+    """
+    Adds up the progress of ffmpeg runs that each make part of one output,
+    e.g. chunks rendered in parallel, and publishes it as a single run.
+    """
+
+    def __init__(self, label: str, duration: float):
+        """
+        :param label: what the runs make, shown in the job record.
+        :param duration: the length of the whole output in seconds.
+        """
+        self.label = label
+        self.duration = duration
+        self.start_time = time.monotonic()
+        self.done = {}
+        self.speeds = {}
+        self.last_published = 0.0
+        self.lock = threading.Lock()
+
+    def part(self, key):
+        """
+        Returns the on_progress callback for one of the runs.
+        :param key: anything that tells the runs apart, e.g. the chunk number.
+        """
+        def on_progress(progress: dict) -> None:
+            with self.lock:
+                self.done[key] = progress["out_seconds"] or 0.0
+                finished = progress["percent"] == 100.0
+                if finished:
+                    self.speeds.pop(key, None)
+                elif progress["speed"]:
+                    self.speeds[key] = progress["speed"]
+                now = time.monotonic()
+                if not finished and now - self.last_published < get_progress_interval():
+                    return
+                self.last_published = now
+                out_seconds = min(sum(self.done.values()), self.duration)
+                # Runs going at once add up to a faster overall speed
+                speed = round(sum(self.speeds.values()), 3) or None
+                # Published under the lock, so parallel runs don't overwrite each other's updates
+                publish_progress(self.label, estimate(
+                    out_seconds, self.duration, speed, now - self.start_time))
+        return on_progress
+
+
+def _read_stderr(stream, chunks: list, found: dict) -> None:
+    for line in stream:
+        chunks.append(line)
+        if "duration" not in found:
+            match = DURATION_PATTERN.search(line)
+            if match:
+                hours, minutes, seconds = match.groups()
+                found["duration"] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def run_ffmpeg(command: list, duration: float = None, label: str = None,
+               on_progress=None) -> None:
+    """
+    Runs ffmpeg, publishing its progress, speed and time left as it goes.
+    ffmpeg writes its progress to stdout, so the command must write its output
+    to a file rather than to pipe:1.
+
+        run_ffmpeg(['ffmpeg', '-y', '-i', source, output], duration=60, label="render")
+
+    :param command: the ffmpeg command, starting with 'ffmpeg'.
+    :param duration: expected length of the output in seconds. Without it the
+                     length of the first input ffmpeg reports is used, if any.
+    :param label: what the run is doing, shown in the job record.
+    :param on_progress: called with each progress update instead of publishing
+                        it to the job record, see estimate for what it gets.
+    :raises subprocess.CalledProcessError: if ffmpeg fails, with its stderr.
+    """
+    label = label or os.path.basename(command[-1])
+    on_progress = on_progress or (lambda progress: publish_progress(label, progress))
+    command = command[:1] + ['-progress', 'pipe:1', '-nostats'] + command[1:]
+
+    start_time = time.monotonic()
+    process = subprocess.Popen(command, stdin=subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stderr_chunks, found = [], {}
+    # stderr is drained on its own thread, so ffmpeg never blocks writing to it
+    stderr_reader = threading.Thread(
+        target=_read_stderr, args=(process.stderr, stderr_chunks, found), daemon=True)
+    stderr_reader.start()
+
+    fields, last_published = {}, 0.0
+    for line in process.stdout:
+        key, _, value = line.decode(errors="replace").strip().partition("=")
+        if key != "progress":
+            fields[key] = value
+            continue
+        finished = value == "end"
+        now = time.monotonic()
+        if finished or now - last_published >= get_progress_interval():
+            last_published = now
+            try:
+                on_progress(estimate(parse_out_seconds(fields),
+                                     duration or found.get("duration"),
+                                     parse_speed(fields.get("speed", "N/A")),
+                                     now - start_time, finished))
+            except Exception as e:
+                # Progress is only informative, it must never fail the run
+                print(f"Could not publish ffmpeg progress: {e}", file=sys.stderr)
+        fields = {}
+
+    returncode = process.wait()
+    stderr_reader.join()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(
+            returncode, command, stderr=b"".join(stderr_chunks))
@@ -0,0 +1,311 @@
+import os
+import sys
+import json
+import time
+import uuid
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.workspace import get_workspace_root
+from utils import metrics
+
+# Job records are kept as small JSON files so that every process (the API
+# workers and the pool workers running the jobs) sees the same state.
+JOB_RETENTION_SECONDS = 24 * 60 * 60
+
+_executor = None
+_current_job_id = None
+
+
+def get_max_concurrent_jobs() -> int:
+    """
+    Returns how many jobs may run at once across the whole API, set with
+    MAX_CONCURRENT_JOBS. Defaults to the number of CPU cores.
+    """
+    return int(os.environ.get("MAX_CONCURRENT_JOBS", os.cpu_count() or 1))
+
+
+def get_jobs_per_worker() -> int:
+    """
+    Returns how many jobs the pool of this API process runs at once.
+    Every gunicorn worker has its own pool, so MAX_CONCURRENT_JOBS is shared
+    out between the API_WORKERS of them, with at least one job each.
+    """
+    workers = max(1, int(os.environ.get("API_WORKERS", 1)))
+    return max(1, get_max_concurrent_jobs() // workers)
+
+
+def get_job_folder() -> str:
+    """
+    Returns the folder the job records are stored in, creating it if needed.
+    """
+    folder = os.path.join(get_workspace_root(), "jobs")
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _job_file(job_id: str) -> str:
+    return os.path.join(get_job_folder(), f"{job_id}.json")
+
+
+def _write_job(job: dict) -> None:
+    """
+    Writes a job record, replacing the old one in a single step so that
+    readers never see a half written file.
+    """
+    job_file = _job_file(job["job_id"])
+    temp_file = f"{job_file}.{os.getpid()}.tmp"
+    with open(temp_file, "w") as file:
+        json.dump(job, file)
+    os.replace(temp_file, job_file)
+
+
+def get_job(job_id: str):
+    """
+    Fetches the record of a job.
+    :param job_id: the id returned when the job was submitted.
+    :returns job: the job record, or None if there is no such job.
+    """
+    # Job ids are uuid4 hex strings, reject anything else so ids can't escape the folder
+    if len(job_id) != 32 or not all(c in "0123456789abcdef" for c in job_id):
+        return None
+    try:
+        with open(_job_file(job_id)) as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def update_job(job_id: str, **fields) -> None:
+    """
+    Updates fields of a job record.
+    :param job_id: the job to be updated.
+    :param fields: the fields to be changed, e.g. status="running".
+    """
+    job = get_job(job_id)
+    if job is None:
+        return
+    job.update(fields)
+    job["updated_at"] = time.time()
+    _write_job(job)
+
+
+def report_progress(progress: float, **details) -> None:
+    """
+    Reports the progress of the job running in this process.
+    Does nothing when called outside of a job, so pipelines can call it freely.
+
+    :param progress: how far through the job is, from 0 to 1.
+    :param details: any extra information to show, e.g. stage="render".
+    """
+    if _current_job_id is None:
+        return
+    update_job(_current_job_id, progress=round(min(max(progress, 0.0), 1.0), 4), **details)
+
+
+def report_details(**details) -> None:
+    """
+    Like report_progress, but leaves the progress of the job as it is.
+    :param details: the information to show, e.g. ffmpeg={"percent": 40}.
+    """
+    if _current_job_id is None:
+        return
+    update_job(_current_job_id, **details)
+
+
+def _partial_file(job_id: str) -> str:
+    return os.path.join(get_job_folder(), f"{job_id}.partial.ndjson")
+
+
+def report_partial(*items) -> None:
+    """
+    Publishes part of the result of the job running in this process, so it can
+    be streamed to the client before the job has finished.
+    Does nothing when called outside of a job.
+
+    :param items: JSON serialisable pieces of the result, e.g. transcript segments.
+    """
+    if _current_job_id is None or not items:
+        return
+    # Appending whole lines in one write keeps readers from seeing half an item
+    lines = "".join(json.dumps(item) + "\n" for item in items)
+    with open(_partial_file(_current_job_id), "a") as file:
+        file.write(lines)
+
+
+def read_partial(job_id: str, position: int = 0) -> tuple:
+    """
+    Reads the partial results a job has published since position.
+    :param job_id: the id returned when the job was submitted.
+    :param position: where the last read stopped, 0 to read from the start.
+    :returns items, position: the new items and where to read from next time.
+    """
+    if get_job(job_id) is None:
+        return [], position
+    try:
+        with open(_partial_file(job_id), "rb") as file:
+            file.seek(position)
+            data = file.read()
+    except FileNotFoundError:
+        return [], position
+    # Leave a line that is still being written for the next read
+    complete = data[:data.rfind(b"\n") + 1]
+    items = [json.loads(line) for line in complete.splitlines() if line]
+    return items, position + len(complete)
+
+
+def _init_worker() -> None:
+    """
+    Prepares a newly started pool worker.
+    With WHISPER_WARMUP set, each worker loads and warms up the whisper models
+    before taking its first job, so transcripts don't pay for loading them.
+    """
+    # whisper is only imported by workers that are going to warm it up
+    if "WHISPER_WARMUP" in os.environ:
+        from utils.model_registry import warm_up_from_environment
+        warm_up_from_environment()
+
+
+def _run_job(job_id: str, func, args: tuple) -> None:
+    """
+    Runs a job inside a pool worker and records its outcome.
+    """
+    global _current_job_id
+    _current_job_id = job_id
+    job = get_job(job_id) or {}
+    start_time = time.time()
+    metrics.start_job(job_id, job.get("kind", "unknown"))
+    update_job(job_id, status="running", started_at=start_time)
+    try:
+        result = func(*args)
+    except Exception as e:
+        traceback.print_exc(file=sys.stderr)
+        timings = metrics.finish_job("failed", time.time() - start_time)
+        update_job(job_id, status="failed", error=str(e), finished_at=time.time(),
+                   timings=timings)
+    else:
+        timings = metrics.finish_job("finished", time.time() - start_time)
+        update_job(job_id, status="finished", progress=1.0,
+                   result=result, finished_at=time.time(), timings=timings)
+    finally:
+        _current_job_id = None
+
+
+def prune_jobs(max_age: float = JOB_RETENTION_SECONDS) -> None:
+    """
+    Deletes records of jobs that were last updated more than max_age seconds ago.
+    """
+    folder = get_job_folder()
+    cutoff = time.time() - max_age
+    for file_name in os.listdir(folder):
+        file_path = os.path.join(folder, file_name)
+        try:
+            if os.path.getmtime(file_path) < cutoff:
+                os.remove(file_path)
+        except OSError:
+            pass
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """
+    Returns the process pool that jobs run in, creating it on first use.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=get_jobs_per_worker(), initializer=_init_worker)
+    return _executor
+
+
+def _discard_executor(executor: ProcessPoolExecutor) -> None:
+    """
+    Drops a broken process pool, so the next job gets a new one.
+    """
+    global _executor
+    if _executor is executor:
+        _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _job_done(job_id: str, executor: ProcessPoolExecutor, future) -> None:
+    """
+    Records jobs that never got to report their own outcome as failed, e.g.
+    because their pool worker was killed. Such a pool is broken for good, so
+    it is replaced.
+    """
+    if future.cancelled():
+        update_job(job_id, status="failed", error="Job was cancelled", finished_at=time.time())
+        return
+    error = future.exception()
+    if error is None:
+        return
+    print(f"Job {job_id} failed: {type(error).__name__}: {error}", file=sys.stderr)
+    update_job(job_id, status="failed", error=f"{type(error).__name__}: {error}",
+               finished_at=time.time())
+    if isinstance(error, BrokenProcessPool):
+        _discard_executor(executor)
+
+
+def _new_job(kind: str) -> dict:
+    prune_jobs()
+    now = time.time()
+    return {
+        "job_id": uuid.uuid4().hex,
+        "kind": kind,
+        "status": "queued",
+        "progress": 0.0,
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def submit_job(kind: str, func, *args) -> dict:
+    """
+    Queues a long running function to run in the process pool.
+
+    :param kind: what sort of job this is, e.g. "merge".
+    :param func: a module level function to run, it's result must be JSON serialisable.
+    :param args: the arguments func is called with.
+    :returns job: the new job record, including its job_id.
+    """
+    job = _new_job(kind)
+    _write_job(job)
+    executor = get_executor()
+    try:
+        future = executor.submit(_run_job, job["job_id"], func, args)
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        executor = get_executor()
+        future = executor.submit(_run_job, job["job_id"], func, args)
+    future.add_done_callback(lambda done: _job_done(job["job_id"], executor, done))
+    return job
+
+
+def submit_cached_job(kind: str, cached_result, func, *args) -> dict:
+    """
+    Like submit_job, but first asks cached_result(*args) for the result of an
+    earlier identical run. If there is one, the job is recorded as finished
+    straight away instead of being queued.
+
+    :param kind: what sort of job this is, e.g. "merge".
+    :param cached_result: function returning the cached result, or None on a miss.
+    :param func: a module level function to run on a miss.
+    :param args: the arguments both functions are called with.
+    :returns job: the job record, including its job_id.
+    """
+    try:
+        result = cached_result(*args)
+    except Exception as e:
+        print(f"Result cache lookup failed: {e}", file=sys.stderr)
+        result = None
+    if result is None:
+        return submit_job(kind, func, *args)
+
+    job = _new_job(kind)
+    job.update(status="finished", progress=1.0, result=result,
+               cached=True, finished_at=job["created_at"])
+    _write_job(job)
+    return job
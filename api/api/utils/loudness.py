@@ -0,0 +1,195 @@
+import numpy as np
+
+from utils.pcm_stream import stream_pcm
+from utils.probe import probe_media
+
+# K-weighting is defined for 48kHz, the filters are recalculated for other rates.
+# Used when analysing blocks whose rate isn't given.
+ANALYSIS_RATE = 48_000
+# The K-weighting filters have died away well within this, so their impulse
+# response is cut here and applied as an FIR filter with FFTs
+IMPULSE_SECONDS = 0.25
+
+HOP_SECONDS = 0.1
+MOMENTARY_HOPS = 4    # 400ms gating blocks, overlapping by 75%
+SHORT_TERM_HOPS = 30  # 3s short-term blocks
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+RANGE_RELATIVE_GATE_LU = -20.0
+
+
+def _db(value):
+    """
+    Converts an amplitude ratio to dB, None for silence so reports stay JSON friendly.
+    """
+    return None if value <= 0 else round(float(20 * np.log10(value)), 2)
+
+
+def _lufs(mean_square):
+    return -0.691 + 10 * np.log10(np.maximum(mean_square, 1e-20))
+
+
+def k_weighting(sample_rate: int) -> list:
+    """
+    Returns the two K-weighting biquads of ITU-R BS.1770 for a sample rate,
+    the high shelf modelling the head followed by the high pass.
+    :returns filters: list of (b, a) coefficient arrays.
+    """
+    k = np.tan(np.pi * 1681.974450955533 / sample_rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = (np.array([vh + vb * k / q + k * k, 2 * (k * k - vh), vh - vb * k / q + k * k]) / a0,
+             np.array([1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]))
+
+    k = np.tan(np.pi * 38.13547087602444 / sample_rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    high_pass = (np.array([1.0, -2.0, 1.0]),
+                 np.array([1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]))
+    return [shelf, high_pass]
+
+
+def k_weighting_response(sample_rate: int):
+    """
+    Returns the impulse response of the K-weighting filters, worked out from
+    their frequency response so no sample by sample filtering is needed.
+    """
+    size = 1 << int(np.ceil(np.log2(IMPULSE_SECONDS * sample_rate)))
+    delay = np.exp(-1j * np.pi * np.arange(size // 2 + 1) / (size // 2))
+    response = np.ones(size // 2 + 1, dtype=np.complex128)
+    for b, a in k_weighting(sample_rate):
+        response *= np.polyval(b[::-1], delay) / np.polyval(a[::-1], delay)
+    return np.fft.irfft(response, size)
+
+
+def _gated_mean(powers, relative_gate: float):
+    """
+    Applies the absolute and relative gates of BS.1770 to the mean square of
+    each block, returning the ones that pass.
+    """
+    powers = powers[_lufs(powers) > ABSOLUTE_GATE_LUFS]
+    if len(powers) == 0:
+        return powers
+    return powers[_lufs(powers) > _lufs(powers.mean()) + relative_gate]
+
+
+def _loudness(hop_energy, hop_size: int) -> dict:
+    """
+    Measures loudness from the K-weighted energy of each 100ms hop.
+    :param hop_energy: array of (hops, channels) summed squares, every channel is weighted 1.
+    :returns loudness: integrated and highest short-term loudness in LUFS, and the loudness range in LU.
+    """
+    energy = hop_energy.sum(axis=1)
+    cumulative = np.concatenate(([0.0], np.cumsum(energy)))
+
+    def blocks(hops):
+        if len(energy) < hops:
+            return np.zeros(0)
+        return (cumulative[hops:] - cumulative[:-hops]) / (hops * hop_size)
+
+    momentary = _gated_mean(blocks(MOMENTARY_HOPS), RELATIVE_GATE_LU)
+    short_term = blocks(SHORT_TERM_HOPS)
+    ranged = _gated_mean(short_term, RANGE_RELATIVE_GATE_LU)
+    return {
+        "integrated_lufs": round(float(_lufs(momentary.mean())), 2) if len(momentary) else None,
+        "short_term_max_lufs": (round(float(_lufs(short_term.max())), 2)
+                                if len(short_term) and _lufs(short_term.max()) > ABSOLUTE_GATE_LUFS
+                                else None),
+        "loudness_range": (round(float(np.subtract(*np.percentile(_lufs(ranged), [95, 10]))), 2)
+                           if len(ranged) else None),
+    }
+
+
+def analyse_blocks(blocks, sample_rate: int = ANALYSIS_RATE) -> dict:
+    """
+    Measures the levels and loudness of audio in one pass over its blocks,
+    holding only one block and the energy of each 100ms in memory.
+
+    :param blocks: iterable of float sample arrays, (samples,) or (samples, channels).
+    :param sample_rate: rate of the samples.
+    :returns report: for every channel and for all of them together, peak_db,
+                     rms_db and crest_db (peak over RMS), integrated_lufs,
+                     short_term_max_lufs and loudness_range (EBU R128), plus the
+                     duration in seconds. Levels that don't exist in silence are None.
+    """
+    impulse = k_weighting_response(sample_rate)
+    hop_size = round(HOP_SECONDS * sample_rate)
+    history = peaks = squares = None
+    hop_energy, partial = [], None
+    sample_count = 0
+    impulse_spectra = {}
+
+    for block in blocks:
+        block = np.asarray(block, dtype=np.float64)
+        if block.ndim == 1:
+            block = block[:, np.newaxis]
+        if len(block) == 0:
+            continue
+        if history is None:
+            channels = block.shape[1]
+            history = np.zeros((len(impulse) - 1, channels))
+            peaks, squares = np.zeros(channels), np.zeros(channels)
+            partial = np.zeros((0, channels))
+        sample_count += len(block)
+        peaks = np.maximum(peaks, np.abs(block).max(axis=0))
+        squares += np.square(block).sum(axis=0)
+
+        # Overlap-save: the end of the last block primes the filter for this one
+        extended = np.concatenate((history, block))
+        size = 1 << int(np.ceil(np.log2(len(extended))))
+        if size not in impulse_spectra:
+            impulse_spectra[size] = np.fft.rfft(impulse, size)[:, np.newaxis]
+        spectrum = np.fft.rfft(extended, size, axis=0) * impulse_spectra[size]
+        weighted = np.fft.irfft(spectrum, size, axis=0)[len(history):len(extended)]
+        history = extended[len(extended) - len(history):]
+
+        weighted = np.concatenate((partial, np.square(weighted)))
+        complete = len(weighted) - len(weighted) % hop_size
+        hop_energy.append(weighted[:complete].reshape(-1, hop_size, weighted.shape[1]).sum(axis=1))
+        partial = weighted[complete:]
+
+    if sample_count == 0:
+        return {"duration": 0.0, "channels": [], "peak_db": None, "rms_db": None,
+                "crest_db": None, "integrated_lufs": None, "short_term_max_lufs": None,
+                "loudness_range": None}
+
+    hop_energy = np.concatenate(hop_energy)
+
+    def levels(peak, mean_square, energy):
+        peak_db, rms_db = _db(peak), _db(np.sqrt(mean_square))
+        return {
+            "peak_db": peak_db,
+            "rms_db": rms_db,
+            "crest_db": None if peak_db is None else round(peak_db - rms_db, 2),
+            **_loudness(energy, hop_size),
+        }
+
+    report = {
+        "duration": round(sample_count / sample_rate, 3),
+        "channels": [levels(peaks[i], squares[i] / sample_count, hop_energy[:, i:i + 1])
+                     for i in range(len(peaks))],
+    }
+    report.update(levels(peaks.max(), squares.sum() / (sample_count * len(peaks)), hop_energy))
+    return report
+
+
+def analyse_file(audio_file: str, channels: int = None, sample_rate: int = None) -> dict:
+    """
+    Measures the levels and loudness of an audio (or video) file, see analyse_blocks.
+    The audio is decoded in its own layout and at its own rate by default, as
+    upmixing a mono recording would measure it 3dB quieter than it is, and
+    resampling moves its peaks.
+    :param audio_file: path of the file.
+    :param channels: number of channels to decode to, instead of the file's own.
+    :param sample_rate: rate to decode at, instead of the file's own.
+    :raises ValueError: if the file has no audio.
+    """
+    if channels is None or sample_rate is None:
+        audio = probe_media(audio_file)["audio"]
+        if audio is None:
+            raise ValueError(f"{audio_file} has no audio")
+        channels = channels or int(audio.get("channels", 2))
+        sample_rate = sample_rate or int(audio.get("sample_rate", ANALYSIS_RATE))
+    return analyse_blocks(stream_pcm(audio_file, sample_rate, channels=channels), sample_rate)
@@ -1,5 +1,5 @@
 import subprocess
-import re
+import json
 import os
 import time
 import sys
@@ -7,8 +7,19 @@ import sys
 
 import numpy as np
 
-from utils.editingUtils import read_file_to_array
+from utils.pcm_stream import windowed_abs_sums
+from utils.sync import (
+    estimate_offsets, confident_offsets, get_max_offset_seconds, get_min_confidence)
+from utils.silence import detect_silence, ranges_to_timestamps, get_silence_settings
+from utils.edl import EditDecisionList, render, render_video, get_min_shot_seconds
 from utils.minioUtils import create_s3_client, upload_to_s3
+from utils.transfer import list_objects, build_manifest, download_manifest
+from utils import result_cache
+from utils.workspace import job_workspace
+from utils.pcm_cache import pcm_cache
+from utils.jobs import report_progress
+from utils.metrics import span
+from utils.ffmpeg_runner import run_ffmpeg
 
 s3_client = create_s3_client(
     os.environ["MINIO_ENDPOINT"],
@@ -37,97 +48,54 @@ def wait_for_file(file_path, timeout=60):
     return True
 
 
-def retrieve_files_general(bucket_name, prefix) -> None:
-    """
-    Retrieves all video and audio files for general shots (i.e. the wide shot etc.)
-    """
-
-    files = s3_client.list_objects_v2(
-        Bucket=bucket_name, Prefix=prefix)['Contents']
-
-    for file in files:
-        # Handle video (mp4) files
-        if file['Key'].lower().endswith(".mp4"):
-            download_file_path = "wide_shot.mp4"
-            s3_client.download_file(
-                bucket_name, file['Key'], download_file_path)
-            wait_for_file(download_file_path)
-            print(f"Downloaded: {file['Key']}", file=sys.stderr)
-
-        # Handle audio (wav) files
-        if file['Key'].lower().endswith(".wav"):
-            download_file_path = "wide_shot.wav"
-            s3_client.download_file(
-                bucket_name, file['Key'], download_file_path)
-            wait_for_file(download_file_path)
-            print(f"Downloaded: {file['Key']}", file=sys.stderr)
-
-
-def retrieve_files_participant(bucket_name, prefix, counter) -> None:
-    """
-    Retrieves all video and audio files for the participant
-    """
-
-    files = s3_client.list_objects_v2(
-        Bucket=bucket_name, Prefix=prefix)['Contents']
-
-    for file in files:
-        # Handle video (mp4) files
-        if file['Key'].lower().endswith(".mp4"):
-            # Download the file
-            download_file_path = f"camera{counter}.mp4"
-            s3_client.download_file(
-                bucket_name, file['Key'], download_file_path)
-            wait_for_file(download_file_path)
-            print(f"Downloaded: {file['Key']}", file=sys.stderr)
-
-        # Handle audio (wav) files
-        if file['Key'].lower().endswith(".wav"):
-            # Download the file
-            download_file_path = f"mic{counter}.wav"
-            s3_client.download_file(
-                bucket_name, file['Key'], download_file_path)
-            wait_for_file(download_file_path)
-            print(f"Downloaded: {file['Key']}", file=sys.stderr)
-
-
-def retrieve_files(bucket_name) -> bool:
+def retrieve_files(bucket_name, workspace):
     """
     Takes in a minio bucket and retrieves the files required to be merged.
-    Follows a different pipeline based on whether we want the 'general' files, 
-    or the files for a specific participant 
+    The bucket is listed once and every general and participant file is
+    downloaded exactly once, several at a time.
 
     :param bucket_name: the minio bucket the files have to be retrieved from.
-    :returns success: boolean indicating whether we successfully retrieved the files
+    :param workspace: the job workspace the files are downloaded into.
+    :returns stats: the download stats (files, bytes, seconds, bytes_per_second),
+                    or None if the files couldn't be retrieved.
     """
 
     try:
-        # List all objects in the bucket
-        objects = s3_client.list_objects(Bucket=bucket_name)['Contents']
+        manifest = build_manifest(list_objects(s3_client, bucket_name))
+        return download_manifest(s3_client, bucket_name, manifest, workspace)
 
-        # Loop through all MinIO objects that were fetched
-        participant_counter = 1
-        for obj in objects:
-            # Define two options for prefix
-            general_prefix = "general/"
-            participant_prefix = f"participant-{participant_counter}/"
-
-            file_key = obj['Key']
+    except BaseException as e:
+        print(f"Credentials not available: {e}", file=sys.stderr)
+        return None
 
-            if file_key.startswith(general_prefix):
-                retrieve_files_general(
-                    bucket_name=bucket_name, prefix=general_prefix)
 
-            elif file_key.startswith(participant_prefix):
-                retrieve_files_participant(
-                    bucket_name=bucket_name, prefix=participant_prefix, counter=participant_counter)
-                participant_counter += 1
+def merge_cache_key(bucket_name):
+    """
+    Builds the result cache digest of merging a project.
+    The transitions only depend on the source media and the analysis settings,
+    so those are what the digest covers.
+    :param bucket_name: the minio bucket containing the project files.
+    :returns digest, inputs: the digest, and the ETag of each source file.
+    """
+    manifest = build_manifest(list_objects(s3_client, bucket_name))
+    inputs = {obj['Key']: obj['ETag'] for obj in manifest.values()}
+    params = {"window_seconds": 1.0, "sample_rate": 8_000,
+              "min_shot_seconds": get_min_shot_seconds(),
+              "sync_max_offset_seconds": get_max_offset_seconds(),
+              "sync_min_confidence": get_min_confidence(),
+              "silence": get_silence_settings()}
+    return result_cache.cache_key("merge", inputs, params), inputs
 
-        return True
 
-    except BaseException as e:
-        print(f"Credentials not available: {e}", file=sys.stderr)
-        return False
+def cached_result(bucket_name):
+    """
+    Returns the response of an earlier merge of the same media, or None if there wasn't one.
+    :param bucket_name: the minio bucket containing the project files.
+    """
+    digest, _ = merge_cache_key(bucket_name)
+    if result_cache.lookup(s3_client, bucket_name, digest):
+        return generate_response('final_podcast.mp4', bucket_name)
+    return None
 
 
 def generate_response(final_output, bucket_name):
@@ -146,8 +114,8 @@ def generate_response(final_output, bucket_name):
             (final_output))}
 
 
-def merge_and_isolate_microphones(audio_file1, audio_file2):
-    merged_output = 'merged_output.wav'
+def merge_and_isolate_microphones(audio_file1, audio_file2, output_dir=os.curdir):
+    merged_output = os.path.join(output_dir, 'merged_output.wav')
     command_merge = [
         'ffmpeg',
         '-y',
@@ -157,13 +125,12 @@ def merge_and_isolate_microphones(audio_file1, audio_file2):
         '-map', '[aout]',
         merged_output
     ]
-    subprocess.run(command_merge, check=True,
-                   stderr=subprocess.STDOUT, stdout=subprocess.DEVNULL)
+    run_ffmpeg(command_merge, label="merge microphones")
     print(f"Merged audio streams into {merged_output}", file=sys.stderr)
 
     # Step 2: Apply Audio Panning to Isolate Each Microphone
-    isolated_output1 = 'microphone1_isolated.wav'
-    isolated_output2 = 'microphone2_isolated.wav'
+    isolated_output1 = os.path.join(output_dir, 'microphone1_isolated.wav')
+    isolated_output2 = os.path.join(output_dir, 'microphone2_isolated.wav')
     command_isolate = [
         'ffmpeg',
         '-y',
@@ -172,150 +139,144 @@ def merge_and_isolate_microphones(audio_file1, audio_file2):
         '-map', '[left]', isolated_output1,
         '-map', '[right]', isolated_output2
     ]
-    subprocess.run(command_isolate, check=True,
-                   stderr=subprocess.STDOUT, stdout=subprocess.DEVNULL)
+    run_ffmpeg(command_isolate, label="isolate microphones")
     print(
         f"Isolated audio streams into {isolated_output1} and {isolated_output2}", file=sys.stderr)
 
     return isolated_output1, isolated_output2
 
 
-def choose_highest_sounds(audio_files):
-    # Assume 8KHz sample rate (whatever is used in read_file_to_array)
-    sample_rate = 8_000
-    audio_arrays = []
-    transitions = []
+def choose_highest_sounds(audio_files, window_seconds=1.0, sample_rate=8_000, offsets=None):
+    """
+    Decides which shot to show for every window of the podcast, based on which
+    speaker is loudest. Each file is streamed through ffmpeg in fixed size blocks,
+    so memory use doesn't depend on how long the podcast is.
+
+    :param audio_files: dict of shot to audio file. Every shot but "wide" is a
+                        speaker, the wide shot only limits the length of the output.
+    :param window_seconds: length of each decision window, can be below one second.
+    :param sample_rate: rate the audio is analysed at.
+    :param offsets: dict of shot to seconds its recording is shifted by, see sync.estimate_offsets.
+    :returns transitions: list of (start, end, shot) tuples, one per window.
+    """
+    shots = list(audio_files)
+    speakers = [i for i, shot in enumerate(shots) if shot != "wide"]
+    window_size = max(1, round(window_seconds * sample_rate))
+    window_seconds = window_size / sample_rate
+    window_sums = []
+    peaks = []
+
+    for name, audio_file in audio_files.items():
+        sums, peak, _ = windowed_abs_sums(audio_file, window_size, sample_rate)
+        # Line the windows up with the other recordings, to the nearest window
+        shift = round((offsets or {}).get(name, 0) / window_seconds)
+        sums = sums[shift:] if shift >= 0 else np.concatenate((np.zeros(-shift), sums))
+        window_sums.append(sums)
+        # a silent file has no peak, avoid dividing by zero
+        peaks.append(peak if peak > 0 else 1.0)
+
+    # Only complete windows present in every file are used, so the end of
+    # longer files is trimmed off. We don't care about the volume of the wide shot.
+    new_size = min(len(sums) for sums in window_sums)
+
+    # Average normalised volume of each window (+1 as before, in case a file is silent)
+    average_volume = np.array([window_sums[i][:new_size] / window_size / peaks[i] + 1
+                               for i in speakers]).reshape(len(speakers), new_size)
+    loudest_volume = (average_volume.max(axis=0) if speakers else np.zeros(new_size))
+    loudest_speaker = average_volume.argmax(axis=0) if speakers else None
 
-    for audio_file in audio_files.values():
-        audio_array = read_file_to_array(audio_file, sample_rate)
-        # add 1 in case an audio file is silent
-        audio_arrays.append(np.abs(audio_array) / np.max(audio_array) + 1)
-
-    # Take the sum of the volume at every sample in a second
-    # This takes a 1D array representing an audio file from size N to size N/sample_rate
-    # Have to trim off some of the end of some of the arrays as a result - sorry!
-    # We also don't care about what this is for the wide shot, so take first two
-
-    new_size = min(len(audio_array)
-                   for audio_array in audio_arrays) // sample_rate
-    audio_array_average_volume_seconds = np.array([audio_array[:new_size * sample_rate]
-                                                   .reshape((new_size, sample_rate))
-                                                   .sum(axis=1) / sample_rate
-                                                   for audio_array in audio_arrays[:2]])
     threshold_average = 0.02
+    transitions = []
     for i in range(new_size):
+        start = round(i * window_seconds, 6)
+        end = round((i + 1) * window_seconds, 6)
         # use wide shot if neither audio surpasses an average value
-        # of 2% volume over the second
-        if np.max(audio_array_average_volume_seconds[:, i]) < threshold_average:
-            transitions.append(
-                (i, i+1, "wide"))
+        # of 2% volume over the window
+        if loudest_volume[i] < threshold_average:
+            transitions.append((start, end, "wide"))
         else:
-            transitions.append(
-                (i, i+1, f'speaker{np.argmax(audio_array_average_volume_seconds[:, i]) + 1}'))
+            transitions.append((start, end, shots[speakers[loudest_speaker[i]]]))
 
     return transitions
 
 
 def find_silence_periods(audio_file, speaker_name):
-    command = [
-        'ffmpeg',
-        '-y',
-        '-i', audio_file,
-        '-af', 'volumedetect',
-        '-vn',
-        '-sn',
-        '-dn',
-        '-f', 'null',
-        '-'
-    ]
-    result = subprocess.run(
-        command, text=True, stderr=subprocess.STDOUT, stdout=subprocess.DEVNULL)
-    output = result.stderr
+    """
+    Finds the dead sections of an audio file, see silence.detect_silence.
 
-    # Parse the output to find silence periods
-    pattern = r'silence_(start|end): (\d+\.\d+)'
-    matches = re.findall(pattern, output)
+    :param audio_file: path of the audio file.
+    :param speaker_name: the shot the sections are labelled with.
+    :returns transitions: list of (start, end, speaker_name) tuples.
+    """
+    return [(start, end, speaker_name) for start, end in detect_silence(audio_file)]
 
-    # Convert matches to a list of start/end times
-    transitions = []
-    for i in range(0, len(matches), 2):
-        start, end = float(matches[i][1]), float(matches[i + 1][1])
-        transitions.append((start, end, speaker_name))
-    return transitions
+
+def upload_dead_sections(audio_file, bucket_name, workspace):
+    """
+    Finds the dead sections of the merged podcast and uploads them as
+    final-product/dead_sections.json, for the export to remove.
+
+    :param audio_file: the merged audio.
+    :param bucket_name: the bucket to upload to.
+    :param workspace: the job workspace the file is written in.
+    :returns success: whether the upload completed.
+    """
+    dead_sections_path = workspace.path('dead_sections.json')
+    with open(dead_sections_path, 'w') as file:
+        json.dump(ranges_to_timestamps(detect_silence(audio_file)), file)
+    return upload_to_s3(s3_client, dead_sections_path, bucket_name)
 
 
 def process_video_segments(video_files, transitions, video_output, offsets):
-    filter_complex = []
-    inputs = []
-    for i, (start, end, speaker) in enumerate(transitions):
-        inputs += ['-i', video_files[speaker]]
-        # Adjust start time by offset
-        start_offset = start + offsets.get(speaker, 0)
-        if end is None:
-            filter_complex.append(
-                f"[{i}:v]trim=start={start_offset},setpts=PTS-STARTPTS[v{i}];")
-        else:
-            filter_complex.append(
-                f"[{i}:v]trim=start={start_offset}:end={end},setpts=PTS-STARTPTS[v{i}];")
-
-    if len(transitions) > 0:
-        filter_complex.append(
-            ''.join(
-                f"[v{i}]" for i in range(
-                    len(transitions))) +
-            f"concat=n={len(transitions)}:v=1:a=0[outv]")
-    filter_complex_string = ''.join(filter_complex)
-
-    command = ['ffmpeg', '-y'] + inputs + ['-filter_complex',
-                                           filter_complex_string, '-map', '[outv]', video_output]
+    """
+    Cuts between the video files following the transitions.
+    Each file is opened once however many times it is cut to, and the
+    video is encoded in chunks in parallel, see edl.render_video.
+
+    :param video_files: dict of source to video file.
+    :param transitions: list of (start, end, source) tuples, or an EditDecisionList.
+    :param video_output: path of the rendered video.
+    :param offsets: dict of source to seconds it is shifted by.
+    :raises subprocess.CalledProcessError: if ffmpeg fails.
+    """
+    edl = EditDecisionList.from_transitions(transitions)
     try:
-        subprocess.run(command, check=True,
-                       stderr=subprocess.STDOUT, stdout=subprocess.DEVNULL)
+        render_video(edl, video_files, video_output, offsets)
         print(
             f"Processed video segments are merged into {video_output}", file=sys.stderr)
     except subprocess.CalledProcessError as e:
         print(
             f"An error occurred while processing video segments: {e}", file=sys.stderr)
+        raise
 
 
 def align_and_merge_audio(audio_files, transitions, audio_output, offsets):
-    filter_complex = []
-    inputs = []
-
-    # Loop through each speaker 'switch' / transition
-    for i, (start, end, speaker) in enumerate(transitions):
-        inputs += ['-i', audio_files[speaker]]
-        # Adjust start time by offset
-        start_offset = start + offsets.get(speaker, 0)
-        if end is None:
-            filter_complex.append(
-                f"[{i}:a]atrim=start={start_offset},asetpts=PTS-STARTPTS[a{i}];")
-        else:
-            filter_complex.append(
-                f"[{i}:a]atrim=start={start_offset}:end={end},asetpts=PTS-STARTPTS[a{i}];")
-
-    if len(transitions) > 0:
-        filter_complex.append(
-            ''.join(
-                f"[a{i}]" for i in range(
-                    len(transitions))) +
-            f"concat=n={len(transitions)}:v=0:a=1[outa]")
-
-    filter_complex_string = ''.join(filter_complex)
-
-    command = ['ffmpeg', '-y'] + inputs + ['-filter_complex',
-                                           filter_complex_string, '-map', '[outa]', audio_output]
+    """
+    Cuts between the audio files following the transitions.
+    Each file is opened once however many times it is cut to.
+
+    :param audio_files: dict of source to audio file.
+    :param transitions: list of (start, end, source) tuples, or an EditDecisionList.
+    :param audio_output: path of the rendered audio.
+    :param offsets: dict of source to seconds it is shifted by.
+    :raises subprocess.CalledProcessError: if ffmpeg fails.
+    """
+    edl = EditDecisionList.from_transitions(transitions)
     try:
-        subprocess.run(command, check=True,
-                       stderr=subprocess.STDOUT, stdout=subprocess.DEVNULL)
+        render(edl, audio_files, "a", audio_output, offsets)
         print(
             f"Processed audio segments merged into {audio_output}", file=sys.stderr)
     except subprocess.CalledProcessError as e:
         print(
             f"An error occurred while processing audio segments: {e}", file=sys.stderr)
+        raise
 
 
 def attach_audio_to_video(video_output, audio_output, final_output):
+    """
+    Muxes the rendered audio onto the rendered video, copying the video.
+    :raises subprocess.CalledProcessError: if ffmpeg fails.
+    """
     command = [
         'ffmpeg',
         '-y',
@@ -327,28 +288,33 @@ def attach_audio_to_video(video_output, audio_output, final_output):
         final_output
     ]
     try:
-        subprocess.run(command, check=True,
-                       stderr=subprocess.STDOUT, stdout=subprocess.DEVNULL)
+        # The length of the video is read from ffmpeg's own output
+        run_ffmpeg(command, label="attach audio")
         print(
             f"Final output with synchronized audio and video is available at {final_output}",
             file=sys.stderr)
     except subprocess.CalledProcessError as e:
         print(
             f"An error occurred while attaching audio to video: {e}", file=sys.stderr)
+        raise
 
 
-def clear_up_api_folder():
+def clear_up_api_folder(folder=os.curdir):
     """
-    Method that clears the main api fodler with any leftover files
+    Method that clears a folder of any leftover files
     from a previous processing session that has been interrupted
     It removes audio and video files liested in both extension arrays
+    Jobs run in their own workspace (see utils.workspace), so this is only
+    needed for folders that are shared between sessions.
+
+    :param folder: the folder to clear, defaults to the current directory.
     """
-    files = os.listdir(os.curdir)
+    files = os.listdir(folder)
     video_extensions = ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv']
     audio_extensions = ['.mp3', '.wav', '.ogg', '.aac', '.flac', '.wma']
 
     for file_name in files:
-        file_path = os.path.join(os.curdir, file_name)
+        file_path = os.path.join(folder, file_name)
 
         if any(file_name.lower().endswith(ext) for ext in video_extensions) \
                 or any(file_name.lower().endswith(ext) for ext in audio_extensions):
@@ -361,41 +327,87 @@ def clear_up_api_folder():
 
 
 def main(bucket_name):
+    """
+    Retrieves the project files, merges them into one podcast and uploads it.
+    Everything is done inside a workspace owned by this job, so several
+    projects can be merged at the same time.
 
-    audio_files = {
-        'speaker1': 'mic1.wav',
-        'speaker2': 'mic2.wav',
-        'wide': 'wide_shot.wav'}
-    video_files = {
-        'speaker1': 'camera1.mp4',
-        'speaker2': 'camera2.mp4',
-        'wide': 'wide_shot.mp4'}
-
-    clear_up_api_folder()
-    try:
-        if not retrieve_files(bucket_name):
-            return {"Error": "Files not retrieved"}
-
-        offsets = {}
-
-        transitions = choose_highest_sounds(audio_files)
-
-        video_output = 'processed_video.mp4'
-        audio_output = 'merged_audio.wav'
-        final_output = 'final_podcast.mp4'
-
-        process_video_segments(video_files, transitions, video_output, offsets)
-        align_and_merge_audio(audio_files, transitions, audio_output, offsets)
-        attach_audio_to_video(video_output, audio_output, final_output)
-
-        upload_to_s3(s3_client, final_output, bucket_name)
-
-    except Exception as e:
-        print(e, file=sys.stderr)
-        final_output = 'final_podcast.mp4'
-        os.rename('camera1.mp4', final_output)
-        upload_to_s3(s3_client, final_output, bucket_name)
-        os.remove(final_output)
-        clear_up_api_folder()
+    :param bucket_name: the minio bucket containing the project files.
+    """
+    final_output = 'final_podcast.mp4'
+
+    digest, inputs = merge_cache_key(bucket_name)
+    if result_cache.lookup(s3_client, bucket_name, digest):
+        return generate_response(final_output, bucket_name)
+
+    # The microphones are analysed by sync, choose_shots and silence, but only decoded once
+    with job_workspace(bucket_name) as workspace, pcm_cache(workspace.path("pcm")):
+        audio_files = {
+            'speaker1': workspace.path('mic1.wav'),
+            'speaker2': workspace.path('mic2.wav'),
+            'wide': workspace.path('wide_shot.wav')}
+        video_files = {
+            'speaker1': workspace.path('camera1.mp4'),
+            'speaker2': workspace.path('camera2.mp4'),
+            'wide': workspace.path('wide_shot.mp4')}
+        final_output_path = workspace.path(final_output)
+
+        try:
+            report_progress(0.0, stage="download")
+            with span("merge", "download") as details:
+                download_stats = retrieve_files(bucket_name, workspace)
+                details.update(download_stats or {})
+            if download_stats is None:
+                return {"Error": "Files not retrieved"}
+
+            report_progress(0.2, stage="analyse", download=download_stats)
+
+            # Each camera is shifted by the offset of the microphone recorded with it
+            with span("merge", "sync"):
+                try:
+                    sync_estimates = estimate_offsets(audio_files, reference='wide')
+                except subprocess.CalledProcessError as e:
+                    print(f"Could not sync the recordings, using them as they are: {e}",
+                          file=sys.stderr)
+                    sync_estimates = {}
+            offsets = confident_offsets(sync_estimates)
+            report_progress(0.25, stage="analyse", sync=sync_estimates)
+
+            with span("merge", "choose_shots") as details:
+                transitions = choose_highest_sounds(audio_files, offsets=offsets)
+                # One edit per shot rather than per second. The audio follows whoever
+                # is loudest, only the video leaves out very short shots so it doesn't flick
+                audio_edl = EditDecisionList.from_transitions(transitions).merge_runs()
+                video_edl = audio_edl.absorb_short(get_min_shot_seconds())
+                details.update(edits=len(video_edl), audio_edits=len(audio_edl))
+
+            video_output = workspace.path('processed_video.mp4')
+            audio_output = workspace.path('merged_audio.wav')
+
+            report_progress(0.3, stage="render")
+            with span("merge", "render_video", uses_ffmpeg=True):
+                process_video_segments(video_files, video_edl, video_output, offsets)
+            with span("merge", "render_audio", uses_ffmpeg=True):
+                align_and_merge_audio(audio_files, audio_edl, audio_output, offsets)
+            with span("merge", "attach_audio", uses_ffmpeg=True):
+                attach_audio_to_video(video_output, audio_output, final_output_path)
+
+            report_progress(0.85, stage="silence")
+            with span("merge", "silence"):
+                dead_sections_uploaded = upload_dead_sections(audio_output, bucket_name, workspace)
+
+            report_progress(0.9, stage="upload")
+            with span("merge", "upload"):
+                uploaded = upload_to_s3(s3_client, final_output_path, bucket_name)
+            # The dead sections belong to this podcast, a hit has to put both back
+            if uploaded and dead_sections_uploaded:
+                result_cache.store(s3_client, bucket_name, digest, "merge", inputs,
+                                   f"final-product/{final_output}",
+                                   ["final-product/dead_sections.json"])
+
+        except Exception as e:
+            print(e, file=sys.stderr)
+            os.replace(video_files['speaker1'], final_output_path)
+            upload_to_s3(s3_client, final_output_path, bucket_name)
 
     return generate_response(final_output, bucket_name)
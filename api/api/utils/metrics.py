@@ -0,0 +1,148 @@
+import os
+import sys
+import json
+import time
+import shutil
+import subprocess
+from contextlib import contextmanager
+
+from utils.workspace import get_workspace_root
+
+# Jobs run in pool worker processes and the API may run several gunicorn
+# workers, so metrics are shared through files in PROMETHEUS_MULTIPROC_DIR.
+# It has to be set before prometheus_client is imported.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(get_workspace_root(), "metrics"))
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+import ffmpeg  # noqa: E402
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess)
+
+# Media stages take anywhere from a fraction of a second to over an hour
+STAGE_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds", "Time spent in each stage of a pipeline",
+    ["pipeline", "stage"], buckets=STAGE_BUCKETS)
+STAGE_FAILURES = Counter(
+    "pipeline_stage_failures_total", "Stages that raised an exception",
+    ["pipeline", "stage"])
+FFMPEG_EXITS = Counter(
+    "ffmpeg_exits_total", "Exit codes of the ffmpeg runs in each stage",
+    ["pipeline", "stage", "returncode"])
+TRANSFER_BYTES = Counter(
+    "transfer_bytes_total", "Bytes moved to and from MinIO", ["direction"])
+TRANSFER_SECONDS = Histogram(
+    "transfer_seconds", "Time spent moving files to and from MinIO",
+    ["direction"], buckets=STAGE_BUCKETS)
+JOB_SECONDS = Histogram(
+    "job_seconds", "Time jobs take to run", ["kind", "status"], buckets=STAGE_BUCKETS)
+
+_current_job = None
+_job_timings = []
+
+
+def clear_metrics_dir() -> None:
+    """
+    Deletes the metrics of earlier runs. Call once when the API starts, before
+    any worker has recorded anything.
+    """
+    folder = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder, exist_ok=True)
+
+
+def generate_metrics() -> bytes:
+    """
+    Returns the metrics of every process in the Prometheus text format.
+    """
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def log_event(event: str, **fields) -> None:
+    """
+    Writes a structured log line, one JSON object per line.
+    """
+    print(json.dumps({"event": event, "time": time.time(), **fields}, default=str),
+          file=sys.stderr)
+
+
+def start_job(job_id: str, kind: str) -> None:
+    """
+    Starts collecting the timings of the job running in this process.
+    """
+    global _current_job
+    _current_job = {"job_id": job_id, "kind": kind}
+    _job_timings.clear()
+
+
+def finish_job(status: str, seconds: float) -> list:
+    """
+    Records how long the job running in this process took and logs its timings.
+    :param status: "finished" or "failed".
+    :param seconds: how long the job ran.
+    :returns timings: the spans the job went through, in order.
+    """
+    global _current_job
+    job, timings = _current_job or {}, list(_job_timings)
+    JOB_SECONDS.labels(job.get("kind", "unknown"), status).observe(seconds)
+    log_event("job", **job, status=status, seconds=round(seconds, 3), stages=timings)
+    _current_job = None
+    _job_timings.clear()
+    return timings
+
+
+def record_transfer(direction: str, size: int, seconds: float) -> None:
+    """
+    Records a transfer to or from MinIO.
+    :param direction: "download" or "upload".
+    """
+    TRANSFER_BYTES.labels(direction).inc(size)
+    TRANSFER_SECONDS.labels(direction).observe(seconds)
+
+
+@contextmanager
+def span(pipeline: str, stage: str, uses_ffmpeg: bool = False):
+    """
+    Times a stage of a pipeline, recording it in the stage histogram, the
+    timings of the current job and a structured log line.
+    Details can be added to the log line through the dict it yields.
+
+        with span("merge", "render", uses_ffmpeg=True) as details:
+            details["edits"] = len(edl)
+
+    :param pipeline: the pipeline, e.g. "merge".
+    :param stage: the stage of the pipeline, e.g. "download".
+    :param uses_ffmpeg: count the exit status of the stage as an ffmpeg exit.
+    """
+    details = {}
+    status = "ok"
+    start_time = time.perf_counter()
+    try:
+        yield details
+    except subprocess.CalledProcessError as e:
+        status = "error"
+        FFMPEG_EXITS.labels(pipeline, stage, str(e.returncode)).inc()
+        raise
+    except ffmpeg.Error:
+        status = "error"
+        FFMPEG_EXITS.labels(pipeline, stage, "error").inc()
+        raise
+    except BaseException:
+        status = "error"
+        raise
+    else:
+        if uses_ffmpeg:
+            FFMPEG_EXITS.labels(pipeline, stage, "0").inc()
+    finally:
+        seconds = time.perf_counter() - start_time
+        STAGE_SECONDS.labels(pipeline, stage).observe(seconds)
+        if status == "error":
+            STAGE_FAILURES.labels(pipeline, stage).inc()
+        timing = {"pipeline": pipeline, "stage": stage, "seconds": round(seconds, 3),
+                  "status": status, **details}
+        if _current_job is not None:
+            _job_timings.append(timing)
+        log_event("span", job_id=(_current_job or {}).get("job_id"), **timing)
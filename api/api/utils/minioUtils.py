@@ -1,7 +1,10 @@
+import os
 import sys
 
 import boto3
 
+from utils.transfer import upload_fileobj, download_file
+
 def create_s3_client(endpoint, access_key, secret_key):
     """
     Takes in the minio variables and creates the s3 client.
@@ -21,34 +24,28 @@ def create_s3_client(endpoint, access_key, secret_key):
 def download_from_s3(s3_client, bucket, key, download_path) -> bool:
 
     try:
-        s3_client.download_file(Bucket=bucket,
-                                Key=key,
-                                Filename=download_path)
+        download_file(s3_client, bucket, key, download_path)
     except Exception as e:
         print(e, file=sys.stderr)
         return False
     else:
         return True
 
-def upload_to_s3(s3_client, final_output, bucket_name):
+def upload_to_s3(s3_client, final_output, bucket_name) -> bool:
     """
     Uploads the final output file to the specified bucket
 
-    :param final_outout: the name of the final output file.
+    :param final_outout: the path of the final output file, it is uploaded under its file name.
     :param bucket_name: the name of the bucket to be uploaded to.
+    :returns success: boolean indicating whether the upload completed.
     """
+    key = f"final-product/{os.path.basename(final_output)}"
 
     try:
         with open(final_output, 'rb') as file:
-            s3_client.put_object(
-                Bucket=bucket_name,
-                Key=f"final-product/{final_output}",
-                Body=file,
-                ACL='public-read')
-
-        s3_client.get_waiter('object_exists').wait(
-            Bucket=bucket_name,
-            Key=f"final-product/{final_output}"
-        )
+            upload_fileobj(s3_client, file, bucket_name, key, {'ACL': 'public-read'})
     except Exception as e:
         print("Error:", e, file=sys.stderr)
+        return False
+    else:
+        return True
@@ -0,0 +1,153 @@
+import os
+import sys
+import time
+import resource
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import whisper_timestamped as whisper
+
+DEFAULT_MODEL = os.environ.get("WHISPER_MODEL", "base.en")
+DEFAULT_DEVICE = os.environ.get("WHISPER_DEVICE", "cpu")
+WHISPER_SAMPLE_RATE = 16_000
+
+
+def get_configured_models() -> list:
+    """
+    Returns the whisper model sizes this deployment uses, set with WHISPER_MODELS
+    as a comma separated list, e.g. "base.en,small.en".
+    """
+    models = os.environ.get("WHISPER_MODELS", DEFAULT_MODEL)
+    return [model.strip() for model in models.split(",") if model.strip()]
+
+
+def _model_bytes(model) -> int:
+    """
+    Counts the memory held by a model's weights and buffers.
+    :param model: a loaded torch model.
+    """
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+
+class ModelRegistry:
+    """
+    Loads each whisper (model, device) pair once per process and shares it.
+    Models are kept in least recently used order, and the oldest is dropped
+    once more than max_models are loaded.
+    """
+
+    def __init__(self, max_models: int = None, loader=whisper.load_model):
+        """
+        :param max_models: how many models may be loaded at once,
+                           defaults to WHISPER_MAX_MODELS or the number of configured models.
+        :param loader: function called as loader(name, device=device) to load a model.
+        """
+        self.max_models = max_models or int(
+            os.environ.get("WHISPER_MAX_MODELS", len(get_configured_models())))
+        self._loader = loader
+        self._models = OrderedDict()
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._use_locks = {}
+
+    def get(self, name: str = DEFAULT_MODEL, device: str = DEFAULT_DEVICE):
+        """
+        Returns a loaded model, loading it if this process hasn't already.
+        :param name: the whisper model size, e.g. "base.en".
+        :param device: the torch device to load it onto.
+        """
+        key = (name, device)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self._stats[key]["hits"] += 1
+                return self._models[key]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Only one thread loads a given model, the others wait and then share it
+        with load_lock:
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    self._stats[key]["hits"] += 1
+                    return self._models[key]
+
+            peak_rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            start_time = time.perf_counter()
+            model = self._loader(name, device=device)
+            load_seconds = time.perf_counter() - start_time
+            peak_rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+            stats = {
+                "model": name,
+                "device": device,
+                "load_seconds": round(load_seconds, 3),
+                "model_bytes": _model_bytes(model),
+                "peak_rss_increase_kb": peak_rss_after - peak_rss_before,
+                "hits": 0,
+            }
+            print(f"Loaded whisper model: {stats}", file=sys.stderr)
+
+            with self._lock:
+                self._models[key] = model
+                self._stats[key] = stats
+                self._use_locks.setdefault(key, threading.Lock())
+                while len(self._models) > self.max_models:
+                    evicted_key, _ = self._models.popitem(last=False)
+                    self._stats.pop(evicted_key, None)
+                    print(f"Unloaded whisper model: {evicted_key}", file=sys.stderr)
+        return model
+
+    @contextmanager
+    def use(self, name: str = DEFAULT_MODEL, device: str = DEFAULT_DEVICE):
+        """
+        Gives a thread exclusive use of a model while it transcribes.
+        whisper_timestamped attaches hooks to the model during a transcription,
+        so two threads must not run the same model at once.
+
+        :param name: the whisper model size.
+        :param device: the torch device the model is on.
+        """
+        model = self.get(name, device)
+        with self._lock:
+            use_lock = self._use_locks.setdefault((name, device), threading.Lock())
+        with use_lock:
+            yield model
+
+    def warm_up(self, names: list = None, device: str = DEFAULT_DEVICE) -> None:
+        """
+        Loads models ahead of the first request and runs one short transcription
+        through each so the first real request doesn't pay for initialisation.
+        :param names: the models to warm up, defaults to the configured models.
+        :param device: the torch device to load them onto.
+        """
+        for name in names or get_configured_models():
+            start_time = time.perf_counter()
+            with self.use(name, device) as model:
+                silence = np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32)
+                whisper.transcribe(model, silence, language='en', task='transcribe')
+            print(
+                f"Warmed up whisper model {name} in {time.perf_counter() - start_time:.2f}s",
+                file=sys.stderr)
+
+    def stats(self) -> list:
+        """
+        Reports load time, memory use and hit count of every loaded model.
+        """
+        with self._lock:
+            return [dict(stats) for stats in self._stats.values()]
+
+
+registry = ModelRegistry()
+
+
+def warm_up_from_environment() -> None:
+    """
+    Warms up the configured models if WHISPER_WARMUP is set to a true value.
+    """
+    if os.environ.get("WHISPER_WARMUP", "").lower() in ("1", "true", "yes"):
+        registry.warm_up()
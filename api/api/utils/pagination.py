@@ -0,0 +1,55 @@
+import re
+import json
+import base64
+from datetime import datetime
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+SIZE_UNITS = {"B": 1, "KB": 1000, "MB": 1000 ** 2, "GB": 1000 ** 3, "TB": 1000 ** 4}
+
+
+def encode_cursor(values: list) -> str:
+    """
+    Turns the sort key of the last row of a page into an opaque cursor token.
+    :param values: the values the page is ordered by, datetimes are kept as ISO strings.
+    """
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> list:
+    """
+    Reads a cursor token made by encode_cursor.
+    :raises ValueError: if the token is not a valid cursor.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {token}") from e
+    if not isinstance(values, list):
+        raise ValueError(f"Invalid cursor: {token}")
+    return values
+
+
+def get_page_size(limit) -> int:
+    """
+    Reads the requested page size, clamped between 1 and MAX_PAGE_SIZE.
+    :raises ValueError: if limit is not a number.
+    """
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return min(max(int(limit), 1), MAX_PAGE_SIZE)
+
+
+def parse_size(size) -> int:
+    """
+    Converts a display size made by the frontend's sizeConversion, e.g. "12.50MB", to bytes.
+    :returns size_bytes: the size in bytes, 0 if it can't be read.
+    """
+    if isinstance(size, (int, float)):
+        return int(size)
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?B)\s*", str(size).upper())
+    if match is None:
+        return 0
+    return round(float(match.group(1)) * SIZE_UNITS[match.group(2)])
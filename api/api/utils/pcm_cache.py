@@ -0,0 +1,117 @@
+import os
+import sys
+import hashlib
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from utils.ffmpeg_runner import run_ffmpeg
+
+_active_cache = None
+
+
+def get_canonical_rate() -> int:
+    """
+    Returns the rate every source is decoded at once, set with PCM_CACHE_RATE.
+    Lower rates are resampled from this decode, higher ones from the source.
+    Defaults to 16kHz, the rate whisper needs.
+    """
+    return int(os.environ.get("PCM_CACHE_RATE", 16_000))
+
+
+class PcmCache:
+    """
+    Decoded audio of a job, kept as raw mono float32 files in a folder.
+    Each source is decoded by ffmpeg only once, and every stage analysing it
+    reads the same file through a numpy memmap, so the samples come from the
+    page cache instead of being decoded and held in memory again.
+    """
+
+    def __init__(self, folder: str):
+        """
+        :param folder: where the decoded files are kept, usually inside the job workspace.
+        """
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.stats = {"hits": 0, "decoded": 0, "resampled": 0}
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _path(self, source: str, sample_rate: int) -> str:
+        # A source that is written again (same path, new content) gets a new file
+        status = os.stat(source)
+        identity = f"{os.path.abspath(source)}:{status.st_size}:{status.st_mtime_ns}"
+        digest = hashlib.sha256(identity.encode()).hexdigest()[:24]
+        return os.path.join(self.folder, f"{digest}_{sample_rate}.f32")
+
+    def _lock(self, path: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(path, threading.Lock())
+
+    def samples(self, source: str, sample_rate: int):
+        """
+        Returns the audio of a file as mono float32 samples between -1 and 1,
+        decoding it the first time it is asked for.
+
+        :param source: path of the audio or video file.
+        :param sample_rate: rate the samples are wanted at.
+        :returns samples: a read only memmap of the samples.
+        """
+        path = self._path(source, sample_rate)
+        with self._lock(path):
+            if os.path.exists(path):
+                self.stats["hits"] += 1
+            else:
+                canonical_rate = get_canonical_rate()
+                if sample_rate < canonical_rate:
+                    # Resampling the raw canonical samples skips demuxing and decoding the source
+                    self.samples(source, canonical_rate)
+                    self._write(['-f', 'f32le', '-ac', '1', '-ar', str(canonical_rate),
+                                 '-i', self._path(source, canonical_rate)], sample_rate, path)
+                    self.stats["resampled"] += 1
+                else:
+                    self._write(['-i', source, '-vn', '-sn', '-dn'], sample_rate, path)
+                    self.stats["decoded"] += 1
+        if os.path.getsize(path) == 0:
+            return np.zeros(0, dtype=np.float32)
+        return np.memmap(path, dtype=np.float32, mode='r')
+
+    @staticmethod
+    def _write(input_arguments: list, sample_rate: int, path: str) -> None:
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        command = (['ffmpeg', '-y', '-v', 'error'] + input_arguments +
+                   ['-ac', '1', '-ar', str(sample_rate), '-f', 'f32le', temp_path])
+        try:
+            run_ffmpeg(command, label="decode audio")
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+@contextmanager
+def pcm_cache(folder: str):
+    """
+    Serves every mono decode in this process from one PcmCache while the block
+    runs, see pcm_stream.stream_pcm and pcm_stream.decode_pcm.
+
+        with job_workspace(bucket_name) as workspace, pcm_cache(workspace.path("pcm")):
+            ...
+
+    :param folder: where the decoded files are kept.
+    """
+    global _active_cache
+    previous, _active_cache = _active_cache, PcmCache(folder)
+    try:
+        yield _active_cache
+    finally:
+        print(f"Decoded audio cache: {_active_cache.stats}", file=sys.stderr)
+        _active_cache = previous
+
+
+def get_active_cache():
+    """
+    Returns the PcmCache set by pcm_cache, or None outside of one.
+    """
+    return _active_cache
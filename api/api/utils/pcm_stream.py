@@ -0,0 +1,137 @@
+import os
+import subprocess
+
+import numpy as np
+
+from utils.pcm_cache import get_active_cache
+
+# Seconds of audio held in memory at once while streaming
+BLOCK_SECONDS = 10
+
+
+def stream_pcm(audio_file: str, sample_rate: int = 8_000, block_size: int = None,
+               channels: int = 1):
+    """
+    Decodes an audio (or video) file through an ffmpeg pipe and yields it
+    as blocks of float32 samples between -1 and 1, so the whole file never
+    has to be held in memory.
+
+    :param audio_file: path of the file to decode.
+    :param sample_rate: rate the audio is resampled to.
+    :param block_size: number of samples per block, every block but the last is this long.
+    :param channels: number of channels to decode to, blocks have shape (samples, channels) if > 1.
+    Inside utils.pcm_cache.pcm_cache, mono blocks are read from the cached decode instead.
+    """
+    block_size = block_size or sample_rate * BLOCK_SECONDS
+    cache = get_active_cache()
+    if cache is not None and channels == 1 and os.path.isfile(audio_file):
+        samples = cache.samples(audio_file, sample_rate)
+        for start in range(0, len(samples), block_size):
+            yield samples[start:start + block_size]
+        return
+    command = [
+        'ffmpeg',
+        '-v', 'error',
+        '-i', audio_file,
+        '-vn', '-sn', '-dn',
+        '-ac', str(channels),
+        '-ar', str(sample_rate),
+        '-f', 'f32le',
+        'pipe:1'
+    ]
+    bytes_per_block = block_size * channels * 4
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    finished = False
+    try:
+        while True:
+            data = process.stdout.read(bytes_per_block)
+            if not data:
+                break
+            # Drop any trailing partial sample
+            usable = len(data) - len(data) % (channels * 4)
+            block = np.frombuffer(data[:usable], dtype=np.float32)
+            if channels > 1:
+                block = block.reshape(-1, channels)
+            yield block
+        finished = True
+    finally:
+        if not finished:
+            process.kill()
+        process.stdout.close()
+        error = process.stderr.read()
+        process.stderr.close()
+        process.wait()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stderr=error)
+
+
+def decode_pcm(media_file: str, sample_rate: int = 16_000):
+    """
+    Decodes the audio of a file (or URL) in one go, straight to mono float32
+    samples between -1 and 1 through an ffmpeg pipe. Nothing is written to disk,
+    unless a pcm_cache is active, which returns a memmap of the cached file instead.
+
+    :param media_file: path or URL of the audio or video to decode.
+    :param sample_rate: rate the audio is resampled to.
+    """
+    cache = get_active_cache()
+    if cache is not None and os.path.isfile(media_file):
+        return cache.samples(media_file, sample_rate)
+    blocks = list(stream_pcm(media_file, sample_rate))
+    return np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+
+
+def _windowed(audio_file: str, window_size: int, sample_rate: int, reduce):
+    """
+    Streams a file and reduces each complete window of samples to one value.
+    :param reduce: function mapping a (windows, window_size) array to one value per window.
+    :returns values, peak, sample_count: see windowed_abs_sums.
+    """
+    windows_per_block = max(1, (sample_rate * BLOCK_SECONDS) // window_size)
+    values = []
+    peak = 0.0
+    sample_count = 0
+    leftover = np.zeros(0, dtype=np.float32)
+
+    for block in stream_pcm(audio_file, sample_rate, window_size * windows_per_block):
+        sample_count += len(block)
+        if len(block):
+            peak = max(peak, float(block.max()))
+        if len(leftover):
+            block = np.concatenate([leftover, block])
+        complete = len(block) - len(block) % window_size
+        if complete:
+            values.append(reduce(block[:complete].reshape(-1, window_size)))
+        leftover = block[complete:]
+
+    values = np.concatenate(values) if values else np.zeros(0)
+    return values, peak, sample_count
+
+
+def windowed_abs_sums(audio_file: str, window_size: int, sample_rate: int = 8_000):
+    """
+    Streams a file and sums the absolute sample values over consecutive windows.
+    Memory use only grows with the number of windows, not with the number of samples.
+
+    :param audio_file: path of the file to analyse.
+    :param window_size: number of samples per window.
+    :param sample_rate: rate the audio is resampled to.
+    :returns sums, peak, sample_count: the sum of each complete window,
+             the highest sample value, and the total number of samples.
+    """
+    return _windowed(audio_file, window_size, sample_rate,
+                     lambda windows: np.abs(windows).sum(axis=1))
+
+
+def windowed_rms(audio_file: str, window_size: int, sample_rate: int = 8_000):
+    """
+    Streams a file and measures the root mean square level of consecutive windows.
+
+    :param audio_file: path of the file to analyse.
+    :param window_size: number of samples per window.
+    :param sample_rate: rate the audio is resampled to.
+    :returns levels, peak, sample_count: the level of each complete window,
+             the highest sample value, and the total number of samples.
+    """
+    return _windowed(audio_file, window_size, sample_rate,
+                     lambda windows: np.sqrt(np.mean(np.square(windows, dtype=np.float64), axis=1)))
@@ -0,0 +1,28 @@
+import json
+import subprocess
+
+
+def probe_media(video_file: str) -> dict:
+    """
+    Reads the duration and stream parameters of a media file with ffprobe.
+    :param video_file: path of the file to probe.
+    :returns info: dict with "duration", "video" and "audio" (None if missing) entries.
+    """
+    command = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries',
+        'format=duration:stream=codec_type,codec_name,profile,level,width,height,pix_fmt,'
+        'r_frame_rate,time_base,color_range,color_space,color_transfer,color_primaries,'
+        'sample_rate,channels',
+        '-of', 'json',
+        video_file
+    ]
+    result = subprocess.run(command, check=True, capture_output=True, text=True)
+    probe = json.loads(result.stdout)
+    streams = probe.get("streams", [])
+    return {
+        "duration": float(probe["format"]["duration"]),
+        "video": next((s for s in streams if s["codec_type"] == "video"), None),
+        "audio": next((s for s in streams if s["codec_type"] == "audio"), None),
+    }
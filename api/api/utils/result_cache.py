@@ -0,0 +1,235 @@
+import os
+import sys
+import json
+import time
+import hashlib
+
+from botocore.exceptions import ClientError
+
+from utils.transfer import list_objects
+
+# Pipeline results are cached per project bucket. The index maps a digest of
+# the inputs and parameters of a run to the artifact that run produced, and a
+# copy of every cached artifact is kept under cache/<digest>/ so it can be put
+# back if a run with different parameters overwrites it.
+INDEX_KEY = "cache/index.json"
+CACHE_PREFIX = "cache/"
+
+# Bump to invalidate every cached result when a pipeline's output changes
+CACHE_VERSION = 2
+
+
+def get_max_cache_bytes() -> int:
+    """
+    Returns how many bytes of cached artifacts are kept per project, set with RESULT_CACHE_MAX_BYTES.
+    """
+    return int(os.environ.get("RESULT_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+
+
+def cache_enabled() -> bool:
+    """
+    Returns whether pipeline results are cached, turned off by setting RESULT_CACHE to 0.
+    """
+    return os.environ.get("RESULT_CACHE", "1").lower() not in ("0", "false", "no")
+
+
+def object_etag(s3_client, bucket_name, key):
+    """
+    Returns the ETag of an object, or None if it doesn't exist.
+    """
+    try:
+        return s3_client.head_object(Bucket=bucket_name, Key=key)["ETag"]
+    except ClientError:
+        return None
+
+
+def listed_etags(s3_client, bucket_name, objects=None) -> dict:
+    """
+    Returns the ETag of every object in a bucket, from a single listing.
+    :param objects: an existing listing of the bucket to use instead of listing it again.
+    """
+    objects = list_objects(s3_client, bucket_name) if objects is None else objects
+    return {obj["Key"]: obj["ETag"] for obj in objects}
+
+
+def cache_key(kind: str, inputs: dict, params) -> str:
+    """
+    Builds the digest a pipeline result is cached under.
+    :param kind: the pipeline, e.g. "merge".
+    :param inputs: dict of input object key to its ETag.
+    :param params: JSON serialisable parameters the pipeline was run with.
+    """
+    description = json.dumps(
+        {"version": CACHE_VERSION, "kind": kind, "inputs": inputs, "params": params},
+        sort_keys=True)
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def load_index(s3_client, bucket_name, index_key: str = INDEX_KEY) -> dict:
+    """
+    Reads a cache index from a bucket, an index that doesn't exist yet is empty.
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=index_key)
+        return json.loads(response["Body"].read())
+    except ClientError:
+        return {}
+    except ValueError:
+        print(f"Ignoring unreadable cache index in {bucket_name}", file=sys.stderr)
+        return {}
+
+
+def save_index(s3_client, bucket_name, index: dict, index_key: str = INDEX_KEY) -> None:
+    """
+    Writes a cache index back to a bucket.
+    The last writer wins if two jobs update the index at once. Every hit is
+    checked against the cached object, so a lost update only costs a miss.
+    """
+    s3_client.put_object(Bucket=bucket_name, Key=index_key,
+                         Body=json.dumps(index).encode(),
+                         ContentType="application/json")
+
+
+def least_recently_used(index: dict, max_bytes: int) -> list:
+    """
+    Picks the entries to drop, least recently used first, so the rest fit in max_bytes.
+    :param index: dict of digest to entry, every entry has a "size" and "last_used".
+    :returns digests: the digests of the entries to drop.
+    """
+    total_bytes = sum(entry["size"] for entry in index.values())
+    evicted = []
+    for digest in sorted(index, key=lambda key: index[key]["last_used"]):
+        if total_bytes <= max_bytes:
+            break
+        total_bytes -= index[digest]["size"]
+        evicted.append(digest)
+    return evicted
+
+
+def _artifacts(entry: dict) -> list:
+    """
+    Returns every artifact of an entry, the main one first. Each has an
+    "output_key", "etag" and "copy_key".
+    """
+    return [entry] + entry.get("extras", [])
+
+
+def _remove_entry(s3_client, bucket_name, index: dict, digest: str) -> None:
+    entry = index.pop(digest)
+    for artifact in _artifacts(entry):
+        try:
+            s3_client.delete_object(Bucket=bucket_name, Key=artifact["copy_key"])
+        except ClientError as e:
+            print(f"Could not delete cached artifact {artifact['copy_key']}: {e}",
+                  file=sys.stderr)
+
+
+def lookup(s3_client, bucket_name, digest: str):
+    """
+    Looks for the result of an earlier identical run.
+    If any of its artifacts has since been overwritten, the cached copy is put back.
+
+    :param s3_client: the s3 client to use.
+    :param bucket_name: the project bucket.
+    :param digest: the digest returned by cache_key.
+    :returns output_key: the key of the cached artifact, or None on a miss.
+    """
+    if not cache_enabled():
+        return None
+    index = load_index(s3_client, bucket_name)
+    entry = index.get(digest)
+    if entry is None:
+        return None
+
+    for artifact in _artifacts(entry):
+        output_key = artifact["output_key"]
+        if object_etag(s3_client, bucket_name, output_key) == artifact["etag"]:
+            continue
+        try:
+            s3_client.copy_object(
+                Bucket=bucket_name, Key=output_key, ACL="public-read",
+                CopySource={"Bucket": bucket_name, "Key": artifact["copy_key"]})
+        except ClientError as e:
+            print(f"Cached artifact {artifact['copy_key']} is gone: {e}", file=sys.stderr)
+            _remove_entry(s3_client, bucket_name, index, digest)
+            save_index(s3_client, bucket_name, index)
+            return None
+        artifact["etag"] = object_etag(s3_client, bucket_name, output_key)
+
+    entry["last_used"] = time.time()
+    save_index(s3_client, bucket_name, index)
+    print(f"Cache hit for {entry['kind']} in {bucket_name}", file=sys.stderr)
+    return entry["output_key"]
+
+
+def store(s3_client, bucket_name, digest: str, kind: str, inputs: dict, output_key: str,
+          extra_keys=()) -> None:
+    """
+    Records freshly uploaded artifacts as the result of a run, then drops
+    the least recently used results until the cache fits in RESULT_CACHE_MAX_BYTES.
+
+    :param s3_client: the s3 client to use.
+    :param bucket_name: the project bucket.
+    :param digest: the digest returned by cache_key.
+    :param kind: the pipeline, e.g. "merge".
+    :param inputs: dict of input object key to its ETag, used for invalidation.
+    :param output_key: the key the artifact was uploaded to.
+    :param extra_keys: keys of any other artifacts of the run, put back along with it on a hit.
+    """
+    if not cache_enabled():
+        return
+    artifacts = []
+    size = 0
+    for key in [output_key, *extra_keys]:
+        copy_key = f"{CACHE_PREFIX}{digest}/{os.path.basename(key)}"
+        try:
+            head = s3_client.head_object(Bucket=bucket_name, Key=key)
+            s3_client.copy_object(Bucket=bucket_name, Key=copy_key,
+                                  CopySource={"Bucket": bucket_name, "Key": key})
+        except ClientError as e:
+            print(f"Could not cache {key}: {e}", file=sys.stderr)
+            return
+        artifacts.append({"output_key": key, "etag": head["ETag"], "copy_key": copy_key})
+        size += head["ContentLength"]
+
+    index = load_index(s3_client, bucket_name)
+    index[digest] = {
+        "kind": kind,
+        "inputs": inputs,
+        **artifacts[0],
+        "extras": artifacts[1:],
+        "size": size,
+        "last_used": time.time(),
+    }
+
+    for old_digest in least_recently_used(index, get_max_cache_bytes()):
+        _remove_entry(s3_client, bucket_name, index, old_digest)
+        print(f"Evicted cached result {old_digest} from {bucket_name}", file=sys.stderr)
+
+    save_index(s3_client, bucket_name, index)
+
+
+def invalidate(s3_client, bucket_name, changed_keys=None) -> int:
+    """
+    Drops cached results that depend on source media that has changed.
+    :param s3_client: the s3 client to use.
+    :param bucket_name: the project bucket.
+    :param changed_keys: keys of the objects that changed. If not given, every
+                         result whose inputs no longer match their current ETag is dropped.
+    :returns removed: how many results were dropped.
+    """
+    index = load_index(s3_client, bucket_name)
+    if changed_keys is None:
+        current = listed_etags(s3_client, bucket_name)
+        stale = [digest for digest, entry in index.items()
+                 if any(current.get(key) != etag for key, etag in entry["inputs"].items())]
+    else:
+        changed_keys = set(changed_keys)
+        stale = [digest for digest, entry in index.items()
+                 if changed_keys.intersection(entry["inputs"])]
+
+    for digest in stale:
+        _remove_entry(s3_client, bucket_name, index, digest)
+    if stale:
+        save_index(s3_client, bucket_name, index)
+    return len(stale)
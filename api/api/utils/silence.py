@@ -0,0 +1,104 @@
+import os
+import sys
+
+import numpy as np
+
+from utils.pcm_stream import windowed_rms
+
+ANALYSIS_RATE = 8_000
+FRAME_SECONDS = 0.02
+
+
+def get_silence_settings() -> dict:
+    """
+    Returns the silence detection settings, each can be set with an environment variable:
+        - SILENCE_THRESHOLD_DB: frames quieter than this (in dBFS) start a silence
+        - SILENCE_HYSTERESIS_DB: a silence only ends once a frame is this much louder than the threshold
+        - SILENCE_MIN_SECONDS: silences shorter than this are left in
+        - SILENCE_PADDING_SECONDS: this much of each silence is kept next to the speech around it
+    """
+    return {
+        "threshold_db": float(os.environ.get("SILENCE_THRESHOLD_DB", -40.0)),
+        "hysteresis_db": float(os.environ.get("SILENCE_HYSTERESIS_DB", 6.0)),
+        "min_seconds": float(os.environ.get("SILENCE_MIN_SECONDS", 1.5)),
+        "padding_seconds": float(os.environ.get("SILENCE_PADDING_SECONDS", 0.25)),
+    }
+
+
+def frame_levels(audio_file: str, frame_seconds: float = FRAME_SECONDS):
+    """
+    Streams an audio file and measures the level of each frame in dBFS.
+    :param audio_file: path of the file.
+    :param frame_seconds: length of each frame.
+    """
+    levels, _, _ = windowed_rms(audio_file, round(frame_seconds * ANALYSIS_RATE), ANALYSIS_RATE)
+    return 20 * np.log10(np.maximum(levels, 1e-10))
+
+
+def silent_frames(levels_db, threshold_db: float, hysteresis_db: float):
+    """
+    Decides which frames are silent. A silence starts when a frame drops below
+    the threshold and lasts until a frame rises above threshold + hysteresis,
+    so levels hovering around the threshold don't flick in and out of silence.
+
+    :param levels_db: the level of each frame.
+    :returns silent: boolean array, True for every silent frame.
+    """
+    levels_db = np.asarray(levels_db)
+    # 1 where a frame starts a silence, 0 where it ends one, -1 where it changes nothing
+    events = np.where(levels_db < threshold_db, 1,
+                      np.where(levels_db > threshold_db + hysteresis_db, 0, -1))
+    # Carry the last event forward, frames before any event are not silent
+    last_event = np.maximum.accumulate(np.where(events >= 0, np.arange(len(events)), -1))
+    return np.where(last_event >= 0, events[np.maximum(last_event, 0)], 0) == 1
+
+
+def silent_ranges(silent, frame_seconds: float, min_seconds: float, padding_seconds: float) -> list:
+    """
+    Turns silent frames into (start, end) ranges to remove.
+    :param silent: boolean array, True for every silent frame.
+    :param frame_seconds: length of each frame.
+    :param min_seconds: silences shorter than this are left in.
+    :param padding_seconds: how much of each silence is left next to the speech around it.
+    :returns ranges: list of (start, end) tuples in seconds.
+    """
+    changes = np.diff(np.concatenate(([0], silent.astype(np.int8), [0])))
+    starts = np.flatnonzero(changes == 1) * frame_seconds
+    ends = np.flatnonzero(changes == -1) * frame_seconds
+
+    long_enough = (ends - starts) >= min_seconds
+    # Silences at the very start and end of the file only need padding on one side
+    total = len(silent) * frame_seconds
+    starts = np.where(starts > 0, starts + padding_seconds, starts)[long_enough]
+    ends = np.where(ends < total, ends - padding_seconds, ends)[long_enough]
+    return [(round(float(start), 3), round(float(end), 3))
+            for start, end in zip(starts, ends) if end > start]
+
+
+def detect_silence(audio_file: str, settings: dict = None) -> list:
+    """
+    Finds the dead sections of an audio file.
+    :param audio_file: path of the file.
+    :param settings: overrides for get_silence_settings.
+    :returns ranges: list of (start, end) tuples in seconds.
+    """
+    settings = {**get_silence_settings(), **(settings or {})}
+    levels_db = frame_levels(audio_file)
+    silent = silent_frames(levels_db, settings["threshold_db"], settings["hysteresis_db"])
+    ranges = silent_ranges(silent, FRAME_SECONDS,
+                           settings["min_seconds"], settings["padding_seconds"])
+    print(f"Found {len(ranges)} dead sections in {audio_file}", file=sys.stderr)
+    return ranges
+
+
+def ranges_to_timestamps(ranges) -> list:
+    """
+    Writes dead sections in the timestamps.json format, disabled so the export removes them.
+    They use quote index -1 so they can't clash with the words of the transcript.
+    :param ranges: list of (start, end) tuples in seconds.
+    """
+    return [{
+        "index": [-1, i],
+        "payload": {"id": i, "start": start, "end": end, "text": ""},
+        "enabled": False,
+    } for i, (start, end) in enumerate(ranges)]
@@ -0,0 +1,302 @@
+import os
+import sys
+import subprocess
+from fractions import Fraction
+
+import numpy as np
+
+from utils.ffmpeg_runner import run_ffmpeg, CombinedProgress
+from utils.probe import probe_media
+
+# Pieces shorter than this are dropped rather than rendered
+MIN_PIECE_SECONDS = 0.001
+# ffprobe's names for H.264 profiles, and libx264's
+H264_PROFILES = {
+    "Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main",
+    "High": "high", "High 10": "high10", "High 4:2:2": "high422",
+    "High 4:4:4 Predictive": "high444",
+}
+# ffmpeg options setting the colour parameters ffprobe reads
+COLOUR_OPTIONS = {
+    "color_range": "-color_range", "color_space": "-colorspace",
+    "color_transfer": "-color_trc", "color_primaries": "-color_primaries",
+}
+# Stream parameters the re-encoded pieces must share with the copied ones to be joined
+MATCHED_PARAMETERS = ("codec_name", "profile", "width", "height", "pix_fmt", "time_base",
+                      *COLOUR_OPTIONS)
+
+
+def build_keyframe_index(video_file: str):
+    """
+    Builds an index of the frame and keyframe (GOP start) times of the first
+    video stream. Only packet headers are read, nothing is decoded.
+    :param video_file: path of the video to index.
+    :returns frame_times, keyframes: sorted arrays of every frame time and every keyframe time.
+    """
+    command = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=p=0',
+        video_file
+    ]
+    result = subprocess.run(command, check=True, capture_output=True, text=True)
+    frame_times = []
+    keyframes = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if pts_time in ('', 'N/A'):
+            continue
+        frame_times.append(float(pts_time))
+        if 'K' in flags:
+            keyframes.append(float(pts_time))
+    return np.sort(np.array(frame_times)), np.unique(np.array(keyframes, dtype=np.float64))
+
+
+def plan_pieces(kept_sections, keyframes, duration):
+    """
+    Splits the sections to keep into pieces that can be stream copied and
+    pieces that have to be re-encoded. A piece can be copied when it starts on
+    a keyframe and ends on a keyframe (or the end of the file), so only the
+    partial GOPs at each cut edge are re-encoded.
+
+    :param kept_sections: list of (start, end, _) tuples, end may be None for the end of the file.
+    :param keyframes: sorted array of keyframe times.
+    :param duration: length of the source in seconds.
+    :returns pieces: list of (start, end, mode) tuples, mode is "copy" or "encode".
+    """
+    # The end of the file is as good a place to stop copying as a keyframe
+    boundaries = np.append(keyframes, duration)
+    pieces = []
+
+    def add(start, end, mode):
+        if end - start >= MIN_PIECE_SECONDS:
+            pieces.append((start, end, mode))
+
+    for start, end, _ in kept_sections:
+        end = duration if end is None else min(end, duration)
+        start = max(start, 0.0)
+        if end <= start:
+            continue
+
+        inside = boundaries[(boundaries >= start) & (boundaries <= end)]
+        first_keyframe = inside[0] if len(inside) and inside[0] < duration else None
+        last_boundary = inside[-1] if len(inside) else None
+
+        if first_keyframe is None or last_boundary <= first_keyframe:
+            add(start, end, "encode")
+            continue
+
+        add(start, float(first_keyframe), "encode")
+        add(float(first_keyframe), float(last_boundary), "copy")
+        add(float(last_boundary), end, "encode")
+
+    return pieces
+
+
+def snap_to_frames(kept_sections, frame_rate: Fraction):
+    """
+    Moves every cut onto a frame boundary, so each video piece lasts exactly
+    as long as the matching audio and the two never drift apart.
+    :param kept_sections: list of (start, end, _) tuples, end may be None.
+    :param frame_rate: frames per second of the video.
+    """
+    def snap(time):
+        return float(round(Fraction(time) * frame_rate) / frame_rate)
+
+    return [(snap(start), None if end is None else snap(end), extra)
+            for start, end, extra in kept_sections]
+
+
+def _encode_arguments(info: dict) -> list:
+    """
+    Builds encoder arguments matching the source video, so re-encoded pieces
+    can be joined to stream copied ones without re-encoding again.
+    :param info: result of probe_media for the source.
+    """
+    video = info["video"]
+    arguments = [
+        '-c:v', 'libx264',
+        '-pix_fmt', video.get("pix_fmt", "yuv420p"),
+        '-r', video.get("r_frame_rate", "25"),
+    ]
+    if video.get("profile") in H264_PROFILES:
+        arguments += ['-profile:v', H264_PROFILES[video["profile"]]]
+    if video.get("level", 0) > 0:
+        # ffprobe gives the level times ten, e.g. 40 for level 4
+        arguments += ['-level', f"{video['level'] / 10:.1f}"]
+    if "time_base" in video:
+        arguments += ['-video_track_timescale', str(Fraction(video["time_base"]).denominator)]
+    for key, option in COLOUR_OPTIONS.items():
+        if video.get(key, "unknown") != "unknown":
+            arguments += [option, video[key]]
+    return arguments
+
+
+def check_pieces(piece_files: list, info: dict) -> None:
+    """
+    Checks re-encoded pieces have the same stream parameters as the source,
+    as the concat demuxer joins them without looking and the result would
+    not play properly.
+    :param piece_files: the re-encoded piece files.
+    :param info: result of probe_media for the source.
+    :raises ValueError: if a piece doesn't match.
+    """
+    expected = {key: info["video"].get(key) for key in MATCHED_PARAMETERS}
+    for piece_file in piece_files:
+        video = probe_media(piece_file)["video"] or {}
+        for key, value in expected.items():
+            if video.get(key) != value:
+                raise ValueError(
+                    f"{os.path.basename(piece_file)} has {key} {video.get(key)}, "
+                    f"the source has {value}")
+
+
+def render_piece(source: str, start: float, end: float, mode: str,
+                 output: str, encode_arguments: list, frame_times, on_progress=None) -> None:
+    """
+    Renders the video of one piece of the source.
+    :param source: the video being cut.
+    :param start: start of the piece in seconds.
+    :param end: end of the piece in seconds.
+    :param mode: "copy" to stream copy the piece, "encode" to re-encode it.
+    :param output: path of the piece file.
+    :param encode_arguments: encoder arguments used when mode is "encode".
+    :param frame_times: sorted array of every frame time of the source.
+    :param on_progress: passed on to run_ffmpeg, by default progress goes to the job record.
+    """
+    command = [
+        'ffmpeg',
+        '-y',
+        '-v', 'error',
+        '-ss', f"{start:.6f}",
+        '-i', source,
+        '-map', '0:v:0',
+        '-an',
+    ]
+    if mode == "copy":
+        # Copied pieces are whole GOPs, so count the frames rather than using a duration.
+        # With B-frames, packets come in decode order and a duration would cut off the wrong ones.
+        tolerance = 1e-6
+        frame_count = int(np.count_nonzero(
+            (frame_times >= start - tolerance) & (frame_times < end - tolerance)))
+        command += ['-c:v', 'copy', '-frames:v', str(frame_count)]
+    else:
+        command += ['-t', f"{end - start:.6f}"] + encode_arguments
+    command += ['-avoid_negative_ts', 'make_zero', output]
+    run_ffmpeg(command, end - start, "cut video", on_progress)
+
+
+def render_audio(source: str, kept_sections, output: str, duration: float = None) -> None:
+    """
+    Cuts the audio of the source sample accurately in a single ffmpeg run.
+    Audio is cheap to encode, and cutting it this way avoids the gaps that
+    joining separately encoded AAC pieces would leave at every cut. The graph
+    is passed in a script file next to the output, so podcasts with many cuts
+    can't run into command line length limits.
+    :param source: the video being cut.
+    :param kept_sections: list of (start, end, _) tuples to keep, end may be None.
+    :param output: path of the audio file.
+    :param duration: length of the kept audio in seconds, used to report progress.
+    """
+    count = len(kept_sections)
+    filters = [f"[0:a]asplit={count}" + ''.join(f"[s{i}]" for i in range(count)) + ";"]
+    for i, (start, end, _) in enumerate(kept_sections):
+        end_option = "" if end is None else f":end={end}"
+        filters.append(f"[s{i}]atrim=start={start}{end_option},asetpts=PTS-STARTPTS[a{i}];")
+    filters.append(''.join(f"[a{i}]" for i in range(count)) + f"concat=n={count}:v=0:a=1[outa]")
+    script_file = f"{output}.filtergraph"
+    with open(script_file, "w") as file:
+        file.write(''.join(filters))
+
+    command = [
+        'ffmpeg',
+        '-y',
+        '-v', 'error',
+        '-i', source,
+        '-filter_complex_script', script_file,
+        '-map', '[outa]',
+        '-c:a', 'aac',
+        output
+    ]
+    try:
+        run_ffmpeg(command, duration, "cut audio")
+    finally:
+        os.remove(script_file)
+
+
+def concat_pieces(piece_files: list, list_file: str, audio_file: str, output: str,
+                  duration: float = None) -> None:
+    """
+    Joins the video pieces with the concat demuxer, without re-encoding them,
+    and adds the audio track.
+    :param piece_files: the video piece files in order.
+    :param list_file: path the concat list is written to.
+    :param audio_file: the cut audio, or None if the source has no audio.
+    :param output: path of the joined file.
+    :param duration: length of the joined file in seconds, used to report progress.
+    """
+    with open(list_file, 'w') as file:
+        for piece_file in piece_files:
+            file.write(f"file '{os.path.abspath(piece_file)}'\n")
+    command = ['ffmpeg', '-y', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', list_file]
+    if audio_file is not None:
+        command += ['-i', audio_file, '-map', '0:v:0', '-map', '1:a:0']
+    command += ['-c', 'copy', '-movflags', '+faststart', output]
+    run_ffmpeg(command, duration, "join pieces")
+
+
+def smart_cut(source: str, kept_sections, output: str, workspace) -> list:
+    """
+    Keeps only the given sections of a video, stream copying every whole GOP
+    and re-encoding only the partial GOPs at each cut edge.
+
+    :param source: the video to be cut, must be H.264.
+    :param kept_sections: list of (start, end, _) tuples to keep, end may be None.
+    :param output: path of the cut video.
+    :param workspace: job workspace the pieces are rendered into.
+    :returns pieces: the (start, end, mode) pieces that were rendered.
+    :raises ValueError: if the source can't be smart cut, or the joined pieces don't fit together.
+    """
+    info = probe_media(source)
+    if info["video"] is None or info["video"].get("codec_name") != "h264":
+        raise ValueError(f"Smart cut needs an H.264 video, {source} isn't one")
+
+    frame_times, keyframes = build_keyframe_index(source)
+    if len(keyframes) == 0:
+        raise ValueError(f"No keyframes found in {source}")
+
+    frame_rate = Fraction(info["video"].get("r_frame_rate", "25/1"))
+    kept_sections = snap_to_frames(kept_sections, frame_rate)
+    pieces = plan_pieces(kept_sections, keyframes, info["duration"])
+    if not pieces:
+        raise ValueError("Nothing left to keep")
+
+    encode_arguments = _encode_arguments(info)
+    total = sum(end - start for start, end, _ in pieces)
+    progress = CombinedProgress("cut video", total)
+    piece_files = []
+    for i, (start, end, mode) in enumerate(pieces):
+        piece_file = workspace.path(f"piece_{i:04d}.mp4")
+        render_piece(source, start, end, mode, piece_file, encode_arguments, frame_times,
+                     progress.part(i))
+        piece_files.append(piece_file)
+    check_pieces([piece_file for piece_file, (_, _, mode) in zip(piece_files, pieces)
+                  if mode == "encode"], info)
+
+    audio_file = None
+    if info["audio"] is not None:
+        audio_file = workspace.path("pieces_audio.m4a")
+        render_audio(source, kept_sections, audio_file, total)
+
+    concat_pieces(piece_files, workspace.path("pieces.txt"), audio_file, output, total)
+    joined = probe_media(output)["duration"]
+    if abs(joined - total) > 0.1 + 2 / frame_rate:
+        raise ValueError(f"Joined pieces last {joined:.2f}s instead of {total:.2f}s")
+
+    copied = sum(end - start for start, end, mode in pieces if mode == "copy")
+    print(
+        f"Smart cut {len(pieces)} pieces, {copied:.1f}s of {total:.1f}s stream copied",
+        file=sys.stderr)
+    return pieces
@@ -0,0 +1,129 @@
+import os
+import sys
+
+import numpy as np
+
+from utils.pcm_stream import windowed_abs_sums
+
+# Audio is decoded at DECODE_RATE and reduced to an envelope of ENVELOPE_RATE
+# values per second, which is plenty to line up speech to within 10ms.
+DECODE_RATE = 4_000
+ENVELOPE_RATE = 100
+
+
+def get_max_offset_seconds() -> float:
+    """
+    Returns the furthest apart two recordings are searched for, set with SYNC_MAX_OFFSET_SECONDS.
+    """
+    return float(os.environ.get("SYNC_MAX_OFFSET_SECONDS", 30.0))
+
+
+def get_min_confidence() -> float:
+    """
+    Returns the confidence an offset needs before it is used, set with SYNC_MIN_CONFIDENCE.
+    """
+    return float(os.environ.get("SYNC_MIN_CONFIDENCE", 0.2))
+
+
+def audio_envelope(audio_file: str):
+    """
+    Streams an audio file and reduces it to its loudness ENVELOPE_RATE times a second.
+    :param audio_file: path of the file.
+    """
+    sums, _, _ = windowed_abs_sums(audio_file, DECODE_RATE // ENVELOPE_RATE, DECODE_RATE)
+    return sums
+
+
+def _normalise(envelope):
+    envelope = np.asarray(envelope, dtype=np.float64)
+    deviation = envelope.std()
+    return (envelope - envelope.mean()) / (deviation if deviation > 0 else 1.0)
+
+
+def correlate_envelopes(reference, other, max_lag: int, exclusion: int = ENVELOPE_RATE):
+    """
+    Finds how far the other envelope is shifted from the reference with an
+    FFT cross-correlation, searching only lags up to max_lag either way.
+
+    :param reference: envelope of the recording everything is lined up to.
+    :param other: envelope of the recording to be lined up.
+    :param max_lag: the largest shift searched for, in envelope samples.
+    :param exclusion: how close (in samples) another peak may be and still count as the same one.
+    :returns lag, confidence: the shift (positive if the other recording started
+             earlier), to a fraction of a sample, and how much better it matches than
+             any other shift, from 0 (no better) to 1.
+    """
+    reference = _normalise(reference)
+    other = _normalise(other)
+    size = 1 << int(np.ceil(np.log2(len(reference) + len(other))))
+
+    # correlation[k] = sum(reference[t] * other[t + k]), negative lags wrap to the end
+    correlation = np.fft.irfft(
+        np.conj(np.fft.rfft(reference, size)) * np.fft.rfft(other, size), size)
+    max_lag = min(max_lag, size // 2 - 1)
+    lags = np.arange(-max_lag, max_lag + 1)
+
+    # Divide by the overlap at each lag to get a correlation coefficient, ignoring
+    # lags where the recordings barely overlap as those match by chance too easily
+    overlap = (np.minimum(len(reference), len(other) - lags) - np.maximum(0, -lags))
+    usable = overlap >= min(len(reference), len(other)) / 2
+    if not usable.any():
+        return 0.0, 0.0
+    coefficients = np.full(len(lags), -np.inf)
+    coefficients[usable] = correlation[lags[usable] % size] / overlap[usable]
+
+    best = int(np.argmax(coefficients))
+    lag = float(lags[best])
+    # Parabolic interpolation between the neighbouring lags for sub-sample accuracy
+    if 0 < best < len(lags) - 1 and np.isfinite(coefficients[best - 1:best + 2]).all():
+        before, peak, after = coefficients[best - 1:best + 2]
+        curvature = before - 2 * peak + after
+        if curvature < 0:
+            lag += 0.5 * (before - after) / curvature
+
+    # A real match stands out from every other shift, a chance match doesn't
+    elsewhere = coefficients[np.abs(lags - lags[best]) > exclusion]
+    runner_up = elsewhere.max() if len(elsewhere) and np.isfinite(elsewhere.max()) else 0.0
+    confidence = float(np.clip(coefficients[best] - max(runner_up, 0.0), 0.0, 1.0))
+    return lag, confidence
+
+
+def estimate_offsets(audio_files: dict, reference: str = 'wide', max_offset_seconds: float = None) -> dict:
+    """
+    Estimates how far each recording is out of sync with the reference recording.
+
+    :param audio_files: dict of source to audio file, must include the reference.
+    :param reference: the source everything is lined up to, the wide shot by default.
+    :param max_offset_seconds: the furthest apart recordings are searched for,
+                               defaults to SYNC_MAX_OFFSET_SECONDS.
+    :returns offsets: dict of source to {"offset": seconds, "confidence": 0 to 1}.
+             An offset is how much later something is heard in the source than in the reference.
+    """
+    max_offset_seconds = get_max_offset_seconds() if max_offset_seconds is None else max_offset_seconds
+    reference_envelope = audio_envelope(audio_files[reference])
+
+    offsets = {}
+    for source, audio_file in audio_files.items():
+        if source == reference:
+            continue
+        lag, confidence = correlate_envelopes(
+            reference_envelope, audio_envelope(audio_file),
+            int(max_offset_seconds * ENVELOPE_RATE))
+        offsets[source] = {
+            "offset": round(float(lag) / ENVELOPE_RATE, 4),
+            "confidence": round(confidence, 4),
+        }
+    print(f"Estimated sync offsets: {offsets}", file=sys.stderr)
+    return offsets
+
+
+def confident_offsets(estimates: dict, min_confidence: float = None) -> dict:
+    """
+    Keeps only the offsets that are confident enough to use.
+    :param estimates: the result of estimate_offsets.
+    :param min_confidence: defaults to SYNC_MIN_CONFIDENCE.
+    :returns offsets: dict of source to offset in seconds, as the renderers take it.
+    """
+    min_confidence = get_min_confidence() if min_confidence is None else min_confidence
+    return {source: estimate["offset"] for source, estimate in estimates.items()
+            if estimate["confidence"] >= min_confidence}
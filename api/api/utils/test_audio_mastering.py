@@ -5,7 +5,10 @@ from utils.audio_master import (
     audio_limiter,  
     audio_compressor,
     audio_highpass_filter,
-    apply_gain)
+    apply_gain,
+    auto_master,
+    build_master_filter,
+    choose_gain)
 
 LENGTH_TOLERANCE = 0.1
 
@@ -115,3 +118,47 @@ def is_identical_audio(file_path1, file_path2):
     if "Total similarity" in result.stdout:
         return True
     return False
+
+
+def test_auto_master(mock_audio_file):
+    """
+    GIVEN an input audio file
+    WHEN the whole mastering chain is applied in one pass
+    THEN ensure the audio has changed and the length has not
+    """
+    temp_output_file = "temp_master.wav"
+    auto_master(mock_audio_file, temp_output_file)
+
+    original_length = get_audio_length(mock_audio_file)
+    processed_length = get_audio_length(temp_output_file)
+
+    assert np.isclose(original_length, processed_length, atol=LENGTH_TOLERANCE)
+    assert not is_identical_audio(mock_audio_file, temp_output_file)
+
+    os.remove(temp_output_file)
+
+
+def test_build_master_filter_chains_every_stage():
+    """
+    GIVEN measured peak and dynamic range values
+    WHEN the mastering filter graph is built
+    THEN ensure every stage is chained in order and settings can be overridden
+    """
+    filter_graph = build_master_filter(-1.5, 12.0, {"gain": 3})
+    stages = [stage.split('=')[0] for stage in filter_graph.split(',')]
+
+    assert stages == ['dynaudnorm', 'compand', 'volume', 'highpass']
+    assert 'volume=3dB' in filter_graph
+
+
+def test_choose_gain_brings_input_to_target():
+    """
+    GIVEN loudness reports of quiet, loud and silent inputs
+    WHEN the mastering gain is chosen for them
+    THEN ensure it reaches the target loudness, boosts by at most max_gain, and leaves silence alone
+    """
+    assert choose_gain({"integrated_lufs": -20.0}) == 4.0
+    assert choose_gain({"integrated_lufs": -10.0}) == -6.0
+    assert choose_gain({"integrated_lufs": -40.0}) == 10
+    assert choose_gain({"integrated_lufs": -20.0}, {"target_lufs": -23.0}) == -3.0
+    assert choose_gain({"integrated_lufs": None}) == 0.0
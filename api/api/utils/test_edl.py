@@ -0,0 +1,172 @@
+import os
+import json
+import subprocess
+
+import pytest
+
+from utils.edl import EditDecisionList, build_filter_graph, input_seeks, render, render_video
+
+
+def per_second(shots):
+    """
+    Builds one (start, end, shot) transition per second, like choose_highest_sounds.
+    """
+    return [(i, i + 1, shot) for i, shot in enumerate(shots)]
+
+
+def test_merge_runs_joins_consecutive_shots():
+    """
+    GIVEN one transition per second
+    WHEN consecutive transitions of the same shot are merged
+    THEN check there is one edit per shot
+    """
+    edl = EditDecisionList.from_transitions(
+        per_second(['speaker1'] * 3 + ['speaker2'] * 2 + ['speaker1'])).merge_runs()
+
+    assert edl.to_transitions() == [
+        (0, 3, 'speaker1'), (3, 5, 'speaker2'), (5, 6, 'speaker1')]
+
+
+def test_merge_runs_keeps_gaps():
+    """
+    GIVEN sections of the same source with gaps between them, like an export
+    WHEN the runs are merged
+    THEN check nothing is joined and an open end is kept
+    """
+    edl = EditDecisionList.from_transitions([(0, 2, 0), (4, 6, 0), (8, None, 0)]).merge_runs()
+
+    assert edl.to_transitions() == [(0, 2, 0), (4, 6, 0), (8, None, 0)]
+
+
+def test_absorb_short_removes_flickering_shots():
+    """
+    GIVEN a one second cut to the wide shot in the middle of a speaker
+    WHEN shots shorter than two seconds are absorbed
+    THEN check the speaker is shown throughout and longer shots are kept
+    """
+    edl = EditDecisionList.from_transitions(per_second(
+        ['wide'] + ['speaker1'] * 3 + ['wide'] + ['speaker1'] * 2 + ['speaker2'] * 3))
+
+    assert edl.absorb_short(2.0).to_transitions() == [
+        (0, 7, 'speaker1'), (7, 10, 'speaker2')]
+
+
+def test_filter_graph_opens_each_source_once():
+    """
+    GIVEN an hour of per second transitions between two speakers
+    WHEN the filter graph is built
+    THEN check each file is an input once and there is one branch per shot
+    """
+    shots = (['speaker1'] * 30 + ['speaker2'] * 30) * 60
+    edl = EditDecisionList.from_transitions(per_second(shots)).merge_runs()
+
+    graph, sources = build_filter_graph(edl, "v", {'speaker2': 0.5})
+
+    assert sources == ['speaker1', 'speaker2']
+    assert len(edl) == 120
+    assert graph.count('trim=') == 120
+    assert "[vspeaker2_1]trim=start=30.500000:end=60.500000" in graph
+
+
+def test_later_chunks_seek_their_inputs():
+    """
+    GIVEN a chunk from the middle of an edit decision list
+    WHEN its inputs and filter graph are built
+    THEN check each input is seeked to its first edit and the trims are relative to that
+    """
+    edl = EditDecisionList.from_transitions(
+        [(0, 10, 'a'), (10, 15, 'b'), (15, 20, 'a'), (20, 30, 'b'), (30, 40, 'a')])
+    chunk = edl.split(4)[1]
+
+    seeks = input_seeks(chunk, {'b': 0.5})
+    graph, sources = build_filter_graph(chunk, "v", {'b': 0.5}, seeks)
+
+    assert seeks == {'b': 10.5, 'a': 15.0}
+    assert sources == ['b', 'a']
+    assert "[vb_0]trim=start=0.000000:end=5.000000" in graph
+    assert "[va_1]trim=start=0.000000:end=5.000000" in graph
+
+
+def test_split_balances_chunks_at_switches():
+    """
+    GIVEN shots of different lengths
+    WHEN they are split into chunks
+    THEN check every shot is in exactly one chunk and the chunks are about the same length
+    """
+    edl = EditDecisionList.from_transitions(
+        [(0, 10, 'a'), (10, 15, 'b'), (15, 20, 'a'), (20, 30, 'b'), (30, 40, 'a')])
+
+    chunks = edl.split(4)
+
+    assert [chunk.to_transitions() for chunk in chunks] == [
+        [(0, 10, 'a')], [(10, 15, 'b'), (15, 20, 'a')], [(20, 30, 'b')], [(30, 40, 'a')]]
+
+
+@pytest.fixture
+def camera_files(tmpdir):
+    """
+    Mocks two 4 second camera files with audio.
+    :param tmpdir: Temporary directory to store mocked files.
+    """
+    files = {}
+    for name, colour in (('speaker1', 'red'), ('speaker2', 'blue')):
+        files[name] = os.path.join(str(tmpdir), f"{name}.mp4")
+        subprocess.run([
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'lavfi', '-i', f'color=c={colour}:s=64x48:r=25:d=4',
+            '-f', 'lavfi', '-i', 'sine=frequency=440:duration=4',
+            '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-shortest',
+            files[name]
+        ], check=True)
+    return files
+
+
+def test_render_cuts_between_sources(camera_files, tmpdir):
+    """
+    GIVEN two camera files
+    WHEN an edit decision list switching between them is rendered
+    THEN check the output is as long as the edits
+    """
+    edl = EditDecisionList.from_transitions(
+        [(0, 1, 'speaker1'), (1, 2.5, 'speaker2'), (2.5, 4, 'speaker1')])
+    output = os.path.join(str(tmpdir), "output.mp4")
+
+    render(edl, camera_files, "v", output, {})
+
+    duration = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', output],
+        check=True, capture_output=True, text=True).stdout
+    assert float(duration) == pytest.approx(4.0, abs=0.05)
+    assert not os.path.exists(f"{output}.filtergraph")
+
+
+def probe_video(file_path):
+    """
+    Returns the duration and frame count of a video.
+    """
+    output = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-count_frames',
+         '-show_entries', 'stream=nb_read_frames:format=duration', '-of', 'json', file_path],
+        check=True, capture_output=True, text=True).stdout
+    probe = json.loads(output)
+    return float(probe["format"]["duration"]), int(probe["streams"][0]["nb_read_frames"])
+
+
+def test_render_video_in_parallel_chunks(camera_files, tmpdir, monkeypatch):
+    """
+    GIVEN two camera files
+    WHEN the video is rendered in three chunks at once
+    THEN check the joined video has every frame a single render has
+    """
+    monkeypatch.setenv("RENDER_CHUNKS", "3")
+    monkeypatch.setenv("RENDER_WORKERS", "3")
+    edl = EditDecisionList.from_transitions(
+        [(0, 1, 'speaker1'), (1, 2.5, 'speaker2'), (2.5, 4, 'speaker1')])
+    output = os.path.join(str(tmpdir), "chunked.mp4")
+
+    render_video(edl, camera_files, output, {})
+
+    duration, frames = probe_video(output)
+    assert frames == 100
+    assert duration == pytest.approx(4.0, abs=0.05)
+    assert os.listdir(str(tmpdir)).count("chunked.mp4.chunks.txt") == 0
@@ -0,0 +1,103 @@
+import subprocess
+
+import pytest
+
+from utils import ffmpeg_runner
+from utils.ffmpeg_runner import run_ffmpeg, estimate, parse_speed, CombinedProgress
+
+
+@pytest.fixture(autouse=True)
+def publish_every_update(monkeypatch):
+    """
+    Publishes every progress block, so short test renders report more than once.
+    """
+    monkeypatch.setenv("FFMPEG_PROGRESS_INTERVAL", "0")
+
+
+def tone_command(output, seconds=2):
+    return ['ffmpeg', '-y', '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+            '-ar', '8000', output]
+
+
+def test_estimate_uses_speed_then_elapsed_time():
+    """
+    GIVEN a run a quarter of the way through
+    WHEN its time left is estimated with and without ffmpeg's speed
+    THEN check the speed is used when known, and the elapsed time otherwise
+    """
+    assert estimate(15, 60, 2.0, 10) == {
+        "percent": 25.0, "out_seconds": 15, "duration": 60, "speed": 2.0, "eta_seconds": 22.5}
+    assert estimate(15, 60, None, 10)["eta_seconds"] == 30.0
+    assert estimate(15, None, 2.0, 10)["percent"] is None
+    assert estimate(None, 60, None, 0)["eta_seconds"] is None
+    assert estimate(59, 60, 2.0, 10, finished=True)["percent"] == 100.0
+    assert parse_speed("1.52x") == 1.52
+    assert parse_speed("N/A") is None
+
+
+def test_run_reports_progress_until_finished(tmp_path):
+    """
+    GIVEN an ffmpeg command rendering 2s of audio
+    WHEN it is run with its expected duration
+    THEN check progress is reported in order and ends at 100% with nothing left
+    """
+    updates = []
+    run_ffmpeg(tone_command(str(tmp_path / "tone.wav")), duration=2, on_progress=updates.append)
+
+    assert updates
+    percents = [update["percent"] for update in updates if update["percent"] is not None]
+    assert percents == sorted(percents)
+    assert updates[-1]["percent"] == 100.0
+    assert updates[-1]["eta_seconds"] == 0.0
+    assert updates[-1]["out_seconds"] == pytest.approx(2, abs=0.1)
+
+
+def test_run_reads_duration_from_the_input(tmp_path):
+    """
+    GIVEN a file with a known length
+    WHEN it is transcoded without passing a duration
+    THEN check the duration ffmpeg reports for the input is used
+    """
+    source = str(tmp_path / "tone.wav")
+    run_ffmpeg(tone_command(source, seconds=3), on_progress=lambda progress: None)
+
+    updates = []
+    run_ffmpeg(['ffmpeg', '-y', '-i', source, str(tmp_path / "tone.flac")],
+               on_progress=updates.append)
+
+    assert updates[-1]["duration"] == pytest.approx(3, abs=0.1)
+
+
+def test_failed_run_raises_with_stderr(tmp_path):
+    """
+    GIVEN an ffmpeg command whose input doesn't exist
+    WHEN it is run
+    THEN check it raises like subprocess.run(check=True), with ffmpeg's error output
+    """
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        run_ffmpeg(['ffmpeg', '-y', '-i', str(tmp_path / "missing.wav"),
+                    str(tmp_path / "out.wav")])
+
+    assert error.value.returncode != 0
+    assert b"missing.wav" in error.value.stderr
+
+
+def test_combined_progress_adds_up_parts(monkeypatch):
+    """
+    GIVEN two chunks of a 10s render running at once
+    WHEN both report how far they are
+    THEN check one run is published, with their output and speeds added up
+    """
+    published = []
+    monkeypatch.setattr(ffmpeg_runner, "publish_progress",
+                        lambda label, progress: published.append((label, progress)))
+    combined = CombinedProgress("render video", 10)
+
+    combined.part(0)(estimate(2, 5, 1.5, 1))
+    combined.part(1)(estimate(3, 5, 0.5, 1))
+
+    label, progress = published[-1]
+    assert label == "render video"
+    assert progress["percent"] == 50.0
+    assert progress["speed"] == 2.0
+    assert progress["eta_seconds"] == 2.5
@@ -0,0 +1,194 @@
+import os
+import time
+import pytest
+from utils import jobs
+
+
+def double(value):
+    """
+    Job used by the tests, must be module level so it can be sent to the pool.
+    """
+    jobs.report_progress(0.5, stage="doubling")
+    return value * 2
+
+
+def publish_segments(count):
+    """
+    Job used by the tests that publishes its result a piece at a time.
+    """
+    for i in range(count):
+        jobs.report_partial({"id": i})
+    return count
+
+
+def render_tone(output):
+    """
+    Job used by the tests that runs ffmpeg.
+    """
+    from utils.ffmpeg_runner import run_ffmpeg
+    run_ffmpeg(['ffmpeg', '-y', '-f', 'lavfi', '-i', 'sine=duration=1', output],
+               duration=1, label="tone")
+    return output
+
+
+def fail():
+    """
+    Job used by the tests that always fails.
+    """
+    raise ValueError("ffmpeg failed")
+
+
+def crash():
+    """
+    Job used by the tests that kills its pool worker, like the OOM killer would.
+    """
+    os._exit(1)
+
+
+def wait_for_job(job_id, timeout=30):
+    """
+    Polls a job until it is no longer queued or running.
+    :param job_id: the job to wait for.
+    :param timeout: seconds to wait before giving up.
+    """
+    start_time = time.time()
+    while time.time() - start_time < timeout:
+        job = jobs.get_job(job_id)
+        if job["status"] in ("finished", "failed"):
+            return job
+        time.sleep(0.1)
+    raise TimeoutError(job_id)
+
+
+@pytest.fixture(autouse=True, scope="module")
+def job_root(tmp_path_factory):
+    """
+    Keeps job records of these tests out of the real job folder.
+    The pool workers keep the environment they started with, so this is set once per module.
+    """
+    previous_root = os.environ.get("WORKSPACE_ROOT")
+    os.environ["WORKSPACE_ROOT"] = str(tmp_path_factory.mktemp("jobs"))
+    yield
+    if previous_root is None:
+        del os.environ["WORKSPACE_ROOT"]
+    else:
+        os.environ["WORKSPACE_ROOT"] = previous_root
+
+
+def test_submitted_job_returns_immediately_and_finishes():
+    """
+    GIVEN a job submitted to the pool
+    WHEN it has finished running
+    THEN check its result and progress are recorded
+    """
+    job = jobs.submit_job("test", double, 21)
+    assert job["status"] == "queued"
+
+    job = wait_for_job(job["job_id"])
+    assert job["status"] == "finished"
+    assert job["result"] == 42
+    assert job["progress"] == 1.0
+    assert job["stage"] == "doubling"
+
+
+def test_partial_results_are_read_once_in_order():
+    """
+    GIVEN a job that publishes its result in pieces
+    WHEN the pieces are read, then read again from where the last read stopped
+    THEN check every piece is read once, in order
+    """
+    job = wait_for_job(jobs.submit_job("test", publish_segments, 3)["job_id"])
+
+    items, position = jobs.read_partial(job["job_id"])
+    more_items, _ = jobs.read_partial(job["job_id"], position)
+
+    assert items == [{"id": 0}, {"id": 1}, {"id": 2}]
+    assert more_items == []
+    assert jobs.read_partial("not-a-job") == ([], 0)
+
+
+def test_ffmpeg_progress_is_recorded_in_the_job(tmp_path):
+    """
+    GIVEN a job that runs ffmpeg through the runner
+    WHEN it has finished running
+    THEN check the job record shows the run reached 100% with nothing left
+    """
+    job = wait_for_job(jobs.submit_job("test", render_tone, str(tmp_path / "tone.wav"))["job_id"])
+
+    assert job["status"] == "finished"
+    assert job["ffmpeg"]["label"] == "tone"
+    assert job["ffmpeg"]["percent"] == 100.0
+    assert job["ffmpeg"]["eta_seconds"] == 0.0
+
+
+def test_failed_job_records_error():
+    """
+    GIVEN a job that raises an exception
+    WHEN it has finished running
+    THEN check it is marked as failed with the error message
+    """
+    job = wait_for_job(jobs.submit_job("test", fail)["job_id"])
+    assert job["status"] == "failed"
+    assert job["error"] == "ffmpeg failed"
+
+
+def test_crashed_worker_fails_the_job_and_replaces_the_pool():
+    """
+    GIVEN a job whose pool worker dies while running it
+    WHEN another job is submitted afterwards
+    THEN check the crashed job is recorded as failed and the next one still runs
+    """
+    crashed = jobs.submit_job("test", crash)
+    job = wait_for_job(crashed["job_id"])
+    assert job["status"] == "failed"
+    assert "BrokenProcessPool" in job["error"]
+
+    job = wait_for_job(jobs.submit_job("test", double, 4)["job_id"])
+    assert job["status"] == "finished"
+    assert job["result"] == 8
+
+
+def test_unknown_job_ids_are_rejected():
+    """
+    GIVEN ids that were never issued, or try to escape the job folder
+    WHEN they are looked up
+    THEN check no job is returned
+    """
+    assert jobs.get_job("0" * 32) is None
+    assert jobs.get_job("../../etc/passwd") is None
+
+
+def cached_double(value):
+    """
+    Result cache lookup used by the tests, only 21 has been doubled before.
+    """
+    return 42 if value == 21 else None
+
+
+def test_cached_job_finishes_without_running():
+    """
+    GIVEN a job whose result is already cached
+    WHEN it is submitted
+    THEN check it is finished straight away, and a miss is still queued
+    """
+    job = jobs.submit_cached_job("test", cached_double, fail, 21)
+    assert job["status"] == "finished"
+    assert job["result"] == 42
+    assert jobs.get_job(job["job_id"])["cached"]
+
+    job = wait_for_job(jobs.submit_cached_job("test", cached_double, double, 5)["job_id"])
+    assert job["result"] == 10
+
+
+def test_job_limit_is_shared_between_api_workers(monkeypatch):
+    """
+    GIVEN a limit of 8 jobs and 3 gunicorn workers, then more workers than jobs
+    WHEN each worker sizes its pool
+    THEN check the workers don't run more than the limit between them, but at least one job each
+    """
+    monkeypatch.setenv("MAX_CONCURRENT_JOBS", "8")
+    monkeypatch.setenv("API_WORKERS", "3")
+    assert jobs.get_jobs_per_worker() == 2
+
+    monkeypatch.setenv("API_WORKERS", "16")
+    assert jobs.get_jobs_per_worker() == 1
@@ -0,0 +1,138 @@
+import re
+import subprocess
+
+import numpy as np
+import pytest
+
+from utils.loudness import analyse_blocks, analyse_file
+
+RATE = 48_000
+
+
+def tone(seconds, level_db=0.0, frequency=997):
+    """
+    Builds a sine wave peaking at level_db dBFS.
+    """
+    t = np.arange(int(seconds * RATE)) / RATE
+    return 10 ** (level_db / 20) * np.sin(2 * np.pi * frequency * t)
+
+
+def test_full_scale_tone_matches_the_standard():
+    """
+    GIVEN a 997Hz sine at 0dBFS in one channel
+    WHEN it is analysed
+    THEN check it measures -3.01 LUFS, as BS.1770 specifies, with matching peak and RMS
+    """
+    report = analyse_blocks([tone(10)])
+
+    assert report["integrated_lufs"] == pytest.approx(-3.01, abs=0.02)
+    assert report["peak_db"] == pytest.approx(0.0, abs=0.01)
+    assert report["rms_db"] == pytest.approx(-3.01, abs=0.01)
+    assert report["crest_db"] == pytest.approx(3.01, abs=0.02)
+    assert report["duration"] == 10.0
+
+
+def test_block_boundaries_do_not_change_the_result():
+    """
+    GIVEN the same audio split into blocks of different sizes
+    WHEN each is analysed
+    THEN check the reports are the same
+    """
+    samples = np.random.default_rng(0).normal(0, 0.1, 5 * RATE)
+
+    whole = analyse_blocks([samples])
+    pieces = analyse_blocks(np.array_split(samples, [1, 4_801, 100_000, 100_003]))
+
+    assert pieces == whole
+
+
+def test_channels_are_reported_separately():
+    """
+    GIVEN a stereo signal with a tone on the left and silence on the right
+    WHEN it is analysed
+    THEN check the silent channel has no levels and both together are 3dB quieter than the left
+    """
+    left = tone(5, -20)
+    report = analyse_blocks([np.stack([left, np.zeros_like(left)], axis=1)])
+
+    assert report["channels"][1]["peak_db"] is None
+    assert report["channels"][1]["integrated_lufs"] is None
+    assert report["channels"][0]["integrated_lufs"] == pytest.approx(-23.01, abs=0.02)
+    assert report["integrated_lufs"] == report["channels"][0]["integrated_lufs"]
+    assert report["rms_db"] == pytest.approx(report["channels"][0]["rms_db"] - 3.01, abs=0.01)
+
+
+def test_loudness_range_of_alternating_levels():
+    """
+    GIVEN a tone switching between -20 and -30dBFS every 10s
+    WHEN it is analysed
+    THEN check the loudness range is the 10 LU between them
+    """
+    samples = np.concatenate([tone(10, level) for level in (-20, -30, -20, -30, -20, -30)])
+
+    report = analyse_blocks([samples])
+
+    assert report["loudness_range"] == pytest.approx(10.0, abs=0.2)
+    assert report["short_term_max_lufs"] == pytest.approx(-23.01, abs=0.05)
+
+
+def test_silence_has_no_levels():
+    """
+    GIVEN silent audio, and no audio at all
+    WHEN they are analysed
+    THEN check every level is None rather than minus infinity
+    """
+    silent = analyse_blocks([np.zeros(RATE)])
+    empty = analyse_blocks([])
+
+    for report in (silent, empty):
+        assert report["peak_db"] is None
+        assert report["integrated_lufs"] is None
+        assert report["loudness_range"] is None
+    assert empty["duration"] == 0.0
+
+
+def test_file_matches_ffmpeg_ebur128(mock_audio_file):
+    """
+    GIVEN an audio file
+    WHEN it is analysed
+    THEN check the integrated loudness agrees with ffmpeg's ebur128 filter
+    """
+    report = analyse_file(mock_audio_file)
+    result = subprocess.run(
+        ['ffmpeg', '-nostats', '-i', mock_audio_file, '-af', 'ebur128', '-f', 'null', '-'],
+        capture_output=True, text=True, check=True)
+    summary = result.stderr[result.stderr.rfind("Summary"):]
+    expected = float(re.search(r"I:\s+(-?[\d.]+) LUFS", summary).group(1))
+
+    assert len(report["channels"]) == 2
+    assert report["integrated_lufs"] == pytest.approx(expected, abs=0.2)
+
+
+def astats_levels(file_path):
+    """
+    Reads the overall peak and RMS levels ffmpeg's astats filter measures for a file.
+    """
+    result = subprocess.run(['ffmpeg', '-nostats', '-i', file_path, '-af', 'astats',
+                             '-f', 'null', '-'], capture_output=True, text=True, check=True)
+    overall = result.stderr[result.stderr.rfind("Overall"):]
+    return (float(re.search(r"Peak level dB: (-?[\d.]+)", overall).group(1)),
+            float(re.search(r"RMS level dB: (-?[\d.]+)", overall).group(1)))
+
+
+def test_mono_file_matches_astats(tmp_path):
+    """
+    GIVEN a quiet mono recording at 44.1kHz
+    WHEN it is analysed
+    THEN check it is measured in one channel, with the same peak and RMS as astats
+    """
+    file_path = str(tmp_path / "mono.wav")
+    subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'anoisesrc=seed=1:amplitude=0.05',
+                    '-t', '5', '-ar', '44100', '-ac', '1', file_path], check=True)
+    expected_peak, expected_rms = astats_levels(file_path)
+
+    report = analyse_file(file_path)
+
+    assert len(report["channels"]) == 1
+    assert report["peak_db"] == pytest.approx(expected_peak, abs=0.01)
+    assert report["rms_db"] == pytest.approx(expected_rms, abs=0.01)
@@ -0,0 +1,109 @@
+import os
+import wave
+import numpy as np
+import pytest
+from utils.mediaSelector import choose_highest_sounds
+from utils.pcm_stream import stream_pcm, decode_pcm
+
+SAMPLE_RATE = 16_000
+
+
+def write_wav(file_path, samples):
+    """
+    Writes mono float samples to a 16 bit wav file.
+    :param file_path: where the file is written.
+    :param samples: numpy array of samples between -1 and 1.
+    """
+    with wave.open(file_path, 'wb') as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(SAMPLE_RATE)
+        file.writeframes((np.clip(samples, -1, 1) * 32767).astype(np.int16).tobytes())
+
+
+@pytest.fixture
+def speaker_files(tmpdir):
+    """
+    Mocks two speakers taking turns every 2 seconds for 8 seconds, plus a wide shot.
+    :param tmpdir: Temporary directory to store mocked files.
+    """
+    rng = np.random.default_rng(0)
+    times = np.arange(8 * SAMPLE_RATE) / SAMPLE_RATE
+    first_speaking = (times % 4) < 2
+    files = {
+        'speaker1': (np.where(first_speaking, 0.5, 0.01)),
+        'speaker2': (np.where(first_speaking, 0.01, 0.5)),
+        'wide': np.full(len(times), 0.1),
+    }
+    paths = {}
+    for name, volume in files.items():
+        paths[name] = os.path.join(str(tmpdir), f"{name}.wav")
+        write_wav(paths[name], rng.standard_normal(len(times)) * 0.3 * volume)
+    return paths
+
+
+def test_choose_highest_sounds_follows_loudest_speaker(speaker_files):
+    """
+    GIVEN two speakers taking turns every 2 seconds
+    WHEN the shots are chosen one second at a time
+    THEN check each second shows whoever is speaking
+    """
+    transitions = choose_highest_sounds(speaker_files)
+
+    assert [start for start, _, _ in transitions] == list(range(8))
+    assert [shot for _, _, shot in transitions] == \
+        ['speaker1'] * 2 + ['speaker2'] * 2 + ['speaker1'] * 2 + ['speaker2'] * 2
+
+
+def test_choose_highest_sounds_supports_short_windows(speaker_files):
+    """
+    GIVEN two speakers taking turns every 2 seconds
+    WHEN the shots are chosen every quarter of a second
+    THEN check there are four decisions per second that still follow the speaker
+    """
+    transitions = choose_highest_sounds(speaker_files, window_seconds=0.25)
+
+    assert len(transitions) == 32
+    assert transitions[1] == (0.25, 0.5, 'speaker1')
+    assert transitions[8][2] == 'speaker2'
+
+
+def test_choose_highest_sounds_uses_every_speaker(speaker_files):
+    """
+    GIVEN one speaker on their own, and two speakers recorded under other shot names
+    WHEN the shots are chosen
+    THEN check the shots are named after the recordings, and the wide shot is never a speaker
+    """
+    alone = choose_highest_sounds({'speaker1': speaker_files['speaker1'],
+                                   'wide': speaker_files['wide']})
+    renamed = choose_highest_sounds({'wide': speaker_files['wide'],
+                                     'speaker4': speaker_files['speaker2'],
+                                     'speaker3': speaker_files['speaker1']})
+
+    assert {shot for _, _, shot in alone} == {'speaker1'}
+    assert [shot for _, _, shot in renamed][:4] == ['speaker3'] * 2 + ['speaker4'] * 2
+
+
+def test_stream_pcm_yields_fixed_size_blocks(speaker_files):
+    """
+    GIVEN an 8 second audio file
+    WHEN it is streamed in 3 second blocks
+    THEN check every block but the last is full size and no samples are lost
+    """
+    blocks = list(stream_pcm(speaker_files['wide'], 8_000, block_size=3 * 8_000))
+
+    assert [len(block) for block in blocks] == [24_000, 24_000, 16_000]
+    assert all(block.dtype == np.float32 for block in blocks)
+
+
+def test_decode_pcm_resamples_in_memory(speaker_files):
+    """
+    GIVEN an 8 second 16kHz audio file
+    WHEN it is decoded for whisper
+    THEN check it comes back as 16kHz mono float32 samples in one array
+    """
+    samples = decode_pcm(speaker_files['wide'], 16_000)
+
+    assert samples.dtype == np.float32
+    assert samples.shape == (8 * 16_000,)
+    assert np.abs(samples).max() <= 1.0
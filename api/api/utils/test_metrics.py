@@ -0,0 +1,63 @@
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+from utils import metrics
+
+
+def test_span_times_the_stages_of_a_job(capsys):
+    """
+    GIVEN a job going through two stages
+    WHEN the job finishes
+    THEN check both stages are in its timings, in order, and logged as JSON
+    """
+    metrics.start_job("0" * 32, "merge")
+    with metrics.span("merge", "download") as details:
+        details["bytes"] = 1024
+    with metrics.span("merge", "render"):
+        pass
+
+    timings = metrics.finish_job("finished", 1.5)
+
+    assert [(timing["stage"], timing["status"]) for timing in timings] == [
+        ("download", "ok"), ("render", "ok")]
+    assert timings[0]["bytes"] == 1024
+    job_log = json.loads(capsys.readouterr().err.strip().splitlines()[-1])
+    assert job_log["event"] == "job" and job_log["kind"] == "merge"
+
+
+def test_failed_ffmpeg_stage_is_counted():
+    """
+    GIVEN a stage whose ffmpeg run fails
+    WHEN the metrics are exported
+    THEN check the failure and the exit code are counted
+    """
+    with pytest.raises(subprocess.CalledProcessError):
+        with metrics.span("export", "render", uses_ffmpeg=True):
+            raise subprocess.CalledProcessError(183, ["ffmpeg"])
+
+    exported = metrics.generate_metrics().decode()
+
+    assert 'ffmpeg_exits_total{pipeline="export",returncode="183",stage="render"}' in exported
+    assert 'pipeline_stage_failures_total{pipeline="export",stage="render"}' in exported
+    assert 'pipeline_stage_seconds_bucket' in exported
+
+
+def test_metrics_route_records_in_multiprocess_mode(tmpdir):
+    """
+    GIVEN a fresh process without PROMETHEUS_MULTIPROC_DIR set
+    WHEN the metrics route is imported
+    THEN check prometheus_client shares its metrics through files
+    """
+    env = {key: value for key, value in os.environ.items() if key != "PROMETHEUS_MULTIPROC_DIR"}
+    env["WORKSPACE_ROOT"] = str(tmpdir)
+    result = subprocess.run(
+        [sys.executable, "-c",
+         "from routes import metrics_route; from prometheus_client import values; "
+         "print(values.ValueClass.__name__)"],
+        env=env, capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == "MmapedValue"
@@ -0,0 +1,72 @@
+import threading
+import time
+from utils.model_registry import ModelRegistry
+
+
+class FakeModel:
+    """
+    Stands in for a whisper model so the registry can be tested without loading weights.
+    """
+
+    def __init__(self, name, device):
+        self.name = name
+        self.device = device
+
+    def parameters(self):
+        return []
+
+    def buffers(self):
+        return []
+
+
+def make_loader(calls):
+    """
+    Creates a loader that records every (name, device) it is asked to load.
+    :param calls: list the loads are appended to.
+    """
+    def loader(name, device):
+        calls.append((name, device))
+        time.sleep(0.05)
+        return FakeModel(name, device)
+    return loader
+
+
+def test_model_is_loaded_once_and_shared():
+    """
+    GIVEN a registry used by several threads at once
+    WHEN they all ask for the same model
+    THEN check the model is loaded once and every thread gets the same instance
+    """
+    calls = []
+    registry = ModelRegistry(max_models=1, loader=make_loader(calls))
+    models = []
+
+    threads = [threading.Thread(target=lambda: models.append(registry.get("base.en", "cpu")))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [("base.en", "cpu")]
+    assert all(model is models[0] for model in models)
+    assert registry.stats()[0]["hits"] == 3
+
+
+def test_least_recently_used_model_is_dropped():
+    """
+    GIVEN a registry that may hold two models
+    WHEN a third model is requested
+    THEN check the least recently used model is dropped and reloaded when asked for again
+    """
+    calls = []
+    registry = ModelRegistry(max_models=2, loader=make_loader(calls))
+
+    registry.get("base.en", "cpu")
+    registry.get("small.en", "cpu")
+    registry.get("base.en", "cpu")
+    registry.get("medium.en", "cpu")
+    registry.get("small.en", "cpu")
+
+    assert [name for name, _ in calls] == ["base.en", "small.en", "medium.en", "small.en"]
+    assert {stats["model"] for stats in registry.stats()} == {"medium.en", "small.en"}
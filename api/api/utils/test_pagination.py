@@ -0,0 +1,31 @@
+from datetime import datetime
+
+import pytest
+
+from utils.pagination import encode_cursor, decode_cursor, get_page_size, parse_size
+
+
+def test_cursor_round_trip():
+    """
+    GIVEN the sort key of the last project on a page
+    WHEN it is turned into a cursor token and read back
+    THEN check the same values come back, with the date as an ISO string
+    """
+    token = encode_cursor([datetime(2024, 1, 5, 12, 30), 42])
+
+    assert decode_cursor(token) == ["2024-01-05T12:30:00", 42]
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
+
+
+def test_page_size_and_display_sizes():
+    """
+    GIVEN page sizes and display sizes sent by the frontend
+    WHEN they are read
+    THEN check page sizes are clamped and display sizes are converted to bytes
+    """
+    assert get_page_size(None) == 50
+    assert get_page_size("10000") == 500
+    assert parse_size("12.50MB") == 12_500_000
+    assert parse_size("0B") == 0
+    assert parse_size("very big!") == 0
@@ -0,0 +1,91 @@
+import os
+import subprocess
+
+import numpy as np
+import pytest
+
+from utils.pcm_cache import PcmCache, pcm_cache, get_active_cache
+from utils.pcm_stream import decode_pcm, stream_pcm, windowed_abs_sums
+
+
+def test_source_is_decoded_once(mock_audio_file, tmpdir):
+    """
+    GIVEN an audio file
+    WHEN its samples are asked for twice
+    THEN check it is decoded once, and matches decoding it straight through a pipe
+    """
+    cache = PcmCache(str(tmpdir.join("pcm")))
+
+    first = cache.samples(mock_audio_file, 16_000)
+    second = cache.samples(mock_audio_file, 16_000)
+
+    assert isinstance(first, np.memmap)
+    assert cache.stats == {"hits": 1, "decoded": 1, "resampled": 0}
+    assert np.array_equal(first, second)
+    np.testing.assert_allclose(first, decode_pcm(mock_audio_file, 16_000), atol=1e-6)
+
+
+def test_lower_rates_are_resampled_from_the_cached_decode(mock_audio_file, tmpdir):
+    """
+    GIVEN an audio file 10s long
+    WHEN it is asked for at two rates below the canonical one
+    THEN check the source is only decoded once and each rate has the right length
+    """
+    cache = PcmCache(str(tmpdir.join("pcm")))
+
+    eight = cache.samples(mock_audio_file, 8_000)
+    four = cache.samples(mock_audio_file, 4_000)
+
+    assert cache.stats == {"hits": 1, "decoded": 1, "resampled": 2}
+    assert abs(len(eight) - 80_000) <= 80
+    assert abs(len(four) - 40_000) <= 40
+
+
+def test_rewritten_source_is_decoded_again(mock_audio_file, tmpdir):
+    """
+    GIVEN a cached decode of a file
+    WHEN the file is written again
+    THEN check the new content is decoded rather than the old one being served
+    """
+    cache = PcmCache(str(tmpdir.join("pcm")))
+    cache.samples(mock_audio_file, 16_000)
+
+    with open(mock_audio_file, "r+b") as file:
+        file.truncate(os.path.getsize(mock_audio_file) // 2)
+    samples = cache.samples(mock_audio_file, 16_000)
+
+    assert cache.stats["decoded"] == 2
+    assert abs(len(samples) - 80_000) <= 1_600
+
+
+@pytest.fixture
+def seeded_noise(tmpdir):
+    """
+    10s of the same noise on every run, so the comparisons below don't depend on chance.
+    """
+    file_path = str(tmpdir.join("seeded_noise.wav"))
+    subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'anoisesrc=seed=1', '-t', '10',
+                    '-ar', '44100', '-ac', '2', '-c:a', 'pcm_s16le', file_path], check=True)
+    return file_path
+
+
+def test_streams_read_from_the_active_cache(seeded_noise, tmpdir):
+    """
+    GIVEN an active pcm_cache
+    WHEN a file is streamed in blocks and analysed
+    THEN check the blocks come from the cache and the analysis matches decoding without it,
+         apart from the small difference of resampling from the canonical decode
+    """
+    expected_sums, expected_peak, expected_count = windowed_abs_sums(seeded_noise, 80)
+
+    with pcm_cache(str(tmpdir.join("pcm"))) as cache:
+        blocks = list(stream_pcm(seeded_noise, 8_000, block_size=30_000))
+        sums, peak, count = windowed_abs_sums(seeded_noise, 80)
+
+    assert get_active_cache() is None
+    assert cache.stats["decoded"] == 1
+    assert [len(block) for block in blocks[:-1]] == [30_000] * (len(blocks) - 1)
+    assert count == expected_count
+    assert abs(peak - expected_peak) < 1e-4
+    # The resamplers' filters run out differently at the end of the file, so the last window is left out
+    np.testing.assert_allclose(sums[:-1], expected_sums[:-1], rtol=1e-3)
@@ -0,0 +1,135 @@
+import io
+import hashlib
+
+import pytest
+from botocore.exceptions import ClientError
+
+from utils import result_cache
+
+
+class FakeS3Client:
+    """
+    Keeps objects in a dict, with an md5 ETag like S3 gives single part uploads.
+    """
+
+    def __init__(self):
+        self.objects = {}
+
+    def _get(self, bucket, key, operation):
+        if (bucket, key) not in self.objects:
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, operation)
+        return self.objects[(bucket, key)]
+
+    def put(self, bucket, key, data: bytes):
+        self.objects[(bucket, key)] = data
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.put(Bucket, Key, Body)
+
+    def head_object(self, Bucket, Key):
+        data = self._get(Bucket, Key, "HeadObject")
+        return {"ETag": f'"{hashlib.md5(data).hexdigest()}"', "ContentLength": len(data)}
+
+    def get_object(self, Bucket, Key):
+        data = self._get(Bucket, Key, "GetObject")
+        return {"Body": io.BytesIO(data), **self.head_object(Bucket, Key)}
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        self.put(Bucket, Key, self._get(CopySource["Bucket"], CopySource["Key"], "CopyObject"))
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+@pytest.fixture
+def s3_client():
+    client = FakeS3Client()
+    client.put("project-1", "general/wide.mp4", b"wide")
+    return client
+
+
+def run_pipeline(s3_client, output_key, data: bytes, params):
+    """
+    Caches the result of a pretend pipeline run on general/wide.mp4.
+    """
+    inputs = {"general/wide.mp4": s3_client.head_object("project-1", "general/wide.mp4")["ETag"]}
+    digest = result_cache.cache_key("merge", inputs, params)
+    s3_client.put("project-1", output_key, data)
+    result_cache.store(s3_client, "project-1", digest, "merge", inputs, output_key)
+    return digest
+
+
+def test_identical_run_hits_cache(s3_client):
+    """
+    GIVEN a cached pipeline result
+    WHEN the same inputs and parameters are looked up, and then different parameters
+    THEN check only the identical run is a hit
+    """
+    digest = run_pipeline(s3_client, "final-product/final_podcast.mp4", b"podcast", {"gain": 10})
+    assert result_cache.lookup(s3_client, "project-1", digest) == "final-product/final_podcast.mp4"
+
+    other = result_cache.cache_key("merge", {"general/wide.mp4": "x"}, {"gain": 11})
+    assert result_cache.lookup(s3_client, "project-1", other) is None
+
+
+def test_overwritten_artifact_is_restored(s3_client):
+    """
+    GIVEN a cached result whose artifact was overwritten by a run with other settings
+    WHEN the first run is looked up again
+    THEN check the cached copy is put back in place
+    """
+    first = run_pipeline(s3_client, "final-product/final_podcast.mp4", b"gain 10", {"gain": 10})
+    run_pipeline(s3_client, "final-product/final_podcast.mp4", b"gain 20", {"gain": 20})
+
+    assert result_cache.lookup(s3_client, "project-1", first)
+    assert s3_client.objects[("project-1", "final-product/final_podcast.mp4")] == b"gain 10"
+
+
+def test_every_artifact_of_a_run_is_restored(s3_client):
+    """
+    GIVEN a cached run with two artifacts, both overwritten by a run with other settings
+    WHEN the first run is looked up again
+    THEN check both cached copies are put back
+    """
+    inputs = {"general/wide.mp4": s3_client.head_object("project-1", "general/wide.mp4")["ETag"]}
+    digest = result_cache.cache_key("merge", inputs, {"gain": 10})
+    s3_client.put("project-1", "final-product/final_podcast.mp4", b"gain 10")
+    s3_client.put("project-1", "final-product/dead_sections.json", b"[[1, 2]]")
+    result_cache.store(s3_client, "project-1", digest, "merge", inputs,
+                       "final-product/final_podcast.mp4", ["final-product/dead_sections.json"])
+    s3_client.put("project-1", "final-product/final_podcast.mp4", b"gain 20")
+    s3_client.put("project-1", "final-product/dead_sections.json", b"[]")
+
+    assert result_cache.lookup(s3_client, "project-1", digest)
+    assert s3_client.objects[("project-1", "final-product/final_podcast.mp4")] == b"gain 10"
+    assert s3_client.objects[("project-1", "final-product/dead_sections.json")] == b"[[1, 2]]"
+
+
+def test_least_recently_used_results_are_evicted(s3_client, monkeypatch):
+    """
+    GIVEN a cache that only has room for two results
+    WHEN a third is stored
+    THEN check the least recently used one is dropped along with its copy
+    """
+    monkeypatch.setenv("RESULT_CACHE_MAX_BYTES", "10")
+    first = run_pipeline(s3_client, "final-product/a.mp4", b"aaaa", {"run": 1})
+    second = run_pipeline(s3_client, "final-product/b.mp4", b"bbbb", {"run": 2})
+    result_cache.lookup(s3_client, "project-1", first)
+    run_pipeline(s3_client, "final-product/c.mp4", b"cccc", {"run": 3})
+
+    assert result_cache.lookup(s3_client, "project-1", first)
+    assert result_cache.lookup(s3_client, "project-1", second) is None
+    assert ("project-1", f"cache/{second}/b.mp4") not in s3_client.objects
+
+
+def test_changed_source_media_invalidates_results(s3_client):
+    """
+    GIVEN a cached result
+    WHEN a source file it was made from is replaced and the cache is invalidated
+    THEN check the result is dropped
+    """
+    digest = run_pipeline(s3_client, "final-product/final_podcast.mp4", b"podcast", {})
+    s3_client.put("project-1", "general/wide.mp4", b"new recording")
+
+    assert result_cache.invalidate(s3_client, "project-1", ["general/wide.mp4"]) == 1
+    assert result_cache.lookup(s3_client, "project-1", digest) is None
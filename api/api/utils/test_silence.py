@@ -0,0 +1,92 @@
+import os
+import wave
+
+import numpy as np
+import pytest
+
+from utils.silence import silent_frames, silent_ranges, detect_silence, ranges_to_timestamps
+from utils.exportPodcast import trim_sections_from_timestamps, merge_trim_sections, trim_to_keep
+
+SAMPLE_RATE = 16_000
+
+
+@pytest.fixture
+def podcast_with_pauses(tmpdir):
+    """
+    Mocks 10 seconds of audio: talking, a 3 second pause from 2s to 5s,
+    talking, and a half second breath from 7s to 7.5s.
+    :param tmpdir: Temporary directory to store mocked file.
+    """
+    rng = np.random.default_rng(4)
+    times = np.arange(10 * SAMPLE_RATE) / SAMPLE_RATE
+    quiet = ((times >= 2) & (times < 5)) | ((times >= 7) & (times < 7.5))
+    samples = rng.standard_normal(len(times)) * np.where(quiet, 0.0005, 0.2)
+
+    file_path = os.path.join(str(tmpdir), "podcast.wav")
+    with wave.open(file_path, 'wb') as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(SAMPLE_RATE)
+        file.writeframes((np.clip(samples, -1, 1) * 32767).astype(np.int16).tobytes())
+    return file_path
+
+
+def test_hysteresis_ignores_levels_near_the_threshold():
+    """
+    GIVEN a level that dips below the threshold then hovers just above it
+    WHEN the silent frames are found
+    THEN check the silence only ends once the level is clearly louder
+    """
+    levels = np.array([-20, -45, -38, -42, -37, -30, -20])
+
+    silent = silent_frames(levels, threshold_db=-40, hysteresis_db=6)
+
+    assert silent.tolist() == [False, True, True, True, True, False, False]
+
+
+def test_short_silences_and_padding():
+    """
+    GIVEN silent frames of different lengths
+    WHEN they are turned into ranges
+    THEN check short silences are kept in and the rest are padded
+    """
+    silent = np.array([0] * 10 + [1] * 30 + [0] * 10 + [1] * 5 + [0] * 5, dtype=bool)
+
+    ranges = silent_ranges(silent, frame_seconds=0.1, min_seconds=1.0, padding_seconds=0.25)
+
+    assert ranges == [(1.25, 3.75)]
+
+
+def test_detect_silence_finds_pauses(podcast_with_pauses):
+    """
+    GIVEN a podcast with a long pause and a short breath
+    WHEN its dead sections are found
+    THEN check only the long pause is removed, with padding either side
+    """
+    ranges = detect_silence(podcast_with_pauses)
+
+    assert len(ranges) == 1
+    assert ranges[0][0] == pytest.approx(2.25, abs=0.03)
+    assert ranges[0][1] == pytest.approx(4.75, abs=0.03)
+
+
+def test_dead_sections_merge_with_deleted_words():
+    """
+    GIVEN dead sections and deleted words that overlap
+    WHEN they are read back as trim sections and combined
+    THEN check the export keeps everything else
+    """
+    dead_sections = ranges_to_timestamps([(2.25, 4.75)])
+    deleted_words = [
+        {"index": [0, 3], "payload": {"id": 3, "start": 4.5, "end": 5.1, "text": "um"},
+         "enabled": False},
+        {"index": [0, 4], "payload": {"id": 4, "start": 5.1, "end": 5.4, "text": "so"},
+         "enabled": True},
+    ]
+
+    trim_sections = merge_trim_sections(
+        trim_sections_from_timestamps(deleted_words),
+        trim_sections_from_timestamps(dead_sections))
+
+    assert trim_sections == [(2.25, 5.1, 0)]
+    assert trim_to_keep(trim_sections) == [(0.0, 2.25, 0), (5.1, None, 0)]
@@ -0,0 +1,106 @@
+import os
+import subprocess
+import numpy as np
+import pytest
+from utils.probe import probe_media
+from utils.smart_cut import plan_pieces, smart_cut, check_pieces, render_audio
+from utils.workspace import Workspace
+
+
+def test_plan_pieces_copies_whole_gops():
+    """
+    GIVEN a 10 second video with a keyframe every second
+    WHEN sections are kept that start and end between keyframes
+    THEN check only the partial GOPs at each edge are re-encoded
+    """
+    keyframes = np.arange(0.0, 10.0)
+    kept_sections = [(0.0, 2.5, 0), (4.2, None, 0)]
+
+    pieces = plan_pieces(kept_sections, keyframes, 10.0)
+
+    assert pieces == [
+        (0.0, 2.0, "copy"),
+        (2.0, 2.5, "encode"),
+        (4.2, 5.0, "encode"),
+        (5.0, 10.0, "copy"),
+    ]
+
+
+def test_plan_pieces_encodes_sections_within_one_gop():
+    """
+    GIVEN a video with a keyframe every 5 seconds
+    WHEN a section is kept that doesn't contain a whole GOP
+    THEN check it is re-encoded as one piece
+    """
+    pieces = plan_pieces([(1.0, 4.0, 0)], np.array([0.0, 5.0]), 10.0)
+
+    assert pieces == [(1.0, 4.0, "encode")]
+
+
+def test_smart_cut_keeps_only_the_kept_sections(tmpdir):
+    """
+    GIVEN a 10 second video with audio and a keyframe every second
+    WHEN it is smart cut down to 7.5 seconds
+    THEN check the output has the right length and some of it was stream copied
+    """
+    source = str(tmpdir.join("source.mp4"))
+    output = str(tmpdir.join("cut.mp4"))
+    subprocess.run([
+        'ffmpeg', '-f', 'lavfi', '-i', 'testsrc=s=320x240:r=25:d=10',
+        '-f', 'lavfi', '-i', 'sine=d=10',
+        '-c:v', 'libx264', '-g', '25', '-sc_threshold', '0',
+        '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-shortest', source
+    ], check=True)
+
+    workspace = Workspace("test", root=str(tmpdir))
+    pieces = smart_cut(source, [(0, 2.5, 0), (4.2, 7.3, 0), (8.1, None, 0)], output, workspace)
+    workspace.clean()
+
+    assert any(mode == "copy" for _, _, mode in pieces)
+    assert np.isclose(probe_media(output)["duration"], 7.5, atol=0.1)
+
+
+def test_render_audio_passes_the_graph_in_a_script_file(tmpdir):
+    """
+    GIVEN a 10 second tone
+    WHEN 200 short sections of it are cut out
+    THEN check the kept audio has the right length and the script file is removed
+    """
+    source = str(tmpdir.join("source.m4a"))
+    output = str(tmpdir.join("cut.m4a"))
+    subprocess.run(['ffmpeg', '-f', 'lavfi', '-i', 'sine=d=10', '-c:a', 'aac', source], check=True)
+
+    kept_sections = [(i * 0.05, i * 0.05 + 0.025, 0) for i in range(200)]
+    render_audio(source, kept_sections, output, 5)
+
+    assert np.isclose(probe_media(output)["duration"], 5, atol=0.1)
+    assert not os.path.exists(f"{output}.filtergraph")
+
+
+def test_encoded_pieces_match_the_source_parameters(tmpdir):
+    """
+    GIVEN a Main profile BT.709 video in a 90kHz timescale, unlike libx264's defaults
+    WHEN it is smart cut
+    THEN check the re-encoded pieces are made with the same parameters, and a piece
+         that doesn't match is refused
+    """
+    source = str(tmpdir.join("source.mp4"))
+    output = str(tmpdir.join("cut.mp4"))
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc=s=320x240:r=25:d=6',
+        '-c:v', 'libx264', '-profile:v', 'main', '-g', '25', '-sc_threshold', '0',
+        '-pix_fmt', 'yuv420p', '-color_primaries', 'bt709', '-color_trc', 'bt709',
+        '-colorspace', 'bt709', '-video_track_timescale', '90000', source
+    ], check=True)
+    info = probe_media(source)
+
+    workspace = Workspace("test", root=str(tmpdir))
+    pieces = smart_cut(source, [(0.5, 4.5, 0)], output, workspace)
+    check_pieces([workspace.path("piece_0000.mp4")], info)
+    info["video"]["profile"] = "High"
+    with pytest.raises(ValueError):
+        check_pieces([workspace.path("piece_0000.mp4")], info)
+    workspace.clean()
+
+    assert pieces[0][2] == "encode"
+    assert probe_media(output)["video"]["profile"] == "Main"
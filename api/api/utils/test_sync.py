@@ -0,0 +1,107 @@
+import os
+import time
+import wave
+
+import numpy as np
+import pytest
+
+from utils.sync import ENVELOPE_RATE, correlate_envelopes, estimate_offsets, confident_offsets
+
+SAMPLE_RATE = 16_000
+
+
+def speech_like(seconds, rng):
+    """
+    Makes noise that switches on and off at random, like someone talking.
+    """
+    bursts = rng.random(int(seconds * 4)) > 0.5
+    volume = np.repeat(bursts, SAMPLE_RATE // 4).astype(np.float64) + 0.05
+    return rng.standard_normal(len(volume)) * 0.2 * volume
+
+
+def write_wav(file_path, samples):
+    with wave.open(file_path, 'wb') as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(SAMPLE_RATE)
+        file.writeframes((np.clip(samples, -1, 1) * 32767).astype(np.int16).tobytes())
+
+
+@pytest.fixture
+def shifted_recordings(tmpdir):
+    """
+    Mocks a 20 second wide shot, a microphone that started recording 1.37s
+    earlier, one that started 0.6s later, and one that heard something else.
+    :param tmpdir: Temporary directory to store mocked files.
+    """
+    rng = np.random.default_rng(1)
+    conversation = speech_like(22, rng)
+    start = 2 * SAMPLE_RATE
+    recordings = {
+        'wide': conversation[start:start + 20 * SAMPLE_RATE],
+        'speaker1': conversation[start - int(1.37 * SAMPLE_RATE):] * 2,
+        'speaker2': conversation[start + int(0.6 * SAMPLE_RATE):],
+        'speaker3': speech_like(20, rng),
+    }
+    paths = {}
+    for name, samples in recordings.items():
+        paths[name] = os.path.join(str(tmpdir), f"{name}.wav")
+        write_wav(paths[name], samples)
+    return paths
+
+
+def test_estimate_offsets_finds_shift(shifted_recordings):
+    """
+    GIVEN microphones that started recording before and after the wide shot
+    WHEN their offsets are estimated
+    THEN check each is found to within 10ms, and an unrelated recording isn't used
+    """
+    estimates = estimate_offsets(shifted_recordings)
+
+    assert estimates['speaker1']['offset'] == pytest.approx(1.37, abs=0.01)
+    assert estimates['speaker2']['offset'] == pytest.approx(-0.6, abs=0.01)
+    assert estimates['speaker1']['confidence'] > 0.5
+    assert set(confident_offsets(estimates)) == {'speaker1', 'speaker2'}
+
+
+def test_zero_max_offset_only_checks_no_shift(shifted_recordings):
+    """
+    GIVEN microphones that are out of sync with the wide shot
+    WHEN their offsets are estimated with a max offset of 0
+    THEN check they are all found to be in sync, rather than searched with the default
+    """
+    estimates = estimate_offsets(shifted_recordings, max_offset_seconds=0)
+
+    assert all(estimate['offset'] == 0 for estimate in estimates.values())
+
+
+def test_search_is_bounded():
+    """
+    GIVEN two envelopes 5 seconds out of sync
+    WHEN only offsets up to 2 seconds are searched
+    THEN check the real offset isn't found and the confidence is low
+    """
+    rng = np.random.default_rng(2)
+    envelope = rng.random(60 * ENVELOPE_RATE)
+    shift = 5 * ENVELOPE_RATE
+
+    lag, confidence = correlate_envelopes(envelope[shift:], envelope, 2 * ENVELOPE_RATE)
+
+    assert abs(lag) <= 2 * ENVELOPE_RATE
+    assert confidence < 0.2
+
+
+def test_an_hour_correlates_in_under_a_second():
+    """
+    GIVEN envelopes of an hour of audio
+    WHEN they are correlated
+    THEN check it takes well under a second
+    """
+    rng = np.random.default_rng(3)
+    envelope = rng.random(3600 * ENVELOPE_RATE)
+
+    start_time = time.perf_counter()
+    lag, _ = correlate_envelopes(envelope[250:], envelope, 30 * ENVELOPE_RATE)
+
+    assert time.perf_counter() - start_time < 1.0
+    assert lag == pytest.approx(250, abs=0.5)
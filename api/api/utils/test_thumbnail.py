@@ -1,5 +1,6 @@
 import os
-from utils.thumbnail import get_first_5_secs_frame
+import subprocess
+from utils.thumbnail import get_first_5_secs_frame, thumbnail_command
 
 def test_get_first_5_secs_frame(mock_video_file):
     """
@@ -11,3 +12,18 @@ def test_get_first_5_secs_frame(mock_video_file):
     thumbnail_created = get_first_5_secs_frame(mock_video_file, output_file)
     os.remove(output_file)
     assert thumbnail_created
+
+
+def test_short_video_still_gets_a_thumbnail(tmpdir):
+    """
+    GIVEN a video shorter than 5 seconds
+    WHEN its thumbnail is rendered
+    THEN check a jpg is written rather than an empty file
+    """
+    video_file = str(tmpdir.join("short.mp4"))
+    subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc=s=320x240:r=25:d=2',
+                    '-pix_fmt', 'yuv420p', video_file], check=True)
+
+    result = subprocess.run(thumbnail_command(video_file), check=True, capture_output=True)
+
+    assert result.stdout.startswith(b'\xff\xd8')
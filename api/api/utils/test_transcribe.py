@@ -1,26 +1,34 @@
 import os
+import json
 import librosa
+import numpy as np
+from utils import transcribe
 from utils.transcribe import (
-    get_audio_from_video,
-    get_json_transcript
+    get_json_transcript,
+    process_video_to_JSON,
+    transcribe_in_chunks
     )
 from utils.editingUtils import add_audio_to_video
 
-def test_get_audio_from_video(mock_video_file, mock_audio_file):
+def test_video_audio_is_decoded_in_memory(mock_video_file, mock_audio_file, tmpdir, monkeypatch):
     """
-    GIVEN a mock video and audio file, audio is attatched to video file
-    WHEN the audio is extracted from the video file
-    THEN ensure the extracted audio file exists
+    GIVEN a 10 second video with a stereo 44.1kHz audio track
+    WHEN it is transcribed
+    THEN check the model is handed 16kHz mono float32 samples, and no audio file is written
     """
-    dest_path = "temp"
-    out_file = "audioout.wav"
-    in_file = "testvideo.mp4"
+    in_file = str(tmpdir.join("testvideo.mp4"))
     add_audio_to_video(mock_video_file, mock_audio_file, in_file)
-    get_audio_from_video(in_file, dest_path, out_file)
-    output_file = os.path.realpath(os.path.join(dest_path, out_file))
-    assert os.path.exists(output_file)
-    os.remove(output_file)
-    os.remove(in_file)
+    files_before = sorted(os.listdir(str(tmpdir)))
+    handed = []
+    monkeypatch.setattr(transcribe, "transcribe_audio", lambda audio: handed.append(audio) or
+                        {"text": "", "segments": [], "language": "en"})
+
+    transcript = json.loads(process_video_to_JSON(in_file))
+
+    assert transcript["segments"] == []
+    assert handed[0].dtype == np.float32 and handed[0].ndim == 1
+    assert abs(len(handed[0]) - 10 * 16_000) <= 16_000 // 10
+    assert sorted(os.listdir(str(tmpdir))) == files_before
 
 def test_get_json_transcript():
     """
@@ -31,3 +39,21 @@ def test_get_json_transcript():
     sample = librosa.example("libri2")
     transcript = get_json_transcript(sample)
     assert len(transcript) > 0 and "text" in transcript
+
+def test_quiet_audio_is_transcribed_whole(monkeypatch):
+    """
+    GIVEN 30 seconds of audio quieter than the silence threshold throughout
+    WHEN it is transcribed in chunks
+    THEN check it is transcribed as one chunk covering all of it rather than skipped
+    """
+    pieces = []
+    monkeypatch.setenv("TRANSCRIBE_WORKERS", "1")
+    monkeypatch.setattr(transcribe, "transcribe_samples",
+                        lambda samples, model_name: pieces.append(samples) or
+                        {"text": " hello", "segments": [], "language": "en"})
+    audio = (np.random.default_rng(3).standard_normal(30 * 16_000) * 1e-4).astype(np.float32)
+
+    result = transcribe_in_chunks(audio)
+
+    assert len(pieces) == 1 and len(pieces[0]) == len(audio)
+    assert result["text"] == "hello"
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from utils import transcript_cache
+from utils.test_result_cache import FakeS3Client
+
+OPTIONS = {"model": "base", "language": "en", "task": "transcribe", "mode": "single"}
+
+
+@pytest.fixture
+def s3_client(monkeypatch):
+    monkeypatch.setenv("MINIO_ENDPOINT", "http://minio:9000")
+    client = FakeS3Client()
+    client.put("project-1", "general/wide.mp4", b"wide")
+    return client
+
+
+def test_video_in_minio_is_fingerprinted_by_etag(s3_client):
+    """
+    GIVEN a video stored in MinIO
+    WHEN it is fingerprinted before and after being replaced
+    THEN check the fingerprint follows its ETag and other urls have none
+    """
+    url = "http://minio:9000/project-1/general/wide.mp4"
+
+    before = transcript_cache.source_fingerprint(s3_client, url)
+    s3_client.put("project-1", "general/wide.mp4", b"new wide")
+    after = transcript_cache.source_fingerprint(s3_client, url)
+
+    assert before is not None and after is not None and before != after
+    assert transcript_cache.source_fingerprint(s3_client, "http://elsewhere/wide.mp4") is None
+    assert transcript_cache.parse_object_url(url) == ("project-1", "general/wide.mp4")
+
+
+def test_transcript_round_trip(s3_client):
+    """
+    GIVEN a transcript cached for some audio with some options
+    WHEN it is looked up with the same and with different options
+    THEN check only the same audio and options hit
+    """
+    fingerprint = transcript_cache.audio_fingerprint(np.zeros(16_000, dtype=np.float32))
+    digest = transcript_cache.transcript_key(fingerprint, OPTIONS)
+    transcript_cache.store(s3_client, "project-1", digest, '{"segments": []}', fingerprint, OPTIONS)
+
+    other_model = transcript_cache.transcript_key(fingerprint, {**OPTIONS, "model": "small"})
+
+    assert transcript_cache.lookup(s3_client, "project-1", digest) == '{"segments": []}'
+    assert transcript_cache.lookup(s3_client, "project-1", other_model) is None
+    listing = transcript_cache.list_transcripts(s3_client, "project-1")
+    assert [entry["hits"] for entry in listing["entries"]] == [1]
+    assert listing["total_bytes"] == len('{"segments": []}')
+
+
+def test_least_recently_used_transcripts_are_evicted(s3_client, monkeypatch):
+    """
+    GIVEN a transcript cache with room for two transcripts
+    WHEN a third is stored after the first was read
+    THEN check the second, least recently used, transcript is evicted
+    """
+    monkeypatch.setenv("TRANSCRIPT_CACHE_MAX_BYTES", "20")
+    digests = [transcript_cache.transcript_key(f"pcm:{i}", OPTIONS) for i in range(3)]
+
+    for i, digest in enumerate(digests):
+        if i == 2:
+            transcript_cache.lookup(s3_client, "project-1", digests[0])
+        transcript_cache.store(s3_client, "project-1", digest, "x" * 10, f"pcm:{i}", OPTIONS)
+
+    listing = transcript_cache.list_transcripts(s3_client, "project-1")
+    assert {entry["digest"] for entry in listing["entries"]} == {digests[0], digests[2]}
+    assert transcript_cache.lookup(s3_client, "project-1", digests[1]) is None
@@ -0,0 +1,90 @@
+import numpy as np
+
+from utils.transcript_chunks import voiced_ranges, plan_chunks, stitch_results, get_chunk_pool_size
+
+SAMPLE_RATE = 16_000
+
+
+def chunk_transcript(text, start, end):
+    """
+    Mocks the whisper_timestamped transcript of one chunk, with one segment of two words.
+    """
+    first, second = text.split()
+    middle = (start + end) / 2
+    return {
+        "text": f" {text}",
+        "language": "en",
+        "segments": [{
+            "id": 0, "seek": 0, "start": start, "end": end, "text": f" {text}",
+            "words": [
+                {"text": first, "start": start, "end": middle, "confidence": 0.9},
+                {"text": second, "start": middle, "end": end, "confidence": 0.9},
+            ],
+        }],
+    }
+
+
+def test_voiced_ranges_skip_silence():
+    """
+    GIVEN 12 seconds of audio with 4 seconds of silence in the middle
+    WHEN the voiced ranges are found
+    THEN check the silence is left out, apart from its padding
+    """
+    rng = np.random.default_rng(5)
+    samples = rng.standard_normal(12 * SAMPLE_RATE).astype(np.float32) * 0.2
+    samples[4 * SAMPLE_RATE:8 * SAMPLE_RATE] = 0
+
+    ranges = voiced_ranges(samples, SAMPLE_RATE)
+
+    assert len(ranges) == 2
+    assert ranges[0] == (0.0, 4.25)
+    assert ranges[1][0] == 7.75
+
+
+def test_plan_chunks_splits_at_silences():
+    """
+    GIVEN voiced ranges, one of them very long
+    WHEN they are grouped into chunks
+    THEN check short ranges are grouped, chunks end in silences and long ranges are split
+    """
+    voiced = [(0, 50), (52, 100), (105, 160), (170, 1370)]
+
+    chunks = plan_chunks(voiced, chunk_seconds=120, max_chunk_seconds=600)
+
+    assert chunks == [(0, 100), (105, 160), (170, 770), (770, 1370)]
+
+
+def test_stitched_transcript_uses_global_times():
+    """
+    GIVEN the transcripts of two chunks, each timed from the start of its chunk
+    WHEN they are stitched together
+    THEN check every segment and word is timed from the start of the audio
+    """
+    results = [chunk_transcript("hello there", 0.5, 1.5), chunk_transcript("bye now", 0.2, 1.0)]
+
+    transcript = stitch_results(results, [10.0, 62.5])
+
+    assert transcript["text"] == "hello there bye now"
+    assert [segment["id"] for segment in transcript["segments"]] == [0, 1]
+    second = transcript["segments"][1]
+    assert (second["start"], second["end"], second["seek"]) == (62.7, 63.5, 6250)
+    assert [word["start"] for word in second["words"]] == [62.7, 63.1]
+    assert results[1]["segments"][0]["start"] == 0.2
+
+
+def test_chunk_pool_shares_the_cores_between_jobs(monkeypatch):
+    """
+    GIVEN 16 cores and up to 4 jobs at once
+    WHEN a job sizes its chunk pool
+    THEN check its workers and their threads fit in a quarter of the cores
+    """
+    monkeypatch.setattr("os.cpu_count", lambda: 16)
+    monkeypatch.setenv("MAX_CONCURRENT_JOBS", "4")
+    monkeypatch.setenv("TRANSCRIBE_WORKERS", "8")
+    assert get_chunk_pool_size() == (4, 1)
+
+    monkeypatch.setenv("TRANSCRIBE_WORKERS", "2")
+    assert get_chunk_pool_size() == (2, 2)
+
+    monkeypatch.setenv("MAX_CONCURRENT_JOBS", "32")
+    assert get_chunk_pool_size() == (1, 1)
@@ -0,0 +1,116 @@
+import sys
+import threading
+import subprocess
+
+import pytest
+
+from utils.transfer import build_manifest, download_manifest, upload_command_output
+from utils.workspace import Workspace
+
+
+class FakeS3Client:
+    """
+    Records the transfers made through it, downloads write the key into each file.
+    """
+
+    def __init__(self):
+        self.downloads = []
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def download_file(self, bucket, key, file_name, Config=None):
+        with self._lock:
+            self.downloads.append(key)
+        with open(file_name, "w") as file:
+            file.write(key)
+
+    def upload_fileobj(self, fileobj, bucket, key, ExtraArgs=None, Callback=None, Config=None):
+        data = fileobj.read()
+        Callback(len(data))
+        self.objects[key] = data
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+
+def test_build_manifest_names_every_file_once():
+    """
+    GIVEN a bucket listing with general, participant and unrelated files
+    WHEN the manifest is built
+    THEN check each media file is mapped to the name the merge expects
+    """
+    objects = [
+        {"Key": "general/wide.MP4", "Size": 10},
+        {"Key": "general/wide.wav", "Size": 20},
+        {"Key": "participant-1/cam.mp4", "Size": 30},
+        {"Key": "participant-1/mic.wav", "Size": 40},
+        {"Key": "participant-2/cam.mp4", "Size": 50},
+        {"Key": "participant-2/mic.wav", "Size": 60},
+        {"Key": "participant-2/notes.txt", "Size": 1},
+        {"Key": "final-product/final_podcast.mp4", "Size": 70},
+    ]
+
+    manifest = build_manifest(objects)
+
+    assert {name: obj["Key"] for name, obj in manifest.items()} == {
+        "wide_shot.mp4": "general/wide.MP4",
+        "wide_shot.wav": "general/wide.wav",
+        "camera1.mp4": "participant-1/cam.mp4",
+        "mic1.wav": "participant-1/mic.wav",
+        "camera2.mp4": "participant-2/cam.mp4",
+        "mic2.wav": "participant-2/mic.wav",
+    }
+
+
+def test_download_manifest_downloads_each_object_once(tmpdir):
+    """
+    GIVEN a manifest of several files
+    WHEN it is downloaded
+    THEN check every object is fetched exactly once and the stats add up
+    """
+    manifest = build_manifest([
+        {"Key": "participant-1/cam.mp4", "Size": 30},
+        {"Key": "participant-1/mic.wav", "Size": 40},
+        {"Key": "general/wide.mp4", "Size": 10},
+    ])
+    s3_client = FakeS3Client()
+    workspace = Workspace("transfer", root=str(tmpdir))
+
+    stats = download_manifest(s3_client, "bucket", manifest, workspace, max_workers=3)
+
+    assert sorted(s3_client.downloads) == sorted(obj["Key"] for obj in manifest.values())
+    assert stats["files"] == 3
+    assert stats["bytes"] == 80
+    with open(workspace.path("mic1.wav")) as file:
+        assert file.read() == "participant-1/mic.wav"
+    workspace.clean()
+
+
+def test_upload_command_output_streams_stdout():
+    """
+    GIVEN a command writing a file to stdout
+    WHEN its output is uploaded
+    THEN check the object holds everything the command wrote
+    """
+    s3_client = FakeS3Client()
+    command = [sys.executable, "-c", "import sys; sys.stdout.buffer.write(b'x' * 100000)"]
+
+    stats = upload_command_output(s3_client, command, "bucket", "thumbnail.jpg")
+
+    assert s3_client.objects["thumbnail.jpg"] == b"x" * 100000
+    assert stats["bytes"] == 100000
+
+
+def test_upload_command_output_removes_failed_upload():
+    """
+    GIVEN a command that fails part way through writing its output
+    WHEN its output is uploaded
+    THEN check the error is raised and no partial object is left behind
+    """
+    s3_client = FakeS3Client()
+    command = [sys.executable, "-c", "import sys; sys.stdout.write('partial'); sys.exit(1)"]
+
+    with pytest.raises(subprocess.CalledProcessError):
+        upload_command_output(s3_client, command, "bucket", "thumbnail.jpg")
+
+    assert "thumbnail.jpg" not in s3_client.objects
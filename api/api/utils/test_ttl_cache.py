@@ -0,0 +1,44 @@
+from utils.ttl_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire():
+    """
+    GIVEN a cache with a 5 second ttl
+    WHEN an entry is read before and after it expires
+    THEN check it is only returned before
+    """
+    clock = FakeClock()
+    cache = TTLCache(ttl=5, clock=clock)
+    cache.set("projects", b"[]")
+
+    clock.now = 4.9
+    assert cache.get("projects") == b"[]"
+    clock.now = 5.0
+    assert cache.get("projects") is None
+
+
+def test_least_recently_used_entry_is_dropped_when_full():
+    """
+    GIVEN a full cache
+    WHEN another entry is set
+    THEN check the least recently used entry is dropped
+    """
+    cache = TTLCache(ttl=60, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    cache.clear()
+    assert cache.get("c") is None
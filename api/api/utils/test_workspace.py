@@ -0,0 +1,44 @@
+import os
+from utils.workspace import Workspace, job_workspace
+
+
+def test_workspaces_are_isolated(tmpdir):
+    """
+    GIVEN two jobs running at the same time
+    WHEN both write a file with the same name into their workspace
+    THEN check the files do not overwrite each other
+    """
+    workspace_a = Workspace("job", root=str(tmpdir))
+    workspace_b = Workspace("job", root=str(tmpdir))
+
+    with open(workspace_a.path("camera1.mp4"), "w") as file:
+        file.write("a")
+    with open(workspace_b.path("camera1.mp4"), "w") as file:
+        file.write("b")
+
+    with open(workspace_a.path("camera1.mp4")) as file:
+        assert file.read() == "a"
+    assert workspace_a.directory != workspace_b.directory
+
+    workspace_a.clean()
+    workspace_b.clean()
+
+
+def test_job_workspace_cleans_up_only_its_own_files(tmpdir):
+    """
+    GIVEN a job workspace next to an unrelated file
+    WHEN the job finishes, even with an error
+    THEN check only the workspace is removed
+    """
+    unrelated_file = os.path.join(str(tmpdir), "other_job.wav")
+    open(unrelated_file, "w").close()
+
+    try:
+        with job_workspace("job", root=str(tmpdir)) as workspace:
+            open(workspace.path("merged_audio.wav"), "w").close()
+            raise RuntimeError("ffmpeg failed")
+    except RuntimeError:
+        pass
+
+    assert not os.path.exists(workspace.directory)
+    assert os.path.exists(unrelated_file)
@@ -1,12 +1,37 @@
 import subprocess
 import os
+import sys
 
 from utils.minioUtils import create_s3_client
+from utils.transfer import download_file, upload_command_output
+from utils.metrics import span
+from utils.ffmpeg_runner import run_ffmpeg
+from utils.workspace import job_workspace
+from utils.probe import probe_media
+
+# How far into the video the thumbnail is taken from
+THUMBNAIL_SECONDS = 5
 
 s3_client = create_s3_client(os.environ["MINIO_ENDPOINT"],
                              os.environ["ACCESS_KEY"], os.environ["SECRET_KEY"])
 
 
+def thumbnail_seek(input_file) -> float:
+    """
+    Returns how many seconds into the video the thumbnail is taken from.
+    Videos shorter than THUMBNAIL_SECONDS use the frame halfway through instead,
+    seeking past the end would give ffmpeg no frame and an empty thumbnail.
+    :param input_file: the video to take the frame from.
+    """
+    try:
+        duration = probe_media(input_file)["duration"]
+    except (subprocess.CalledProcessError, KeyError, ValueError) as e:
+        print(f"Could not read the length of {input_file}, using its first frame: {e}",
+              file=sys.stderr)
+        return 0
+    return min(THUMBNAIL_SECONDS, duration / 2)
+
+
 def get_first_5_secs_frame(input_file, output_file, video_content=None) -> bool:
     """
     Given some video content in the response from the MinIO,
@@ -21,57 +46,60 @@ def get_first_5_secs_frame(input_file, output_file, video_content=None) -> bool:
         command = [
             'ffmpeg',
             '-i', input_file,
-            '-ss', '00:00:05',
+            '-ss', f"{thumbnail_seek(input_file):.3f}",
             '-vframes', '1',
             output_file
         ]
-        subprocess.run(command, stderr=subprocess.STDOUT,
-                       stdout=subprocess.DEVNULL)
+        run_ffmpeg(command, label="thumbnail")
         return True
     except Exception as e:
         print(f"An error occurred: {e}")
         return False
 
 
+def thumbnail_command(input_file, output_file='pipe:1') -> list:
+    """
+    Builds the ffmpeg command that grabs the frame 5s into a video as a jpg,
+    or an earlier one if the video is shorter, see thumbnail_seek.
+    :param input_file: the video to take the frame from.
+    :param output_file: where to write the jpg, stdout by default.
+    """
+    return [
+        'ffmpeg',
+        '-v', 'error',
+        '-i', input_file,
+        '-ss', f"{thumbnail_seek(input_file):.3f}",
+        '-vframes', '1',
+        '-f', 'image2',
+        '-c:v', 'mjpeg',
+        output_file
+    ]
+
+
 def generate_thumbnail(bucket_name, object_key):
     """
     Receives an mp4 file and generates a thumbnail from the frame 5s in, then uploads to server.
+    The thumbnail is uploaded straight from ffmpeg's output, it's never written to disk.
     :param bucket_name: name of bucket that video is going to be recieved from in the server.
     :param object_key: name of the video file that is being recieved from server.
 
     """
+    thumbnail_key = object_key + "_thumbnail.jpg"
 
-    response = s3_client.get_object(Bucket=bucket_name, Key=object_key)
-    video_content = response['Body'].read()
-
-    input_file = 'video.mp4'
-    output_file = 'thumbnail.jpg'
-
-    thumbnail_exists = get_first_5_secs_frame(input_file, output_file, video_content)
-
-    # Save the output file back to the MinIO store
-    with open(output_file, 'rb') as file:
-        s3_client.put_object(Bucket=bucket_name, Key=(
-            object_key + "_thumbnail.jpg"), Body=file, ACL='public-read')
+    # The workspace (and every file in it) is removed once the thumbnail is uploaded
+    with job_workspace(bucket_name) as workspace:
+        input_file = workspace.path('video.mp4')
+        with span("thumbnail", "download") as details:
+            details.update(download_file(s3_client, bucket_name, object_key, input_file))
 
-    # Make sure that we don't remove anything until it has been fully uploaded
-    s3_client.get_waiter('object_exists').wait(
-        Bucket=bucket_name,
-        Key=(object_key + "_thumbnail.jpg")
-    )
-
-    # Clean up files that were created during this process
-    try:
-        os.remove(input_file)
-        os.remove(output_file)
-        print("Files deleted successfully.")
-    except FileNotFoundError:
-        print("Files not found.")
-    except Exception as e:
-        print(f"An error occurred: {e}")
+        try:
+            with span("thumbnail", "render_upload", uses_ffmpeg=True) as details:
+                details.update(upload_command_output(
+                    s3_client, thumbnail_command(input_file),
+                    bucket_name, thumbnail_key, {'ACL': 'public-read'}))
+        except subprocess.CalledProcessError as e:
+            print(f"An error occurred: {e.stderr}", file=sys.stderr)
+            return False
 
-    if thumbnail_exists:
-        return {"thumbnail_url":
-                f'{os.environ["MINIO_ENDPOINT"]}/{bucket_name}/{object_key}_thumbnail.jpg'}
-    
-    return thumbnail_exists
+    return {"thumbnail_url":
+            f'{os.environ["MINIO_ENDPOINT"]}/{bucket_name}/{thumbnail_key}'}
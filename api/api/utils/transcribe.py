@@ -1,83 +1,251 @@
 import os
-import subprocess
+import sys
 import json
-import shutil
-from pydub import AudioSegment
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import torch
 import whisper_timestamped as whisper
+from botocore.exceptions import ClientError
 
+from utils.pcm_stream import decode_pcm
+from utils.minioUtils import create_s3_client
+from utils import transcript_cache
+from utils.model_registry import registry, DEFAULT_MODEL, DEFAULT_DEVICE, WHISPER_SAMPLE_RATE
+from utils.jobs import report_progress, report_partial
+from utils.metrics import span
+from utils.silence import get_silence_settings
+from utils.transcript_chunks import (
+    voiced_ranges, plan_chunks, offset_result, stitch_results,
+    get_chunk_pool_size, get_chunk_seconds)
 
-def get_audio_from_video(video_file: str, destination_path: str, out_file_name: str) -> None:
+s3_client = create_s3_client(
+    os.environ["MINIO_ENDPOINT"],
+    os.environ["ACCESS_KEY"],
+    os.environ["SECRET_KEY"])
+
+
+def get_transcribe_mode() -> str:
+    """
+    Returns how audio is transcribed, set with TRANSCRIBE_MODE:
+        - "chunked" splits the audio at silences and transcribes the chunks in parallel (default)
+        - "single" transcribes the whole file in one go
     """
-    Given a relative video file path it extracts the 
-    audio and and puts it inside a destination folder
+    return os.environ.get("TRANSCRIBE_MODE", "chunked")
 
-    :param video_file: String relative path of the filename
-    :param destination_path: String relative path of the temorary folder that will be created
-    :param out_file_name: String of the name of the audio file that will be produced
+
+def transcribe_samples(samples, model_name: str = DEFAULT_MODEL) -> dict:
     """
-    if not os.path.exists(destination_path):
-        os.makedirs(destination_path)
-    output_file = os.path.realpath(
-        os.path.join(destination_path, out_file_name))
-    if os.path.exists(output_file):
-        os.remove(output_file)
-    try:
-        subprocess.run(['ffmpeg', '-i', video_file, '-vn',
-                        '-acodec', 'libmp3lame', '-q:a', '2', output_file],
-                       stderr=subprocess.STDOUT, stdout=subprocess.DEVNULL)
-        print(f"Audio extracted successfully to {output_file}")
-    except subprocess.CalledProcessError as e:
-        print(f"Error: {e}")
+    Transcribes 16kHz mono float32 samples with a model from the registry.
+    Module level so it can be run in the chunk workers.
+    """
+    with registry.use(model_name, DEFAULT_DEVICE) as model:
+        return whisper.transcribe(model, samples, language='en', task='transcribe')
 
 
-def validate_frequency(audiofile: str) -> None:
+def _init_chunk_worker(threads: int, model_name: str) -> None:
     """
-    :param audiofile: relative path of the audiofile as a string
+    Prepares a newly started chunk worker.
+    torch uses every core in each process by default, so the workers together
+    would run far more threads than there are cores. Each gets its share instead.
+    The model is loaded and warmed up while the other workers start.
+    :param threads: how many threads the worker may use.
+    :param model_name: the whisper model the chunks are transcribed with.
+    """
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    torch.set_num_threads(threads)
+    registry.warm_up([model_name], DEFAULT_DEVICE)
+
+
+def create_chunk_executor(model_name: str = DEFAULT_MODEL) -> ProcessPoolExecutor:
+    """
+    Creates the pool one transcript's chunks are transcribed in, see
+    transcript_chunks.get_chunk_pool_size. The workers are spawned rather than
+    forked, as forking a process that has imported torch can deadlock, and the
+    pool is shut down with the transcript so idle models don't hold on to memory.
+    :param model_name: the whisper model the workers load.
+    """
+    workers, threads = get_chunk_pool_size()
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=_init_chunk_worker, initargs=(threads, model_name))
 
-    This is a helper function that turns the frequency of an audio file to 16kHz
-    It is recommended by whisper to use 16kHz files but it works with any file frequency
+
+def transcribe_in_chunks(audio, model_name: str = DEFAULT_MODEL) -> dict:
+    """
+    Splits audio at its silences into chunks, transcribes the chunks in a pool
+    of worker processes and stitches the results back together.
+    Silent stretches between chunks are never transcribed. The segments of each
+    chunk are published with report_partial as soon as every chunk before it
+    is done, so the editor can show the start of the transcript early.
+
+    :param audio: 16kHz mono float32 samples.
+    :param model_name: the whisper model size to use.
+    :returns res: the transcript, in the same shape whisper_timestamped gives.
+    """
+    voiced = voiced_ranges(audio, WHISPER_SAMPLE_RATE)
+    if not voiced and len(audio) > 0:
+        # Quiet recordings can fall under the silence threshold all the way
+        # through, whisper is left to decide whether anything is said
+        voiced = [(0.0, len(audio) / WHISPER_SAMPLE_RATE)]
+    chunks = plan_chunks(voiced, *get_chunk_seconds())
+    pieces = [audio[round(start * WHISPER_SAMPLE_RATE):round(end * WHISPER_SAMPLE_RATE)]
+              for start, end in chunks]
+    report_progress(0.1, stage="transcribe", chunks=len(chunks))
+
+    results = [None] * len(pieces)
+    published = 0
+    segment_count = 0
+
+    def publish_ready():
+        # Segments are published in order, with the ids stitch_results gives them
+        nonlocal published, segment_count
+        while published < len(results) and results[published] is not None:
+            segments = offset_result(results[published], chunks[published][0],
+                                     segment_count)["segments"]
+            report_partial(*segments)
+            segment_count += len(segments)
+            published += 1
+
+    if len(pieces) <= 1 or get_chunk_pool_size()[0] <= 1:
+        for i, piece in enumerate(pieces):
+            results[i] = transcribe_samples(piece, model_name)
+            publish_ready()
+            report_progress(0.1 + 0.85 * (i + 1) / len(pieces), stage="transcribe")
+    else:
+        with create_chunk_executor(model_name) as executor:
+            futures = {executor.submit(transcribe_samples, piece, model_name): i
+                       for i, piece in enumerate(pieces)}
+            for done, future in enumerate(as_completed(futures), start=1):
+                results[futures[future]] = future.result()
+                publish_ready()
+                report_progress(0.1 + 0.85 * done / len(pieces), stage="transcribe")
+
+    return stitch_results(results, [start for start, _ in chunks])
+
+
+def transcribe_audio(audio, model_name: str = DEFAULT_MODEL) -> dict:
+    """
+    Transcribes 16kHz mono float32 samples, see get_transcribe_mode.
+    :param audio: the samples to transcribe.
+    :param model_name: the whisper model size to use
+    :return res: the transcript, as whisper_timestamped gives it
     """
-    audiofile = os.path.realpath(audiofile)
-    audio_file = AudioSegment.from_file(audiofile)
-    audioSegment = audio_file.set_frame_rate(16000)
-    audioSegment.export(audiofile, format="mp3", bitrate="320k")
-    print(f"16kHz output in {audiofile}")
+    if get_transcribe_mode() == "chunked":
+        return transcribe_in_chunks(audio, model_name)
+    with registry.use(model_name, DEFAULT_DEVICE) as model:
+        report_progress(0.1, stage="transcribe", models=registry.stats())
+        return whisper.transcribe(model, audio, language='en', task='transcribe')
 
 
-def get_json_transcript(audiofile: str) -> str:
+def get_json_transcript(audiofile: str, model_name: str = DEFAULT_MODEL) -> str:
     """
     Generates the transcription and calls the whisper_timestamped module. 
+    The model is shared through the model registry rather than loaded on every call.
 
     :param audiofile: relative path of the audiofile as a string
+    :param model_name: the whisper model size to use
     :return res: returns json verion of the transcript
     """
-    audiofile = os.path.realpath(audiofile)
-    audio = whisper.load_audio(audiofile)
-    model = whisper.load_model("base.en", device="cpu")
-    res = whisper.transcribe(model, audio, language='en', task='transcribe')
-    return json.dumps(res)
+    audio = decode_pcm(os.path.realpath(audiofile), WHISPER_SAMPLE_RATE)
+    return json.dumps(transcribe_audio(audio, model_name))
 
 
-def process_video_to_JSON(video_file_path: str, temp_folder_path: str,
-                          output_filename: str, downscale: bool) -> str:
+def process_video_to_JSON(video_file_path: str, temp_folder_path: str = None,
+                          output_filename: str = None, downscale: bool = True) -> str:
     """
     This is the function called by the flask API and it
-        - gets the video 
-        - extracts the audio
-        - puts the audio in a specified folder
-        - downscales to 16kHz if specified
-        - gets the transcript from the audio file
-        - deletes the folder so the temporary audio file does not exist anymore
-
-    :param video_file_path: Relative path for the video
-    :param temp_folder_path: Relative path to the folder where the extracted audio file should exist
-    :param output_filename:
-    :param downscale: Used to determine if validateFrequency should be used
-    """
-    get_audio_from_video(video_file_path, temp_folder_path, output_filename)
-    outFilePath = "".join([temp_folder_path, output_filename])
-    if downscale:
-        validate_frequency(outFilePath)
-    response = get_json_transcript(outFilePath)
-    shutil.rmtree(temp_folder_path)
-    return response
+        - decodes the audio track of the video once, straight to 16kHz mono samples in memory
+        - gets the transcript from those samples
+    No audio file is written, so there is nothing to clean up and no lossy re-encode.
+
+    :param video_file_path: Relative path or url for the video
+    :param temp_folder_path: No longer used, kept so existing callers don't break
+    :param output_filename: No longer used, kept so existing callers don't break
+    :param downscale: No longer used, the audio is always decoded at 16kHz
+    """
+    with span("transcript", "decode", uses_ffmpeg=True):
+        audio = decode_pcm(video_file_path, WHISPER_SAMPLE_RATE)
+    with span("transcript", "transcribe") as details:
+        details.update(mode=get_transcribe_mode(), audio_seconds=len(audio) / WHISPER_SAMPLE_RATE)
+        return json.dumps(transcribe_audio(audio))
+
+
+def get_transcript_options(model_name: str = DEFAULT_MODEL) -> dict:
+    """
+    Returns the model and every option that changes a transcript, which
+    cached transcripts are keyed on.
+    """
+    options = {"model": model_name, "language": "en", "task": "transcribe",
+               "mode": get_transcribe_mode()}
+    if options["mode"] == "chunked":
+        options["chunk_seconds"] = list(get_chunk_seconds())
+        # Chunks are cut at silences, so the silence settings change where whisper starts
+        options["silence"] = get_silence_settings()
+    return options
+
+
+def _cache_bucket(video_file_path: str, bucket_name: str = None):
+    """
+    Returns the bucket transcripts of a video are cached in: the one given,
+    or else the bucket the video is stored in.
+    """
+    if bucket_name:
+        return bucket_name
+    location = transcript_cache.parse_object_url(video_file_path)
+    return location[0] if location else None
+
+
+def cached_transcript(video_file_path: str, bucket_name: str = None):
+    """
+    Looks for a transcript of a video stored in MinIO by its ETag, without decoding it.
+    :returns transcript: the json transcript, or None on a miss.
+    """
+    bucket_name = _cache_bucket(video_file_path, bucket_name)
+    fingerprint = transcript_cache.source_fingerprint(s3_client, video_file_path)
+    if bucket_name is None or fingerprint is None:
+        return None
+    digest = transcript_cache.transcript_key(fingerprint, get_transcript_options())
+    return transcript_cache.lookup(s3_client, bucket_name, digest)
+
+
+def transcribe_project_video(video_file_path: str, bucket_name: str = None) -> str:
+    """
+    Like process_video_to_JSON, but caches the transcript in the project bucket.
+    Videos in MinIO are keyed on their ETag, anything else on a fingerprint of
+    its decoded audio, so the same audio is never transcribed twice.
+
+    :param video_file_path: Relative path or url for the video
+    :param bucket_name: the project bucket, defaults to the bucket the video is stored in
+    :return res: the json transcript
+    """
+    bucket_name = _cache_bucket(video_file_path, bucket_name)
+    if bucket_name is None:
+        return process_video_to_JSON(video_file_path)
+
+    options = get_transcript_options()
+    fingerprint = transcript_cache.source_fingerprint(s3_client, video_file_path)
+    if fingerprint is not None:
+        transcript = transcript_cache.lookup(
+            s3_client, bucket_name, transcript_cache.transcript_key(fingerprint, options))
+        if transcript is not None:
+            return transcript
+
+    with span("transcript", "decode", uses_ffmpeg=True):
+        audio = decode_pcm(video_file_path, WHISPER_SAMPLE_RATE)
+    if fingerprint is None:
+        fingerprint = transcript_cache.audio_fingerprint(audio)
+        transcript = transcript_cache.lookup(
+            s3_client, bucket_name, transcript_cache.transcript_key(fingerprint, options))
+        if transcript is not None:
+            return transcript
+
+    with span("transcript", "transcribe") as details:
+        details.update(mode=get_transcribe_mode(), audio_seconds=len(audio) / WHISPER_SAMPLE_RATE)
+        transcript = json.dumps(transcribe_audio(audio))
+    try:
+        transcript_cache.store(s3_client, bucket_name,
+                               transcript_cache.transcript_key(fingerprint, options),
+                               transcript, fingerprint, options)
+    except ClientError as e:
+        # The transcript is still good, it just has to be made again next time
+        print(f"Could not cache the transcript in {bucket_name}: {e}", file=sys.stderr)
+    return transcript
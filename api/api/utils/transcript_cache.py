@@ -0,0 +1,137 @@
+import os
+import sys
+import json
+import time
+import hashlib
+from urllib.parse import unquote
+
+from botocore.exceptions import ClientError
+
+from utils.result_cache import cache_enabled, load_index, save_index, least_recently_used
+
+# Transcripts are kept in the project bucket as transcripts/<digest>.json,
+# with an index of their size and last use at transcripts/index.json.
+INDEX_KEY = "transcripts/index.json"
+TRANSCRIPT_PREFIX = "transcripts/"
+
+
+def get_max_cache_bytes() -> int:
+    """
+    Returns how many bytes of transcripts are kept per project, set with TRANSCRIPT_CACHE_MAX_BYTES.
+    """
+    return int(os.environ.get("TRANSCRIPT_CACHE_MAX_BYTES", 200 * 1024 ** 2))
+
+
+def parse_object_url(url: str):
+    """
+    Works out the bucket and key of a MinIO object from its url.
+    :returns bucket, key: or None if the url isn't a MinIO object.
+    """
+    endpoint = os.environ.get("MINIO_ENDPOINT", "").rstrip("/")
+    if not endpoint or not url.startswith(endpoint + "/"):
+        return None
+    bucket, _, key = url[len(endpoint) + 1:].partition("/")
+    return (bucket, unquote(key.split("?")[0])) if bucket and key else None
+
+
+def source_fingerprint(s3_client, video_url: str):
+    """
+    Fingerprints a video stored in MinIO by its ETag, without downloading it.
+    :returns fingerprint: or None if the video isn't in MinIO.
+    """
+    location = parse_object_url(video_url)
+    if location is None:
+        return None
+    bucket, key = location
+    try:
+        etag = s3_client.head_object(Bucket=bucket, Key=key)["ETag"]
+    except ClientError:
+        return None
+    return f"etag:{bucket}/{key}:{etag}"
+
+
+def audio_fingerprint(samples) -> str:
+    """
+    Fingerprints decoded audio, for videos that aren't in MinIO.
+    """
+    return "pcm:" + hashlib.sha256(samples.tobytes()).hexdigest()
+
+
+def transcript_key(fingerprint: str, options: dict) -> str:
+    """
+    Builds the digest a transcript is cached under.
+    :param fingerprint: from source_fingerprint or audio_fingerprint.
+    :param options: the model name and every option that changes the transcript.
+    """
+    description = json.dumps({"source": fingerprint, "options": options}, sort_keys=True)
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def lookup(s3_client, bucket_name: str, digest: str):
+    """
+    Fetches a cached transcript.
+    :returns transcript: the transcript JSON, or None on a miss.
+    """
+    if not cache_enabled():
+        return None
+    try:
+        response = s3_client.get_object(
+            Bucket=bucket_name, Key=f"{TRANSCRIPT_PREFIX}{digest}.json")
+    except ClientError:
+        return None
+    transcript = response["Body"].read().decode()
+
+    index = load_index(s3_client, bucket_name, INDEX_KEY)
+    if digest in index:
+        index[digest]["last_used"] = time.time()
+        index[digest]["hits"] = index[digest].get("hits", 0) + 1
+        save_index(s3_client, bucket_name, index, INDEX_KEY)
+    print(f"Transcript cache hit in {bucket_name}", file=sys.stderr)
+    return transcript
+
+
+def store(s3_client, bucket_name: str, digest: str, transcript: str,
+          fingerprint: str, options: dict) -> None:
+    """
+    Saves a transcript, then drops the least recently used transcripts until
+    the cache fits in TRANSCRIPT_CACHE_MAX_BYTES.
+    :param transcript: the transcript JSON.
+    :param fingerprint: what was transcribed, kept in the index for listing.
+    :param options: the options it was transcribed with, kept in the index for listing.
+    """
+    if not cache_enabled():
+        return
+    body = transcript.encode()
+    s3_client.put_object(Bucket=bucket_name, Key=f"{TRANSCRIPT_PREFIX}{digest}.json",
+                         Body=body, ContentType="application/json")
+
+    index = load_index(s3_client, bucket_name, INDEX_KEY)
+    now = time.time()
+    index[digest] = {
+        "source": fingerprint,
+        "options": options,
+        "size": len(body),
+        "created": now,
+        "last_used": now,
+        "hits": 0,
+    }
+    for old_digest in least_recently_used(index, get_max_cache_bytes()):
+        del index[old_digest]
+        s3_client.delete_object(Bucket=bucket_name, Key=f"{TRANSCRIPT_PREFIX}{old_digest}.json")
+        print(f"Evicted cached transcript {old_digest} from {bucket_name}", file=sys.stderr)
+    save_index(s3_client, bucket_name, index, INDEX_KEY)
+
+
+def list_transcripts(s3_client, bucket_name: str) -> dict:
+    """
+    Lists the cached transcripts of a project and how much space they take.
+    :returns listing: the entries (newest use first), their total size and the size limit.
+    """
+    index = load_index(s3_client, bucket_name, INDEX_KEY)
+    entries = [{"digest": digest, **entry} for digest, entry in index.items()]
+    entries.sort(key=lambda entry: entry["last_used"], reverse=True)
+    return {
+        "entries": entries,
+        "total_bytes": sum(entry["size"] for entry in entries),
+        "max_bytes": get_max_cache_bytes(),
+    }
@@ -0,0 +1,126 @@
+import os
+import copy
+
+import numpy as np
+
+from utils.silence import silent_frames, silent_ranges, get_silence_settings
+from utils.jobs import get_max_concurrent_jobs
+
+FRAME_SECONDS = 0.02
+# Whisper's seek positions count mel frames, 100 per second
+SEEK_FRAMES_PER_SECOND = 100
+
+
+def get_transcribe_workers() -> int:
+    """
+    Returns how many chunks are transcribed at once, set with TRANSCRIBE_WORKERS.
+    Every worker loads its own copy of the model.
+    """
+    return int(os.environ.get("TRANSCRIBE_WORKERS", max(1, (os.cpu_count() or 1) // 2)))
+
+
+def get_chunk_pool_size() -> tuple:
+    """
+    Sizes the pool one job transcribes its chunks in. As many jobs as
+    MAX_CONCURRENT_JOBS may be transcribing at once, so each only gets its
+    share of the cores, shared again between its workers' torch threads.
+    :returns workers, threads: chunk worker processes, at most TRANSCRIBE_WORKERS,
+                               and the threads each of them may use.
+    """
+    share = max(1, (os.cpu_count() or 1) // get_max_concurrent_jobs())
+    workers = max(1, min(get_transcribe_workers(), share))
+    return workers, max(1, share // workers)
+
+
+def get_chunk_seconds() -> tuple:
+    """
+    Returns the length chunks are grown to and the longest they may be, set
+    with TRANSCRIBE_CHUNK_SECONDS and TRANSCRIBE_MAX_CHUNK_SECONDS.
+    """
+    return (float(os.environ.get("TRANSCRIBE_CHUNK_SECONDS", 120.0)),
+            float(os.environ.get("TRANSCRIBE_MAX_CHUNK_SECONDS", 600.0)))
+
+
+def voiced_ranges(samples, sample_rate: int) -> list:
+    """
+    Finds the parts of some audio that aren't silent.
+    :param samples: mono float samples.
+    :param sample_rate: rate of the samples.
+    :returns ranges: list of (start, end) tuples in seconds.
+    """
+    settings = get_silence_settings()
+    frame_size = round(FRAME_SECONDS * sample_rate)
+    frame_count = len(samples) // frame_size
+    if frame_count == 0:
+        return []
+    frames = np.asarray(samples[:frame_count * frame_size], dtype=np.float64)
+    levels = np.sqrt(np.mean(np.square(frames.reshape(frame_count, frame_size)), axis=1))
+    silent = silent_frames(20 * np.log10(np.maximum(levels, 1e-10)),
+                           settings["threshold_db"], settings["hysteresis_db"])
+
+    # Keep a little of each silence either side of the speech, like the export does
+    silences = silent_ranges(silent, FRAME_SECONDS, settings["min_seconds"],
+                             settings["padding_seconds"])
+    total = frame_count * FRAME_SECONDS
+    edges = [0.0] + [time for silence in silences for time in silence] + [total]
+    return [(start, end) for start, end in zip(edges[::2], edges[1::2]) if end > start]
+
+
+def plan_chunks(voiced, chunk_seconds: float, max_chunk_seconds: float) -> list:
+    """
+    Groups voiced ranges into chunks of about chunk_seconds, so every chunk
+    starts and ends in a silence and silences between chunks are skipped.
+    A voiced range longer than max_chunk_seconds is split into equal parts.
+
+    :param voiced: list of (start, end) tuples, in order.
+    :returns chunks: list of (start, end) tuples in seconds.
+    """
+    chunks = []
+    for start, end in voiced:
+        parts = int(np.ceil((end - start) / max_chunk_seconds))
+        bounds = np.linspace(start, end, parts + 1)
+        for part_start, part_end in zip(bounds[:-1], bounds[1:]):
+            part_start, part_end = float(part_start), float(part_end)
+            if chunks and part_end - chunks[-1][0] <= chunk_seconds:
+                chunks[-1] = (chunks[-1][0], part_end)
+            else:
+                chunks.append((part_start, part_end))
+    return chunks
+
+
+def offset_result(result: dict, offset: float, first_id: int = 0) -> dict:
+    """
+    Moves the timestamps of a chunk's transcript to where the chunk is in the whole audio.
+    :param result: a whisper_timestamped transcript of the chunk.
+    :param offset: where the chunk starts, in seconds.
+    :param first_id: the id the chunk's first segment gets.
+    """
+    result = copy.deepcopy(result)
+    for i, segment in enumerate(result.get("segments", [])):
+        segment["id"] = first_id + i
+        segment["start"] = round(segment["start"] + offset, 2)
+        segment["end"] = round(segment["end"] + offset, 2)
+        if "seek" in segment:
+            segment["seek"] += round(offset * SEEK_FRAMES_PER_SECOND)
+        for word in segment.get("words", []):
+            word["start"] = round(word["start"] + offset, 2)
+            word["end"] = round(word["end"] + offset, 2)
+    return result
+
+
+def stitch_results(results, offsets) -> dict:
+    """
+    Joins the transcripts of every chunk into one, in the same shape whisper_timestamped gives.
+    :param results: the transcript of each chunk, in order.
+    :param offsets: where each chunk starts, in seconds.
+    """
+    segments = []
+    for result, offset in zip(results, offsets):
+        segments += offset_result(result, offset, len(segments))["segments"]
+    texts = [result.get("text", "").strip() for result in results]
+    language = next((result["language"] for result in results if "language" in result), "en")
+    return {
+        "text": " ".join(text for text in texts if text),
+        "segments": segments,
+        "language": language,
+    }
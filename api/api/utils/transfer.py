@@ -0,0 +1,195 @@
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.s3.transfer import TransferConfig
+
+from utils.metrics import record_transfer
+
+PARTICIPANT_PREFIX = re.compile(r"^participant-(\d+)/")
+MEGABYTE = 1024 * 1024
+
+
+def get_transfer_config() -> TransferConfig:
+    """
+    Builds the boto3 transfer settings used for project media.
+    Objects bigger than S3_PART_SIZE are fetched as S3_PART_CONCURRENCY
+    ranged GETs in parallel.
+    """
+    part_size = int(os.environ.get("S3_PART_SIZE", 8 * MEGABYTE))
+    return TransferConfig(
+        multipart_threshold=part_size,
+        multipart_chunksize=part_size,
+        max_concurrency=int(os.environ.get("S3_PART_CONCURRENCY", 4)),
+        use_threads=True)
+
+
+def list_objects(s3_client, bucket_name) -> list:
+    """
+    Lists every object in a bucket with a single paginated listing.
+    :param s3_client: the s3 client to use.
+    :param bucket_name: the bucket to list.
+    """
+    objects = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name):
+        objects.extend(page.get('Contents', []))
+    return objects
+
+
+def build_manifest(objects) -> dict:
+    """
+    Decides which local file each piece of project media is downloaded to.
+        - general/ video and audio become wide_shot.mp4 and wide_shot.wav
+        - participant-N/ video and audio become cameraN.mp4 and micN.wav
+    If a folder has more than one file of a type, the last one by key is used.
+
+    :param objects: object listing returned by list_objects.
+    :returns manifest: dict of local file name to s3 object.
+    """
+    manifest = {}
+    for obj in sorted(objects, key=lambda obj: obj['Key']):
+        key = obj['Key']
+        extension = os.path.splitext(key)[1].lower()
+        if extension not in (".mp4", ".wav"):
+            continue
+
+        if key.startswith("general/"):
+            local_name = f"wide_shot{extension}"
+        else:
+            match = PARTICIPANT_PREFIX.match(key)
+            if match is None:
+                continue
+            stem = "camera" if extension == ".mp4" else "mic"
+            local_name = f"{stem}{int(match.group(1))}{extension}"
+
+        manifest[local_name] = obj
+    return manifest
+
+
+def download_file(s3_client, bucket_name, key, file_path) -> dict:
+    """
+    Downloads one object, in parallel parts once it is bigger than one part.
+    :param s3_client: the s3 client to use.
+    :param bucket_name: the bucket the object is in.
+    :param key: the key of the object.
+    :param file_path: where the file is written.
+    :returns stats: the key, bytes downloaded, time taken and bytes per second.
+    """
+    start_time = time.perf_counter()
+    s3_client.download_file(bucket_name, key, file_path, Config=get_transfer_config())
+    seconds = time.perf_counter() - start_time
+
+    total_bytes = os.path.getsize(file_path)
+    record_transfer("download", total_bytes, seconds)
+    return {
+        "key": key,
+        "bytes": total_bytes,
+        "seconds": round(seconds, 3),
+        "bytes_per_second": round(total_bytes / seconds) if seconds > 0 else None,
+    }
+
+
+def download_manifest(s3_client, bucket_name, manifest, workspace, max_workers=None) -> dict:
+    """
+    Downloads every object in a manifest exactly once, several at a time.
+    :param s3_client: the s3 client to use.
+    :param bucket_name: the bucket the objects are in.
+    :param manifest: dict of local file name to s3 object, from build_manifest.
+    :param workspace: the job workspace the files are downloaded into.
+    :param max_workers: how many files to download at once, defaults to S3_DOWNLOAD_WORKERS or 4.
+    :returns stats: number of files and bytes downloaded, time taken and bytes per second.
+    """
+    max_workers = max_workers or int(os.environ.get("S3_DOWNLOAD_WORKERS", 4))
+    config = get_transfer_config()
+
+    def download(local_name, obj):
+        s3_client.download_file(
+            bucket_name, obj['Key'], workspace.path(local_name), Config=config)
+        print(f"Downloaded: {obj['Key']}", file=sys.stderr)
+        return obj.get('Size', 0)
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(download, local_name, obj)
+                   for local_name, obj in manifest.items()]
+        total_bytes = sum(future.result() for future in futures)
+    seconds = time.perf_counter() - start_time
+
+    stats = {
+        "files": len(manifest),
+        "bytes": total_bytes,
+        "seconds": round(seconds, 3),
+        "bytes_per_second": round(total_bytes / seconds) if seconds > 0 else None,
+    }
+    record_transfer("download", total_bytes, seconds)
+    print(f"Downloaded {bucket_name}: {stats}", file=sys.stderr)
+    return stats
+
+
+def upload_fileobj(s3_client, fileobj, bucket_name, key, extra_args=None) -> dict:
+    """
+    Uploads a file object, as S3_PART_CONCURRENCY parts of S3_PART_SIZE at a
+    time once it is bigger than one part. The transfer only returns once S3
+    has acknowledged every part and completed the upload, and raises if it
+    didn't, so there is no need to poll for the object afterwards.
+
+    :param s3_client: the s3 client to use.
+    :param fileobj: a binary file object to read from, it can be a pipe.
+    :param bucket_name: the bucket to upload to.
+    :param key: the key to upload to.
+    :param extra_args: extra arguments for the upload, e.g. {'ACL': 'public-read'}.
+    :returns stats: the key, bytes uploaded, time taken and bytes per second.
+    """
+    uploaded = []
+
+    start_time = time.perf_counter()
+    s3_client.upload_fileobj(
+        fileobj, bucket_name, key, ExtraArgs=extra_args,
+        Callback=uploaded.append, Config=get_transfer_config())
+    seconds = time.perf_counter() - start_time
+
+    total_bytes = sum(uploaded)
+    stats = {
+        "key": key,
+        "bytes": total_bytes,
+        "seconds": round(seconds, 3),
+        "bytes_per_second": round(total_bytes / seconds) if seconds > 0 else None,
+    }
+    record_transfer("upload", total_bytes, seconds)
+    print(f"Uploaded {bucket_name}: {stats}", file=sys.stderr)
+    return stats
+
+
+def upload_command_output(s3_client, command, bucket_name, key, extra_args=None) -> dict:
+    """
+    Runs a command that writes a file to stdout (e.g. ffmpeg with pipe:1 as
+    its output) and uploads the file while the command is still writing it.
+    If the command fails, the partly written object is deleted again.
+
+    :param s3_client: the s3 client to use.
+    :param command: the command to run.
+    :param bucket_name: the bucket to upload to.
+    :param key: the key to upload to.
+    :param extra_args: extra arguments for the upload, e.g. {'ACL': 'public-read'}.
+    :returns stats: the upload stats, see upload_fileobj.
+    """
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        stats = upload_fileobj(s3_client, process.stdout, bucket_name, key, extra_args)
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        process.stdout.close()
+        error = process.stderr.read()
+        process.stderr.close()
+        process.wait()
+
+    if process.returncode != 0:
+        s3_client.delete_object(Bucket=bucket_name, Key=key)
+        raise subprocess.CalledProcessError(process.returncode, command, stderr=error)
+    return stats
@@ -0,0 +1,60 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+
+def get_project_cache_ttl() -> float:
+    """
+    Returns how many seconds serialized project metadata is kept, set with PROJECT_CACHE_TTL_SECONDS.
+    Each API worker has its own cache, so another worker's change can take this long to show.
+    """
+    return float(os.environ.get("PROJECT_CACHE_TTL_SECONDS", 5.0))
+
+
+class TTLCache:
+    """
+    A small in-process cache whose entries expire ttl seconds after being set.
+    Once it holds max_entries, the least recently used entry is dropped.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 256, clock=time.monotonic):
+        """
+        :param ttl: seconds an entry is kept.
+        :param max_entries: how many entries are kept at most.
+        :param clock: function returning the current time in seconds.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the value stored under key, or None if there is none or it has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Drops every entry, e.g. after the data behind them has changed.
+        """
+        with self._lock:
+            self._entries.clear()
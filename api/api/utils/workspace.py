@@ -0,0 +1,67 @@
+import os
+import sys
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+
+def get_workspace_root() -> str:
+    """
+    Returns the folder that job workspaces are created in.
+    Set WORKSPACE_ROOT to point this somewhere fast, e.g. a tmpfs mount.
+    """
+    return os.environ.get("WORKSPACE_ROOT", tempfile.gettempdir())
+
+
+class Workspace:
+    """
+    An isolated scratch folder for a single processing job.
+    All intermediate files of a job are created inside it, so jobs running
+    at the same time never read, overwrite or delete each other's files.
+    """
+
+    def __init__(self, job_name: str = "job", root: str = None):
+        """
+        :param job_name: prefix for the workspace folder name, useful when debugging.
+        :param root: folder to create the workspace in, defaults to get_workspace_root().
+        """
+        root = root or get_workspace_root()
+        os.makedirs(root, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix=f"{job_name}-", dir=root)
+
+    def path(self, file_name: str) -> str:
+        """
+        Returns the path of a file inside this workspace.
+        :param file_name: name of the file, e.g. "camera1.mp4".
+        """
+        return os.path.join(self.directory, file_name)
+
+    def clean(self) -> None:
+        """
+        Deletes the workspace and everything in it.
+        """
+        try:
+            shutil.rmtree(self.directory)
+            print(f"Deleted workspace: {self.directory}", file=sys.stderr)
+        except OSError as e:
+            print(
+                f"Error deleting workspace: {self.directory} - {e}", file=sys.stderr)
+
+    def __repr__(self):
+        return f"<Workspace({self.directory})>"
+
+
+@contextmanager
+def job_workspace(job_name: str = "job", root: str = None):
+    """
+    Creates a workspace for the duration of a job and removes it afterwards,
+    even if the job fails.
+
+    :param job_name: prefix for the workspace folder name.
+    :param root: folder to create the workspace in.
+    """
+    workspace = Workspace(job_name, root)
+    try:
+        yield workspace
+    finally:
+        workspace.clean()
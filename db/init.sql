@@ -1,8 +1,16 @@
+-- Only run on an empty database. Changes to an existing table must also be
+-- added to api/api/models/migrations.py, which updates existing deployments.
 CREATE TABLE projects (
-    project_id   SERIAL PRIMARY KEY,
-    name         VARCHAR(255) NOT NULL,
-    description  TEXT,
-    created_at   TIMESTAMP DEFAULT CURRENT_TIMESTAMP, 
-    last_edited  TIMESTAMP,
-    project_size VARCHAR(10) DEFAULT '0B'
+    project_id         SERIAL PRIMARY KEY,
+    name               VARCHAR(255) NOT NULL,
+    description        TEXT,
+    created_at         TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_edited        TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    project_size       VARCHAR(10) DEFAULT '0B',
+    project_size_bytes BIGINT NOT NULL DEFAULT 0,
+    version_id         INTEGER NOT NULL DEFAULT 1
 );
+
+-- Back the keyset pagination of GET /projects, newest first
+CREATE INDEX projects_last_edited_idx ON projects (last_edited DESC, project_id DESC);
+CREATE INDEX projects_created_at_idx ON projects (created_at DESC, project_id DESC);
@@ -158,6 +158,7 @@ const CreatePodcast: React.FC = () => {
                 },
                 body: JSON.stringify({
                     "size" : sizeConversion(projectSize.current),
+                    "size_bytes" : projectSize.current,
                 }),
             });
                 
@@ -14,6 +14,7 @@ import { OnProgressProps } from "@ehibb/react-player/base";
 
 import axios from "axios";
 import useUpdateLastEdited from "@src/hooks/useUpdateLastEdited";
+import waitForJob, {describeProgress} from "@src/hooks/waitForJob";
 import AWS, { AWSError } from 'aws-sdk';
 import { GetObjectOutput } from "aws-sdk/clients/s3";
 
@@ -54,6 +55,7 @@ const Editor  =  (props: funcProp) => {
     const [projectInfo, setProjectInfo] = useState<ProjectInfo>();
 
     const [videoUrl, setVideoUrl] = useState<string | null>(null);
+    const [jobProgress, setJobProgress] = useState<string>("");
     const [buttonText,setButtonText] = useState("Play");
     const [isPlaying, setIsPlaying] = useState(false);
     const [currentTime,setCurrentTime] = useState<number>(0);
@@ -130,7 +132,8 @@ const Editor  =  (props: funcProp) => {
                     "content-type": "json",
                 },
             });
-            const jsonResponse = response.data;
+            const jsonResponse = await waitForJob(
+                response.data, status => setJobProgress(describeProgress(status)));
             if (jsonResponse.final_output_url){
                 audioMaster(projectID);
             }
@@ -157,7 +160,8 @@ const Editor  =  (props: funcProp) => {
                     "content-type": "json",
                 },
             });
-            const jsonResponse = responseAudioMaster.data;
+            const jsonResponse = await waitForJob(
+                responseAudioMaster.data, status => setJobProgress(describeProgress(status)));
             if (jsonResponse.final_output_url){
                 fetchVideoUrl();
             } else {
@@ -196,6 +200,8 @@ const Editor  =  (props: funcProp) => {
             if (!response.ok) {
                 throw new Error(response.status.toString());
             }
+            // Exporting runs as a job, wait for it to finish before downloading
+            await waitForJob(await response.json());
 
             // Initialise location of project within MinIO
             const params = {
@@ -309,7 +315,8 @@ const Editor  =  (props: funcProp) => {
 
     // Choose whether to render a loading message or the editor page
     if (!projectInfo || !videoUrl) {
-        return <Loading message="Audio Synchronization  of files"/>;
+        return <Loading message={jobProgress ? `Audio Synchronization of files: ${jobProgress}`
+            : "Audio Synchronization  of files"}/>;
     } else {
         return (
             <div className={styles.mainContainer}>
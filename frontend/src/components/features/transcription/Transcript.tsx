@@ -1,6 +1,8 @@
 import {useEffect, useRef, useState, createContext, useContext } from 'react';
 
 import axios from 'axios';
+import waitForJob from "@src/hooks/waitForJob";
+import streamJob from "@src/hooks/streamJob";
 
 import styles from './Transcript.module.css';
 
@@ -93,6 +95,7 @@ const Transcript = (props : TranscriptProps) => {
             const UPLOAD_ENDPOINT = `http://127.0.0.1:5000/get-transcript`;
             const data = {
                 "video_file_path": props.videoUrl,
+                "bucket": bucketName,
                 "temp_folder": "temp_output/",
                 "output_file_name":"out.mp3",
                 "isCompressed":true,
@@ -103,7 +106,16 @@ const Transcript = (props : TranscriptProps) => {
                 },
             });
 
-            const transcriptJSON = await response.data;
+            if (response.data.stream_url) {
+                // Show each segment as soon as it is transcribed, so editing can start early
+                return await streamJob(response.data, (event) => {
+                    if (event.type === "segment") {
+                        setSegment(previous => [...(previous ?? []), event.segment]);
+                        setIsLoading(false);
+                    }
+                });
+            }
+            const transcriptJSON = await waitForJob(response.data);
             const parsed = await JSON.parse(await transcriptJSON);
             const segmentArray = parsed.segments;
             return segmentArray;
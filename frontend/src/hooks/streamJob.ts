@@ -0,0 +1,56 @@
+import {JobStatus} from "@src/hooks/waitForJob";
+
+export interface StreamEvent {
+    type: "segment" | "progress" | "done" | "error";
+    // eslint-disable-next-line @typescript-eslint/no-explicit-any
+    segment?: any;
+    progress?: number;
+    error?: string;
+}
+
+/**
+ * Reads a job's newline delimited JSON stream, handing each event to onEvent as it arrives.
+ *
+ * @param {JobStatus} job - the job returned by the endpoint that queued it, with a stream_url.
+ * @param {Function} onEvent - callback given every event in the stream.
+ * @returns {Promise<any[]>} - resolves with every segment once the stream is done.
+ * @throws {Error} - throws an error if the job failed or the stream ended early.
+ */
+const streamJob = async (job: JobStatus & {stream_url: string}, onEvent: (event: StreamEvent) => void) => {
+    const response = await fetch(job.stream_url);
+    if (!response.ok || response.body === null) {
+        throw new Error(`Could not stream job ${job.job_id}`);
+    }
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    // eslint-disable-next-line @typescript-eslint/no-explicit-any
+    const segments: any[] = [];
+    let buffered = "";
+
+    for (;;) {
+        const {done, value} = await reader.read();
+        if (done) {
+            throw new Error(`Stream of job ${job.job_id} ended early`);
+        }
+        buffered += decoder.decode(value, {stream: true});
+        const lines = buffered.split("\n");
+        // The last line may still be incomplete
+        buffered = lines.pop() ?? "";
+        for (const line of lines) {
+            if (line.trim() === "") {
+                continue;
+            }
+            const event: StreamEvent = JSON.parse(line);
+            onEvent(event);
+            if (event.type === "segment") {
+                segments.push(event.segment);
+            } else if (event.type === "error") {
+                throw new Error(event.error ?? `Job ${job.job_id} failed`);
+            } else if (event.type === "done") {
+                return segments;
+            }
+        }
+    }
+};
+
+export default streamJob;
@@ -0,0 +1,82 @@
+import axios from "axios";
+
+export interface FfmpegProgress {
+    label: string;
+    percent: number | null;
+    out_seconds: number | null;
+    duration: number | null;
+    speed: number | null;
+    eta_seconds: number | null;
+}
+
+export interface JobStatus {
+    job_id: string;
+    kind: string;
+    status: "queued" | "running" | "finished" | "failed";
+    progress: number;
+    // eslint-disable-next-line @typescript-eslint/no-explicit-any
+    result: any;
+    error: string | null;
+    status_url?: string;
+    events_url?: string;
+    stage?: string;
+    // Progress of the ffmpeg run the job is waiting on, if any
+    ffmpeg?: FfmpegProgress;
+}
+
+const POLL_INTERVAL_MS = 2000;
+
+/**
+ * Describes how far through a job is, e.g. "render video 40% (1.5x), about 2m 10s left".
+ *
+ * @param {JobStatus} status - the latest status of the job.
+ * @returns {string} - the description, or "" if there is nothing to show yet.
+ */
+export const describeProgress = (status: JobStatus) => {
+    const ffmpeg = status.ffmpeg;
+    if (!ffmpeg || ffmpeg.percent === null) {
+        return status.stage ?? "";
+    }
+    let description = `${ffmpeg.label} ${Math.round(ffmpeg.percent)}%`;
+    if (ffmpeg.speed) {
+        description += ` (${ffmpeg.speed}x)`;
+    }
+    if (ffmpeg.eta_seconds !== null && ffmpeg.percent < 100) {
+        const minutes = Math.floor(ffmpeg.eta_seconds / 60);
+        const seconds = Math.round(ffmpeg.eta_seconds % 60);
+        description += `, about ${minutes > 0 ? `${minutes}m ` : ""}${seconds}s left`;
+    }
+    return description;
+};
+
+/**
+ * Polls a job queued by the Flask API until it has finished.
+ *
+ * @param {JobStatus} job - the job returned by the endpoint that queued it.
+ * @param {Function} onProgress - optional callback given every status update.
+ * @returns {Promise<any>} - resolves with the result of the job.
+ * @throws {Error} - throws an error if the job failed.
+ */
+const waitForJob = async (job: JobStatus, onProgress?: (status: JobStatus) => void) => {
+    // Results served from the cache come back already finished
+    if (job.status === "finished") {
+        return job.result;
+    }
+    const statusUrl = job.status_url ?? `${process.env.REACT_APP_FLASK_API_DEVELOP}/jobs/${job.job_id}`;
+    for (;;) {
+        const response = await axios.get<JobStatus>(statusUrl);
+        const status = response.data;
+        if (onProgress) {
+            onProgress(status);
+        }
+        if (status.status === "finished") {
+            return status.result;
+        }
+        if (status.status === "failed") {
+            throw new Error(status.error ?? `Job ${job.job_id} failed`);
+        }
+        await new Promise(resolve => setTimeout(resolve, POLL_INTERVAL_MS));
+    }
+};
+
+export default waitForJob;